@@ -33,4 +33,15 @@ __version__ = 0.2
 VERSION = __version__
 
 from .scpi import *
+from .batch import *
+from .aio import *
+from .stats import *
+from .worker import *
+from .pool import *
+from .operation import *
+from .readiness import *
+from .values import *
+from .stream import *
+from .drain import *
+from .sink import *
 from .exceptions import *
@@ -0,0 +1,336 @@
+#
+# aio.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import functools
+
+from .exceptions import *
+from .scpi import MultiLineResponse, load_transport, parse_device, parse_idn
+
+
+__all__ = ['AsyncSCPIDevice']
+
+
+class AsyncSCPIDevice(object):
+    """
+    AsyncSCPIDevice class represents a SCPI device (instrument) driven
+    by asyncio event loop.
+
+    This class mirrors SCPIDevice, but all I/O methods are coroutines,
+    allowing single event loop to drive large number of instruments
+    concurrently. Underlying connection to device is handled by the
+    AsyncSCPITransport class.
+
+    Example:
+
+        async with AsyncSCPIDevice('192.168.42.42:5555') as dev:
+            print(await dev.query('MEAS:VOLT?'))
+    """
+    conn = None
+    encoding = None
+    command_terminator = None
+    verbose = False
+    quirk_no_idn = False
+    quirk_no_opc = False
+    quirk_no_syst_err = False
+    no_opc_delay = 0.25
+    manufacturer = 'Unknown'
+    model = 'Unknown'
+    serial = 'Unknown'
+    firmware = 'Unknown'
+    idn = ''
+    last_error = ''
+
+
+    def __init__(self, device, command_terminator='\n',
+                 idn=True, opc=True, err=True,
+                 encoding='utf-8', transport=None, **args):
+        """
+        Creates an instance of AsyncSCPIDevice to commmunicate with instruments.
+        Connection to device is opened using open() (or async with).
+
+        Options are same as for SCPIDevice.
+        """
+        transport, dev, port = parse_device(device, transport)
+        if transport == 'tcp':
+            self.conn = load_transport('async_tcp').AsyncTCPDevice(dev, port, **args)
+        elif transport == 'serial':
+            self.conn = load_transport('async_serial').AsyncSerialDevice(dev, **args)
+        else:
+            if transport == 'usbtmc':
+                factory = functools.partial(load_transport('usbtmc').USBTMCDevice,
+                                            device, **args)
+            elif transport == 'replay':
+                factory = functools.partial(load_transport('replay').ReplayDevice,
+                                            dev, **args)
+            elif transport == 'hislip':
+                factory = functools.partial(load_transport('hislip').HiSLIPDevice,
+                                            dev, port or 'hislip0', **args)
+            elif transport == 'vxi11':
+                factory = functools.partial(load_transport('vxi11').VXI11Device,
+                                            dev, port or 'inst0', **args)
+            else:
+                factory = functools.partial(load_transport('linux_usbtmc').LinuxUSBTMCDevice,
+                                            dev, **args)
+            self.conn = load_transport('async_thread').AsyncThreadDevice(factory)
+
+        self.device = device
+        self.encoding = encoding
+        self.command_terminator = command_terminator
+        self.quirk_no_idn = not idn
+        self.quirk_no_opc = not opc
+        self.quirk_no_syst_err = not err
+
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def open(self):
+        """
+        Open connection to device and identify the device.
+        """
+        await self.conn.open()
+        await self.conn.flush_input()
+        if (await self.unit_ready() != 1):
+            raise SCPIError("No response (Not SCPI compatible device?): %s" % (self.device))
+
+        if self.quirk_no_idn:
+            return
+
+        res = await self._idn()
+        if res:
+            if self.verbose:
+                print('IDN: %s' % (res))
+            self.idn = res
+            (self.manufacturer, self.model,
+             self.serial, self.firmware) = parse_idn(res)
+        else:
+            raise SCPIError("No response to *IDN? (not SCPI compliant device?): %s" % (self.device))
+        await self._cls()
+
+
+    async def write(self, cmd):
+        """
+        Send an arbitrary string to device. If string is not terminated with a
+        command terminator (default: \\n), it will be added automatically.
+        """
+        if self.verbose:
+            print('%s: write: %s' % (__name__, cmd))
+
+        if not cmd.endswith(self.command_terminator):
+            c = cmd + self.command_terminator
+        else:
+            c = cmd
+        return await self.conn.write(c.encode(self.encoding))
+
+
+    async def write_raw(self, cmd):
+        """
+        Send "raw" data to device. Data is send as is withouth any transformations.
+        """
+        if self.verbose:
+            print('%s: write_raw: %s' % (__name__, cmd))
+
+        return await self.conn.write(cmd)
+
+
+    async def read(self):
+        """
+        Read response string from device. Empty string is returned if
+        device doesnt respond within the timeout set.
+        """
+        buf = await self.conn.read()
+        buf = buf.decode(self.encoding)
+
+        if self.verbose:
+            print('%s: read: %s' % (__name__, buf))
+
+        return buf
+
+
+    async def read_raw(self):
+        """
+        Read raw response from device. This function returns bytes.
+        """
+        buf = await self.conn.read()
+
+        if self.verbose:
+            print('%s: read_raw: %s' % (__name__, buf))
+
+        return buf
+
+
+    async def unit_ready(self, retries=3, delay=0.1):
+        """
+        Wait for unit to be ready by issuing *OPC? command and checking
+        that returned value is "1". See SCPIDevice.unit_ready().
+        """
+        count = 0
+
+        if self.quirk_no_opc:
+            await asyncio.sleep(self.no_opc_delay)
+            return 1
+
+        await self._opc()
+        while (count < retries):
+            r = await self.read()
+            if (r == '1'):
+                return 1
+            count += 1
+            # wait for (late) response before sending *OPC? again
+            if not await self.conn.wait_readable(delay):
+                await self._opc()
+
+        return 0
+
+
+    async def command(self, cmd):
+        """
+        Send a SCPI command to device after waiting device to become ready.
+        If device is not ready SCPIError exception is raised.
+
+        Return value: Response to SYST:ERR? after executing command.
+        """
+        if self.verbose:
+            print('%s: send_command: %s' % (__name__, cmd))
+
+        if not await self.unit_ready():
+            raise SCPIError("Device not ready!")
+
+        await self.write(cmd)
+
+        if self.quirk_no_syst_err:
+            return '0, "No Error"'
+
+        return await self._syst_err()
+
+
+    async def _read_block(self):
+        """
+        Read IEEE 488.2 definite length block (#<n><length><data>).
+        """
+        c = bytearray(1)
+        await self.conn.read_exact_into(c)
+        while c.isspace():
+            await self.conn.read_exact_into(c)
+        if c != b'#':
+            raise SCPIError("Invalid binary block header: %s" % (c))
+        await self.conn.read_exact_into(c)
+        if not c.isdigit() or c == b'0':
+            raise SCPIError("Invalid binary block header: #%s" % (c))
+        length = bytearray(int(c))
+        await self.conn.read_exact_into(length)
+        if not length.isdigit():
+            raise SCPIError("Invalid binary block length: %s" % (length))
+        data = bytearray(int(length))
+        await self.conn.read_exact_into(data)
+        # discard response message terminator
+        await self.conn.read()
+        return data
+
+
+    async def query(self, cmd, multi_line=False, multi_line_wait=100,
+                    lines=None, end=None, opc=False, block=False):
+        """
+        Send a SCPI command to device and wait for response.
+        Before sending command check and wait for device to be ready.
+        If device is not ready SCPIError exception is raised.
+
+        See SCPIDevice.query() for the multi-line response options.
+
+        Return value: Response from unit to the command.
+        """
+        if self.verbose:
+            print('%s: send_query: %s' % (__name__, cmd))
+
+        if not await self.unit_ready():
+            raise SCPIError("Device not ready!")
+
+        if opc:
+            cmd = cmd.rstrip(self.command_terminator) + ';*OPC?'
+        await self.write(cmd)
+
+        if block:
+            resp = (await self._read_block()).decode(self.encoding)
+        else:
+            resp = await self.read()
+            m = MultiLineResponse(lines=lines, end=end, opc=opc)
+            if multi_line or m.deterministic:
+                m.add(resp, opc and await self.conn.wait_readable(0))
+                while not m.complete:
+                    if m.deterministic:
+                        next = await self.read()
+                        if len(next) == 0 and not await self.conn.wait_readable(0):
+                            raise SCPIError("Incomplete multi-line response: %s"
+                                            % (m.text()))
+                    elif await self.conn.wait_readable(multi_line_wait / 1000):
+                        next = await self.read()
+                        if len(next) == 0:
+                            continue
+                    else:
+                        break
+                    m.add(next, opc and await self.conn.wait_readable(0))
+                resp = m.text()
+
+        if self.verbose:
+            print("%s: response: '%s'" % (__name__, resp))
+
+        if not self.quirk_no_syst_err:
+            await self._syst_err()
+
+        return resp
+
+
+    async def flush_input(self):
+        """
+        Flush input buffer.
+        """
+        await self.conn.flush_input()
+
+
+    async def close(self):
+        """
+        Close connection to device.
+        """
+        await self.conn.close()
+
+
+    # SCPI standard commands (possible of override by subclassing...)
+
+    async def _syst_err(self):
+        await self.write('SYST:ERR?')
+        self.last_error = await self.read()
+        return self.last_error
+
+    async def _idn(self):
+        return await self.query('*IDN?')
+
+    async def _cls(self):
+        return await self.write('*CLS')
+
+    async def _opc(self):
+        return await self.write('*OPC?')
@@ -0,0 +1,296 @@
+#
+# batch.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import re
+
+from .exceptions import *
+
+
+__all__ = ['SCPIBatch', 'SCPIResult', 'split_responses']
+
+ERROR_RE = re.compile(r'^[+-]?\d+\s*,')
+
+
+def split_responses(line):
+    """
+    Split response message into response message units (separated by ';').
+    Semicolons inside quoted strings are ignored.
+    """
+    res = []
+    quote = None
+    start = 0
+    for i, c in enumerate(line):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c == '"' or c == "'":
+            quote = c
+        elif c == ';':
+            res.append(line[start:i].strip())
+            start = i + 1
+    res.append(line[start:].strip())
+    return res
+
+
+def root_path(cmd):
+    """
+    Return program message unit with header anchored to the root (':' prefix),
+    so it is not resolved against the previous unit's header path when
+    units are joined with ';'. Common commands (*XXX) are returned as is.
+    """
+    if cmd.startswith(':') or cmd.startswith('*'):
+        return cmd
+    return ':' + cmd
+
+
+def error_code(err):
+    """
+    Return numeric error code from SYST:ERR? response.
+    """
+    try:
+        return int(err.split(',', 1)[0])
+    except ValueError:
+        return None
+
+
+class SCPIResult(object):
+    """
+    SCPIResult is a future-like handle for a command or query queued
+    in SCPIBatch. Result is available after the batch has been run.
+    """
+
+    def __init__(self, cmd, is_query):
+        self.cmd = cmd
+        self.is_query = is_query
+        self.response = None
+        self.error = None
+        self._done = False
+
+
+    def __repr__(self):
+        return '<SCPIResult %s: %s>' % (self.cmd, self.response if self._done else 'pending')
+
+
+    def done(self):
+        """
+        Return True if result is available.
+        """
+        return self._done
+
+
+    def result(self):
+        """
+        Return response to the query (or response to SYST:ERR?
+        for commands). SCPIError is raised if no response was received.
+        """
+        if not self._done:
+            raise SCPIError("No response received for: %s" % (self.cmd))
+        if self.is_query:
+            return self.response
+        return self.error
+
+
+    def _set(self, response=None, error=None):
+        if self.is_query:
+            self.response = response
+        self.error = error
+        self._done = True
+
+
+
+class SCPIBatch(object):
+    """
+    SCPIBatch queues commands and queries and sends them to the device
+    pipelined as ';' separated program messages, sized to what the
+    transport can handle (SCPITransport.MAX_MESSAGE_SIZE). Each program
+    message unit is anchored to the root (':'), so the queued commands
+    are not resolved against the previous command's subsystem.
+
+    SYST:ERR? is appended after each command (within the same program
+    message) so errors can be mapped back to the command that caused them,
+    and readiness is checked only once using *OPC? at the end of the batch.
+    Finally any remaining errors are drained from the error queue.
+
+    Batch is normally used as a context manager (see SCPIDevice.batch()):
+
+        with dev.batch() as b:
+            b.command('VOLT 5')
+            v = b.query('MEAS:VOLT?')
+        print(v.result())
+    """
+
+    def __init__(self, device, max_size=None):
+        """
+        Create new batch for SCPIDevice.
+
+        :device: SCPIDevice to run the batch on.
+        :max_size: maximum program message size (in bytes)
+                   [Default: transport specific]
+        """
+        self.device = device
+        self.max_size = max_size or device.conn.MAX_MESSAGE_SIZE
+        self.results = []
+        self.errors = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+
+
+    def command(self, cmd):
+        """
+        Queue a SCPI command. Returns SCPIResult handle.
+        """
+        res = SCPIResult(cmd.strip(), False)
+        self.results.append(res)
+        return res
+
+
+    def query(self, cmd):
+        """
+        Queue a SCPI query. Returns SCPIResult handle.
+        """
+        res = SCPIResult(cmd.strip(), True)
+        self.results.append(res)
+        return res
+
+
+    def _messages(self):
+        """
+        Group queued commands into program messages.
+        Returns list of (message, [(SCPIResult, response count), ...]).
+        """
+        dev = self.device
+        check_err = not dev.quirk_no_syst_err
+        messages = []
+        units = []
+        size = 0
+
+        for res in self.results:
+            parts = [root_path(res.cmd)]
+            if check_err:
+                parts.append(':SYST:ERR?')
+            unit = ';'.join(parts)
+            count = int(res.is_query) + int(check_err)
+            length = len(unit.encode(dev.encoding)) + 1
+            if units and size + length > self.max_size:
+                messages.append(units)
+                units = []
+                size = 0
+            units.append((unit, res, count))
+            size += length
+
+        if not dev.quirk_no_opc:
+            if units and size + len('*OPC?') + 1 > self.max_size:
+                messages.append(units)
+                units = []
+            units.append(('*OPC?', None, 1))
+        if units:
+            messages.append(units)
+
+        return messages
+
+
+    def _read_responses(self, count):
+        """
+        Read response message (and any additional response lines already
+        received from non-compliant devices) split into response units.
+        """
+        dev = self.device
+        resp = []
+        while len(resp) < count:
+            line = dev.read()
+            if len(line) == 0:
+                break
+            resp.extend(split_responses(line))
+            if dev.conn.pipelined or dev.conn.pending_input() < 1:
+                # (pipelined transports frame each response message)
+                break
+        return resp
+
+
+    def run(self):
+        """
+        Send queued commands/queries to the device and read back the responses.
+
+        Return value: list of errors [(command, SYST:ERR? response), ...].
+        """
+        dev = self.device
+        w = dev.worker
+        if w and not w.in_worker():
+            return w.submit(self.run).result()
+        opc = None
+        messages = self._messages()
+        pipelined = dev.conn.pipelined and len(messages) > 1
+        if pipelined:
+            # send all messages before reading any responses
+            for units in messages:
+                dev.write(';'.join([u[0] for u in units]))
+
+        for units in messages:
+            if not pipelined:
+                dev.write(';'.join([u[0] for u in units]))
+            count = sum([u[2] for u in units])
+            resp = self._read_responses(count)
+            if dev.verbose:
+                print('%s: batch: %d responses (expected %d)' % (__name__, len(resp), count))
+            missing = count - len(resp)
+            for unit, res, n in units:
+                if len(resp) < 1:
+                    break
+                if res is None:
+                    opc = resp.pop(0)
+                    continue
+                if (missing > 0 and n > 1 and ERROR_RE.match(resp[0])
+                        and error_code(resp[0]) != 0):
+                    # failed query that didn't produce a response
+                    missing -= 1
+                    res._set(None, resp.pop(0))
+                    self.errors.append((res.cmd, res.error))
+                    continue
+                if len(resp) < n:
+                    break
+                response = resp.pop(0) if res.is_query else None
+                error = resp.pop(0) if n > int(res.is_query) else None
+                res._set(response, error)
+                if error is not None and error_code(error) != 0:
+                    self.errors.append((res.cmd, error))
+
+        if not dev.quirk_no_syst_err:
+            while True:
+                err = dev._syst_err()
+                if not err or error_code(err) in (0, None):
+                    break
+                self.errors.append((None, err))
+            if self.errors:
+                dev.last_error = self.errors[-1][1]
+
+        self.results = []
+
+        if not dev.quirk_no_opc and opc != '1':
+            raise SCPIError("Device not ready after batch!")
+
+        return self.errors
@@ -0,0 +1,80 @@
+#
+# __main__.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import argparse
+
+from .benchmarks import *
+
+
+def print_result(res):
+    line = '%-20s %-7s %6d x %10.3f s' % (res['name'], res['transport'], res['count'],
+                                           res['seconds'])
+    if 'ops_per_sec' in res:
+        line += ' %10.1f ops/s' % (res['ops_per_sec'])
+    if 'mean' in res:
+        line += ' mean %.3f ms, p50 %.3f ms, p99 %.3f ms' % (
+            res['mean'] * 1e3, res['p50'] * 1e3, res['p99'] * 1e3)
+    if 'mb_per_sec' in res:
+        line += ' %8.2f MB/s' % (res['mb_per_sec'])
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m scpi_lite.bench',
+                                     description='scpi_lite benchmarks')
+    parser.add_argument('--transports', default=','.join(TRANSPORTS),
+                        help='comma separated list of transports to benchmark '
+                        '[Default: %s]' % (','.join(TRANSPORTS)))
+    parser.add_argument('--count', type=int, default=100,
+                        help='number of iterations [Default: 100]')
+    parser.add_argument('--size', type=int, default=4*1024*1024,
+                        help='bulk read size in bytes [Default: 4194304]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated response latency in seconds [Default: 0]')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='fragment responses to chunks of this size [Default: 0]')
+    parser.add_argument('--chunk-delay', type=float, default=0.0,
+                        help='delay between response fragments in seconds [Default: 0]')
+    parser.add_argument('--instruments', type=int, default=10,
+                        help='number of simulated instruments in concurrency '
+                        'benchmarks (0 = skip) [Default: 10]')
+    parser.add_argument('--output', '-o', help='save results to JSON file')
+    parser.add_argument('--compare', '-c', help='compare results to earlier results (JSON file)')
+    args = parser.parse_args()
+
+    results = run_suite(transports=[t.strip() for t in args.transports.split(',') if t.strip()],
+                        count=args.count, size=args.size, latency=args.latency,
+                        chunk_size=args.chunk_size, chunk_delay=args.chunk_delay,
+                        instruments=args.instruments, callback=print_result)
+
+    if args.output:
+        save_results(results, args.output)
+
+    if args.compare:
+        print('\nComparison to: %s' % (args.compare))
+        for name, transport, metric, old, new, speedup in compare_results(
+                load_results(args.compare), results):
+            print('%-20s %-7s %-12s %12.6g -> %12.6g  (%.2fx)'
+                  % (name, transport, metric, old, new, speedup or 0))
+
+
+if __name__ == '__main__':
+    main()
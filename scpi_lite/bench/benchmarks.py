@@ -0,0 +1,392 @@
+#
+# benchmarks.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import json
+import platform
+import threading
+import time
+
+from .. import __version__
+from ..scpi import SCPIDevice, block_header
+from .instruments import *
+
+
+__all__ = ['TRANSPORTS', 'ascii_trace', 'simulated_instrument', 'bench_handshake',
+           'bench_query_latency', 'bench_command_throughput', 'bench_ascii_read',
+           'bench_bulk_read', 'bench_threaded_query', 'bench_async_query',
+           'run_suite', 'save_results', 'load_results', 'compare_results']
+
+TRANSPORTS = ('tcp', 'serial', 'usbtmc', 'hislip', 'vxi11')
+
+# metrics where bigger value is better
+HIGHER_IS_BETTER = ('ops_per_sec', 'mb_per_sec')
+LOWER_IS_BETTER = ('mean', 'p50', 'p99')
+
+
+def ascii_trace(size):
+    """
+    Generate comma separated ASCII trace data of (approximately) given size.
+    """
+    count = max(1, size // 14)
+    return ','.join(['%+.6E' % (i * 0.001) for i in range(count)]).encode('ascii')
+
+
+def simulated_instrument(transport, responses=None, **args):
+    """
+    Create (but don't start) simulated instrument for given transport
+    ('tcp', 'serial', 'usbtmc', 'hislip', or 'vxi11').
+    Returns tuple: (instrument, function returning SCPIDevice arguments).
+    """
+    default = {'MEAS:VOLT?': '+1.23456789E+00', 'VOLT': lambda cmd: None}
+    if responses:
+        default.update(responses)
+
+    if transport == 'tcp':
+        inst = TCPInstrument(responses=default, **args)
+        return (inst, lambda: ((inst.device,), {'timeout': 5}))
+    elif transport == 'serial':
+        inst = PTYInstrument(responses=default, **args)
+        return (inst, lambda: ((inst.device,), {'timeout': 5, 'baudrate': 921600}))
+    elif transport == 'usbtmc':
+        inst = USBTMCInstrument(responses=default, **args)
+        return (inst, lambda: ((inst.device,), {'transport': 'linux_usbtmc'}))
+    elif transport == 'hislip':
+        inst = HiSLIPInstrument(responses=default, **args)
+        return (inst, lambda: ((inst.device,), {'timeout': 5}))
+    elif transport == 'vxi11':
+        inst = VXI11Instrument(responses=default, **args)
+        return (inst, lambda: ((inst.device,), {'timeout': 5, 'pmap_port': inst.pmap_port}))
+    raise ValueError('Unknown transport: %s' % (transport))
+
+
+def _latencies(name, transport, samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    count = len(samples)
+    return {
+        'name': name,
+        'transport': transport,
+        'count': count,
+        'seconds': total,
+        'ops_per_sec': count / total,
+        'mean': total / count,
+        'p50': samples[count // 2],
+        'p99': samples[min(count - 1, int(count * 0.99))],
+    }
+
+
+def bench_handshake(transport='tcp', count=20, **args):
+    """
+    Measure SCPIDevice construction (connect and handshake) time.
+    """
+    inst, dev_args = simulated_instrument(transport, **args)
+    samples = []
+    with inst:
+        a, kw = dev_args()
+        for i in range(count):
+            start = time.perf_counter()
+            dev = SCPIDevice(*a, **kw)
+            samples.append(time.perf_counter() - start)
+            dev.close()
+    return _latencies('handshake', transport, samples)
+
+
+def bench_query_latency(transport='tcp', count=200, **args):
+    """
+    Measure SCPIDevice.query() round-trip latency.
+    """
+    inst, dev_args = simulated_instrument(transport, **args)
+    samples = []
+    with inst:
+        a, kw = dev_args()
+        dev = SCPIDevice(*a, **kw)
+        try:
+            for i in range(count):
+                start = time.perf_counter()
+                dev.query('MEAS:VOLT?')
+                samples.append(time.perf_counter() - start)
+        finally:
+            dev.close()
+    return _latencies('query_latency', transport, samples)
+
+
+def bench_command_throughput(transport='tcp', count=200, **args):
+    """
+    Measure small command (SCPIDevice.command()) throughput.
+    """
+    inst, dev_args = simulated_instrument(transport, **args)
+    with inst:
+        a, kw = dev_args()
+        dev = SCPIDevice(*a, **kw)
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                dev.command('VOLT %d' % (i))
+            elapsed = time.perf_counter() - start
+        finally:
+            dev.close()
+    return {
+        'name': 'command_throughput',
+        'transport': transport,
+        'count': count,
+        'seconds': elapsed,
+        'ops_per_sec': count / elapsed,
+    }
+
+
+def bench_ascii_read(transport='tcp', size=20000, count=50, **args):
+    """
+    Measure ASCII response read throughput (:size: bytes response).
+    """
+    if transport == 'usbtmc':
+        size = min(size, USBTMCInstrument.MAX_MESSAGE)
+    data = ascii_trace(size)
+    inst, dev_args = simulated_instrument(transport, responses={'TRAC:DATA?': data},
+                                          **args)
+    with inst:
+        a, kw = dev_args()
+        dev = SCPIDevice(*a, **kw)
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                dev.write('TRAC:DATA?')
+                r = dev.conn.read()
+                if len(r) != len(data):
+                    raise RuntimeError('Short read: %d (expected %d)' % (len(r), len(data)))
+            elapsed = time.perf_counter() - start
+        finally:
+            dev.close()
+    return {
+        'name': 'ascii_read',
+        'transport': transport,
+        'size': len(data),
+        'count': count,
+        'seconds': elapsed,
+        'ops_per_sec': count / elapsed,
+        'mb_per_sec': len(data) * count / elapsed / 1e6,
+    }
+
+
+def bench_bulk_read(transport='tcp', size=4*1024*1024, count=5, **args):
+    """
+    Measure bulk (IEEE 488.2 binary block) read throughput.
+    """
+    data = block_header(size) + bytes(size)
+    inst, dev_args = simulated_instrument(transport, responses={'WAV:DATA?': data},
+                                          **args)
+    with inst:
+        a, kw = dev_args()
+        dev = SCPIDevice(*a, **kw)
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                r = dev.query_binary('WAV:DATA?')
+                if len(r) != size:
+                    raise RuntimeError('Short read: %d (expected %d)' % (len(r), size))
+            elapsed = time.perf_counter() - start
+        finally:
+            dev.close()
+    return {
+        'name': 'bulk_read',
+        'transport': transport,
+        'size': size,
+        'count': count,
+        'seconds': elapsed,
+        'ops_per_sec': count / elapsed,
+        'mb_per_sec': size * count / elapsed / 1e6,
+    }
+
+
+def _start_instruments(count, latency):
+    insts = []
+    for i in range(count):
+        inst = TCPInstrument(responses={'MEAS:VOLT?': '+1.23456789E+00'},
+                             latency=latency)
+        inst.start()
+        insts.append(inst)
+    return insts
+
+
+def bench_threaded_query(instruments=10, count=100, latency=0.001):
+    """
+    Measure aggregate SCPIDevice.query() throughput using one thread per
+    (simulated) instrument.
+    """
+    insts = _start_instruments(instruments, latency)
+    try:
+        devs = [SCPIDevice(inst.device, timeout=5) for inst in insts]
+
+        def worker(dev):
+            for i in range(count):
+                dev.query('MEAS:VOLT?')
+
+        threads = [threading.Thread(target=worker, args=(dev,)) for dev in devs]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        for dev in devs:
+            dev.close()
+    finally:
+        for inst in insts:
+            inst.stop()
+
+    return {
+        'name': 'threaded_query',
+        'transport': 'tcp',
+        'instruments': instruments,
+        'count': count * instruments,
+        'seconds': elapsed,
+        'ops_per_sec': count * instruments / elapsed,
+    }
+
+
+def bench_async_query(instruments=10, count=100, latency=0.001):
+    """
+    Measure aggregate AsyncSCPIDevice.query() throughput with all
+    (simulated) instruments driven from a single event loop.
+    """
+    from ..aio import AsyncSCPIDevice
+
+    async def worker(dev):
+        for i in range(count):
+            await dev.query('MEAS:VOLT?')
+
+    async def run(insts):
+        devs = [AsyncSCPIDevice(inst.device, timeout=5) for inst in insts]
+        await asyncio.gather(*[dev.open() for dev in devs])
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(dev) for dev in devs])
+        elapsed = time.perf_counter() - start
+        for dev in devs:
+            await dev.close()
+        return elapsed
+
+    insts = _start_instruments(instruments, latency)
+    try:
+        elapsed = asyncio.run(run(insts))
+    finally:
+        for inst in insts:
+            inst.stop()
+
+    return {
+        'name': 'async_query',
+        'transport': 'tcp',
+        'instruments': instruments,
+        'count': count * instruments,
+        'seconds': elapsed,
+        'ops_per_sec': count * instruments / elapsed,
+    }
+
+
+def run_suite(transports=TRANSPORTS, count=100, size=4*1024*1024, latency=0.0,
+              chunk_size=0, chunk_delay=0.0, instruments=10, callback=None):
+    """
+    Run benchmark suite against simulated instruments.
+
+    :transports: list of transports to benchmark ('tcp', 'serial', 'usbtmc')
+    :count: number of iterations [Default: 100]
+    :size: bulk read size (bytes) [Default: 4MB]
+    :latency: simulated instrument response latency (seconds) [Default: 0]
+    :chunk_size: fragment responses to chunks of this size [Default: 0]
+    :chunk_delay: delay between response fragments (seconds) [Default: 0]
+    :instruments: number of instruments in concurrency benchmarks [Default: 10]
+    :callback: function called with each benchmark result
+
+    Returns results as a dictionary.
+    """
+    args = {'latency': latency, 'chunk_size': chunk_size, 'chunk_delay': chunk_delay}
+    results = []
+
+    def add(res):
+        results.append(res)
+        if callback:
+            callback(res)
+
+    for transport in transports:
+        add(bench_handshake(transport, count=max(1, count // 5), **args))
+        add(bench_query_latency(transport, count=count, **args))
+        add(bench_command_throughput(transport, count=count, **args))
+        add(bench_ascii_read(transport, count=max(1, count // 2), **args))
+        add(bench_bulk_read(transport, size=size, count=max(1, count // 20), **args))
+
+    if instruments > 0:
+        add(bench_threaded_query(instruments=instruments, count=count,
+                                 latency=latency or 0.001))
+        add(bench_async_query(instruments=instruments, count=count,
+                              latency=latency or 0.001))
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': dict(args, count=count, size=size, instruments=instruments,
+                           transports=list(transports)),
+        'results': results,
+    }
+
+
+def save_results(results, filename):
+    """
+    Save benchmark results to a JSON file.
+    """
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(filename):
+    """
+    Load benchmark results from a JSON file.
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def compare_results(old, new):
+    """
+    Compare two sets of benchmark results.
+
+    Returns list of tuples: (name, transport, metric, old value, new value,
+    speedup), where speedup > 1.0 means new result is better.
+    """
+    prev = {}
+    for res in old['results']:
+        prev[(res['name'], res['transport'])] = res
+
+    comparison = []
+    for res in new['results']:
+        o = prev.get((res['name'], res['transport']))
+        if o is None:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if metric not in res or not o.get(metric):
+                continue
+            if metric in HIGHER_IS_BETTER:
+                speedup = res[metric] / o[metric]
+            else:
+                speedup = o[metric] / res[metric] if res[metric] else None
+            comparison.append((res['name'], res['transport'], metric,
+                               o[metric], res[metric], speedup))
+    return comparison
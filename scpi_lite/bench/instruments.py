@@ -0,0 +1,799 @@
+#
+# instruments.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import pty
+import re
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+
+from .. import __version__
+from ..transports import hislip
+from ..transports import vxi11
+
+
+__all__ = ['SimulatedInstrument', 'PTYInstrument', 'TCPInstrument',
+           'USBTMCInstrument', 'HiSLIPInstrument', 'VXI11Instrument']
+
+PARSE_RE = re.compile(rb'[\n;#]')
+
+
+class SimulatedInstrument(object):
+    """
+    Base class for simulated (stand-in) instruments used by benchmarks.
+
+    Simulated instrument understands *IDN?, *OPC?, *CLS and SYST:ERR?
+    and any additional queries given in :responses: (keyed by the command
+    header). Unknown queries are reported through the error queue just like
+    a real instrument would do.
+
+    Status reporting (*ESE, *SRE, *ESR?, *STB?, *OPC) is simulated too,
+    with overlapped commands given in :operations: (command header:
+    duration in seconds).
+
+    Headers in compound program messages are resolved like on a real
+    instrument: a header not starting with ':' (or '*') continues from the
+    previous command's header path.
+
+    Subclasses implement the actual I/O (pty, socket, ...) and call feed()
+    for the received data and send() for the responses.
+    """
+
+    idn = 'SCPI-Lite,Simulated Instrument,0,%s' % (__version__)
+    device = None
+
+    def __init__(self, responses=None, latency=0.0, chunk_size=0,
+                 chunk_delay=0.0, terminator=b'\n', operations=None):
+        """
+        Create simulated instrument.
+
+        :responses: dictionary of query responses (str, bytes, or callable
+                    that gets the received command as argument).
+        :latency: delay before sending response (in seconds) [Default: 0]
+        :chunk_size: send responses in chunks of this size (0 = no chunking)
+        :chunk_delay: delay between response chunks (in seconds) [Default: 0]
+        :terminator: response terminator [Default: \\n]
+        :operations: overlapped commands (dictionary of command header:
+                     duration in seconds). [Default: None]
+        """
+        self.responses = {
+            '*IDN?': self.idn,
+            '*OPC?': self._opc_query,
+            '*OPC': self._opc,
+            'SYST:ERR?': self._syst_err,
+            '*CLS': self._cls,
+            '*ESE': self._ese,
+            '*SRE': self._sre,
+            '*ESR?': self._esr_query,
+            '*STB?': self._stb_query,
+        }
+        for key, val in (operations or {}).items():
+            self.responses[key.upper()] = (lambda cmd, t=val: self._start_operation(t))
+        if responses:
+            for key, val in responses.items():
+                self.responses[key.upper()] = val
+        self.esr = 0
+        self.ese = 0
+        self.sre = 0
+        self.busy_until = 0.0
+        self.opc_pending = False
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.terminator = terminator
+        self.errors = []
+        self.commands = 0
+        self.inbuf = bytearray()
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+    def start(self):
+        """
+        Start instrument (I/O thread).
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Stop instrument (I/O thread).
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+    def _run(self):
+        raise NotImplementedError()
+
+
+    def _syst_err(self, cmd):
+        if self.errors:
+            return self.errors.pop(0)
+        return '0,"No error"'
+
+
+    def _cls(self, cmd):
+        self.errors = []
+        self.esr = 0
+        self.opc_pending = False
+
+
+    def _start_operation(self, duration):
+        self.busy_until = max(self.busy_until, time.monotonic() + duration)
+
+
+    def _update_esr(self):
+        if self.opc_pending and time.monotonic() >= self.busy_until:
+            self.esr |= 0x01
+            self.opc_pending = False
+
+
+    def _opc(self, cmd):
+        self.opc_pending = True
+
+
+    def _opc_query(self, cmd):
+        delay = self.busy_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return '1'
+
+
+    def _ese(self, cmd):
+        self.ese = int(cmd.split()[1])
+
+
+    def _sre(self, cmd):
+        self.sre = int(cmd.split()[1])
+
+
+    def _esr_query(self, cmd):
+        self._update_esr()
+        r = self.esr
+        self.esr = 0
+        return str(r)
+
+
+    def status_byte(self):
+        """
+        Return current status byte.
+        """
+        self._update_esr()
+        stb = 0x04 if self.errors else 0
+        if self.esr & self.ese:
+            stb |= 0x20
+        if stb & self.sre:
+            stb |= 0x40
+        return stb
+
+
+    def _stb_query(self, cmd):
+        return str(self.status_byte())
+
+
+    def resolve_header(self, cmd, path=''):
+        """
+        Return (upper case) header of the command, relative header is
+        resolved against :path: (header path of the previous command in
+        the same program message).
+        """
+        header = cmd.split(None, 1)[0].decode('ascii', 'replace').upper()
+        if header.startswith(':'):
+            return header[1:]
+        if path and not header.startswith('*'):
+            return path + ':' + header
+        return header
+
+
+    def execute(self, cmd, header=None):
+        """
+        Execute single command, returns response (bytes) or None.
+        """
+        self.commands += 1
+        if header is None:
+            header = self.resolve_header(cmd)
+        r = self.responses.get(header)
+        if r is None:
+            if header not in self.responses:
+                self.errors.append('-113,"Undefined header;%s"' % (header))
+            return None
+        if callable(r):
+            r = r(cmd)
+        if isinstance(r, str):
+            r = r.encode('ascii')
+        return r
+
+
+    def _parse(self):
+        """
+        Parse next complete program message from the input buffer.
+        Returns list of commands in the message (or None if there is no
+        complete message available). Binary block arguments
+        (#<n><length><data>) are allowed in the commands.
+        """
+        buf = self.inbuf
+        cmds = []
+        start = pos = 0
+        while True:
+            m = PARSE_RE.search(buf, pos)
+            if not m:
+                return None
+            pos = m.start()
+            c = buf[pos]
+            if c == 0x23:
+                # '#': skip over binary block
+                if pos + 2 > len(buf):
+                    return None
+                n = buf[pos + 1] - 0x30
+                if n < 1 or n > 9:
+                    pos += 1
+                    continue
+                if pos + 2 + n > len(buf):
+                    return None
+                pos += 2 + n + int(buf[pos + 2:pos + 2 + n])
+                continue
+            cmds.append(bytes(buf[start:pos]))
+            pos += 1
+            start = pos
+            if c == 0x0a:
+                del buf[:pos]
+                return cmds
+
+
+    def feed(self, data):
+        """
+        Process received data, returns response to be sent (or None).
+        """
+        self.inbuf.extend(data)
+        out = bytearray()
+        while True:
+            cmds = self._parse()
+            if cmds is None:
+                break
+            resp = []
+            path = ''
+            for cmd in cmds:
+                cmd = cmd.strip()
+                if not cmd:
+                    continue
+                header = self.resolve_header(cmd, path)
+                r = self.execute(cmd, header)
+                if not header.startswith('*'):
+                    path = header.rpartition(':')[0]
+                if r is not None:
+                    resp.append(r)
+            if resp:
+                out += b';'.join(resp) + self.terminator
+        if not out:
+            return None
+        return bytes(out)
+
+
+    def send(self, write, data):
+        """
+        Send response using given write function, simulating response
+        latency and fragmentation.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        view = memoryview(data)
+        chunk = self.chunk_size if self.chunk_size > 0 else len(view)
+        while len(view) > 0:
+            n = write(view[:chunk])
+            view = view[n:]
+            if self.chunk_delay and len(view) > 0:
+                time.sleep(self.chunk_delay)
+
+
+
+class PTYInstrument(SimulatedInstrument):
+    """
+    Simulated instrument connected to a pseudo terminal (pty) pair.
+
+    SerialDevice can be connected to the device name found in
+    :device: attribute after the instrument has been started.
+    """
+
+    def start(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        super().start()
+
+
+    def stop(self):
+        super().stop()
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+    def _write(self, data):
+        while not self._stop.is_set():
+            r, w, x = select.select([], [self.master], [], 0.05)
+            if w:
+                return os.write(self.master, data)
+        raise OSError('Instrument stopped')
+
+
+    def _run(self):
+        while not self._stop.is_set():
+            r, w, x = select.select([self.master], [], [], 0.05)
+            if not r:
+                continue
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                break
+            resp = self.feed(data)
+            if resp:
+                try:
+                    self.send(self._write, resp)
+                except OSError:
+                    break
+
+
+
+class USBTMCInstrument(PTYInstrument):
+    """
+    Simulated USBTMC instrument (stand-in for /dev/usbtmc* character device)
+    using a pseudo terminal (pty) pair.
+
+    LinuxUSBTMCDevice can be opened using the device name found in :device:
+    attribute (use transport='linux_usbtmc' with SCPIDevice). USBTMC is
+    message based, so responses are always written as a single message
+    and :chunk_size: is ignored. A pty can deliver at most MAX_MESSAGE
+    bytes in a single read, so (non block) responses must not be longer.
+    """
+
+    MAX_MESSAGE = 1024
+
+    def send(self, write, data):
+        if self.latency:
+            time.sleep(self.latency)
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[write(view):]
+
+
+
+class TCPInstrument(SimulatedInstrument):
+    """
+    Simulated instrument listening on a local TCP port.
+
+    TCPDevice (SCPIDevice) can be connected using the connection string
+    found in :device: attribute after the instrument has been started.
+    Responses can be fragmented to multiple TCP segments using
+    :chunk_size: and :chunk_delay: options.
+    """
+
+    host = '127.0.0.1'
+    port = 0
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(4)
+        self.port = self.sock.getsockname()[1]
+        self.device = '%s:%d' % (self.host, self.port)
+        super().start()
+
+
+    def stop(self):
+        super().stop()
+        self.sock.close()
+
+
+    def _serve(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.inbuf.clear()
+        while not self._stop.is_set():
+            r, w, x = select.select([conn], [], [], 0.05)
+            if not r:
+                continue
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            resp = self.feed(data)
+            if resp:
+                try:
+                    self.send(conn.send, resp)
+                except OSError:
+                    break
+
+
+    def _run(self):
+        while not self._stop.is_set():
+            r, w, x = select.select([self.sock], [], [], 0.05)
+            if not r:
+                continue
+            conn, addr = self.sock.accept()
+            try:
+                self._serve(conn)
+            finally:
+                conn.close()
+
+
+
+class HiSLIPInstrument(TCPInstrument):
+    """
+    Simulated HiSLIP instrument (server) listening on a local TCP port.
+
+    HiSLIPDevice (SCPIDevice) can be connected using the VISA resource
+    string found in :device: attribute after the instrument has been
+    started. Synchronous and asynchronous channels, overlapped and
+    synchronized modes, device clear, status queries, and service requests
+    (sent when status byte RQS bit gets set) are simulated. Responses can
+    be fragmented to multiple Data messages using :chunk_size:.
+    """
+
+    def __init__(self, overlapped=True, max_message_size=1024*1024, **args):
+        """
+        :overlapped: use overlapped mode by default [Default: True]
+        :max_message_size: maximum message size accepted [Default: 1MB]
+
+        See SimulatedInstrument for the other options.
+        """
+        super().__init__(**args)
+        self.overlapped = overlapped
+        self.max_message_size = max_message_size
+        self.session_id = 0
+
+
+    def start(self):
+        super().start()
+        self.device = 'TCPIP::%s::hislip0,%d::INSTR' % (self.host, self.port)
+
+
+    def _send_response(self, conn, message_id, data):
+        if self.latency:
+            time.sleep(self.latency)
+        view = memoryview(data)
+        chunk = self.chunk_size if self.chunk_size > 0 else len(view)
+        while True:
+            part = view[:chunk]
+            view = view[len(part):]
+            hislip.send_message(conn, hislip.DATA if len(view) > 0 else hislip.DATA_END,
+                                0, message_id, part)
+            if len(view) == 0:
+                break
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+
+
+    def _sync_message(self, conn, mtype, control, param, payload):
+        if mtype in (hislip.DATA, hislip.DATA_END):
+            if len(payload) > self.max_message_size:
+                hislip.send_message(conn, hislip.ERROR, 4, 0, b'Message too large')
+                return
+            self.message_id = param
+            if mtype == hislip.DATA:
+                self.inbuf.extend(payload)
+                return
+            if not payload.endswith(b'\n'):
+                payload += b'\n'
+            resp = self.feed(payload)
+            if resp:
+                self._send_response(conn, param, resp)
+        elif mtype == hislip.DEVICE_CLEAR_COMPLETE:
+            self.inbuf.clear()
+            self.overlapped = (control & 0x01) != 0
+            hislip.send_message(conn, hislip.DEVICE_CLEAR_ACKNOWLEDGE, int(self.overlapped))
+        elif mtype == hislip.TRIGGER:
+            self.execute(b'*TRG')
+        else:
+            hislip.send_message(conn, hislip.ERROR, 0, 0,
+                                ('Unexpected message %d' % (mtype)).encode('ascii'))
+
+
+    def _async_message(self, conn, mtype, control, param, payload):
+        if mtype == hislip.ASYNC_MAXIMUM_MESSAGE_SIZE:
+            hislip.send_message(conn, hislip.ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE, 0, 0,
+                                hislip.SIZE.pack(self.max_message_size))
+        elif mtype == hislip.ASYNC_STATUS_QUERY:
+            hislip.send_message(conn, hislip.ASYNC_STATUS_RESPONSE, self.status_byte())
+        elif mtype == hislip.ASYNC_DEVICE_CLEAR:
+            hislip.send_message(conn, hislip.ASYNC_DEVICE_CLEAR_ACKNOWLEDGE,
+                                int(self.overlapped))
+        elif mtype == hislip.ASYNC_LOCK:
+            hislip.send_message(conn, hislip.ASYNC_LOCK_RESPONSE, 1)
+        elif mtype == hislip.ASYNC_REMOTE_LOCAL_CONTROL:
+            hislip.send_message(conn, hislip.ASYNC_REMOTE_LOCAL_RESPONSE)
+        else:
+            hislip.send_message(conn, hislip.ERROR, 0, 0,
+                                ('Unexpected message %d' % (mtype)).encode('ascii'))
+
+
+    def _initialize(self, conn):
+        """
+        Handle the first message of a new connection. Returns channel
+        type ('sync' or 'async'), or None if connection was rejected.
+        """
+        mtype, control, param, payload = hislip.recv_message(conn)
+        if mtype == hislip.INITIALIZE:
+            if payload != b'hislip0':
+                hislip.send_message(conn, hislip.FATAL_ERROR, 3, 0, b'Invalid sub address')
+                return None
+            self.session_id += 1
+            self.inbuf.clear()
+            hislip.send_message(conn, hislip.INITIALIZE_RESPONSE, int(self.overlapped),
+                                (hislip.PROTOCOL_VERSION << 16) | self.session_id)
+            return 'sync'
+        if mtype == hislip.ASYNC_INITIALIZE and param == self.session_id:
+            hislip.send_message(conn, hislip.ASYNC_INITIALIZE_RESPONSE, 0, 0x534c)
+            return 'async'
+        hislip.send_message(conn, hislip.FATAL_ERROR, 1, 0, b'Invalid initialization')
+        return None
+
+
+    def _run(self):
+        channels = {}
+        rqs = False
+        while not self._stop.is_set():
+            r, w, x = select.select([self.sock] + list(channels), [], [], 0.01)
+            for conn in r:
+                try:
+                    if conn is self.sock:
+                        conn, addr = self.sock.accept()
+                        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        ctype = self._initialize(conn)
+                        if ctype:
+                            channels[conn] = ctype
+                        else:
+                            conn.close()
+                        continue
+                    msg = hislip.recv_message(conn)
+                    if channels[conn] == 'sync':
+                        self._sync_message(conn, *msg)
+                    else:
+                        self._async_message(conn, *msg)
+                except Exception:
+                    channels.pop(conn, None)
+                    conn.close()
+            # service request when RQS bit gets set
+            stb = self.status_byte()
+            if stb & 0x40 and not rqs:
+                for conn, ctype in list(channels.items()):
+                    if ctype == 'async':
+                        try:
+                            hislip.send_message(conn, hislip.ASYNC_SERVICE_REQUEST, stb)
+                        except OSError:
+                            pass
+            rqs = (stb & 0x40) != 0
+        for conn in channels:
+            conn.close()
+
+
+
+class VXI11Instrument(TCPInstrument):
+    """
+    Simulated VXI-11 instrument: ONC RPC server for the core channel
+    and a portmapper, both listening on local TCP ports.
+
+    VXI11Device (SCPIDevice) can be connected using the VISA resource
+    string found in :device: attribute, with portmapper port given
+    as pmap_port option (see :pmap_port: attribute). create_link,
+    destroy_link, device_write, device_read, device_readstb,
+    device_trigger, and device_clear are simulated. Responses can be
+    split to multiple device_read replies using :chunk_size:.
+    """
+
+    def __init__(self, max_recv_size=64*1024, **args):
+        """
+        :max_recv_size: maxRecvSize reported in create_link [Default: 64KB]
+
+        See SimulatedInstrument for the other options.
+        """
+        super().__init__(**args)
+        self.max_recv_size = max_recv_size
+        self.pmap_port = 0
+        self.links = 0
+        self.active_links = set()
+        self.rpc_calls = 0
+        self.outq = []
+
+
+    def start(self):
+        self.pmap_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.pmap_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.pmap_sock.bind((self.host, 0))
+        self.pmap_sock.listen(4)
+        self.pmap_port = self.pmap_sock.getsockname()[1]
+        super().start()
+        self.device = 'TCPIP::%s::inst0::INSTR' % (self.host)
+
+
+    def stop(self):
+        super().stop()
+        self.pmap_sock.close()
+
+
+    def _recv_record(self, conn):
+        data = bytearray()
+        last = False
+        while not last:
+            marker = struct.unpack('>I', self._recv_exact(conn, 4))[0]
+            last = (marker & vxi11.LAST_FRAGMENT) != 0
+            data += self._recv_exact(conn, marker & ~vxi11.LAST_FRAGMENT)
+        return bytes(data)
+
+
+    def _recv_exact(self, conn, size):
+        data = bytearray()
+        while len(data) < size:
+            r = conn.recv(size - len(data))
+            if not r:
+                raise EOFError()
+            data += r
+        return data
+
+
+    def _send_reply(self, conn, xid, results, accept=vxi11.SUCCESS):
+        reply = struct.pack('>IIIIII', xid, vxi11.REPLY, vxi11.MSG_ACCEPTED, 0, 0, accept)
+        reply += results
+        # split reply to record fragments to exercise the client
+        size = self.chunk_size if self.chunk_size > 0 else len(reply)
+        out = bytearray()
+        for pos in range(0, len(reply), size):
+            frag = reply[pos:pos + size]
+            last = vxi11.LAST_FRAGMENT if pos + size >= len(reply) else 0
+            out += struct.pack('>I', last | len(frag)) + frag
+        conn.sendall(out)
+
+
+    def _opaque(self, data, pos):
+        n = struct.unpack_from('>I', data, pos)[0]
+        return data[pos + 4:pos + 4 + n], pos + 4 + ((n + 3) & ~3)
+
+
+    # result formats of core channel procedures (for error replies)
+    RESULTS = {vxi11.DEVICE_WRITE: '>II', vxi11.DEVICE_READ: '>III',
+               vxi11.DEVICE_READSTB: '>II', vxi11.DEVICE_TRIGGER: '>I',
+               vxi11.DEVICE_CLEAR: '>I', vxi11.DESTROY_LINK: '>I'}
+
+    def _core_call(self, proc, args):
+        """
+        Handle VXI-11 core channel procedure, returns XDR encoded results.
+        """
+        if proc == vxi11.CREATE_LINK:
+            name, pos = self._opaque(args, 12)
+            if name != b'inst0':
+                return struct.pack('>IIII', 3, 0, 0, 0)
+            self.links += 1
+            self.active_links.add(self.links)
+            self.outq = []
+            return struct.pack('>IIII', 0, self.links, 0, self.max_recv_size)
+        if proc not in self.RESULTS:
+            return None
+        if struct.unpack_from('>I', args)[0] not in self.active_links:
+            # invalid link identifier
+            fmt = self.RESULTS[proc]
+            return struct.pack(fmt, 4, *([0] * (len(fmt) - 2)))
+        if proc == vxi11.DEVICE_WRITE:
+            lid, io_timeout, lock_timeout, flags = struct.unpack_from('>IIII', args)
+            data, pos = self._opaque(args, 16)
+            if len(data) > self.max_recv_size:
+                return struct.pack('>II', 5, 0)
+            if not flags & vxi11.FLAG_END:
+                self.inbuf.extend(data)
+                return struct.pack('>II', 0, len(data))
+            # new command discards unread response
+            self.outq = []
+            if not data.endswith(b'\n'):
+                data += b'\n'
+            resp = self.feed(data)
+            if resp:
+                self.outq.append(bytearray(resp))
+            return struct.pack('>II', 0, len(data))
+        elif proc == vxi11.DEVICE_READ:
+            lid, size = struct.unpack_from('>II', args)
+            if not self.outq:
+                return struct.pack('>III', vxi11.ERROR_IO_TIMEOUT, 0, 0)
+            if self.latency:
+                time.sleep(self.latency)
+            msg = self.outq[0]
+            n = min(size, self.chunk_size or len(msg), len(msg))
+            data = bytes(msg[:n])
+            del msg[:n]
+            reason = vxi11.REASON_REQCNT if n == size else 0
+            if not msg:
+                self.outq.pop(0)
+                reason |= vxi11.REASON_END
+            return (struct.pack('>III', 0, reason, len(data)) + data
+                    + vxi11.PAD[len(data) % 4])
+        elif proc == vxi11.DEVICE_READSTB:
+            return struct.pack('>II', 0, self.status_byte())
+        elif proc == vxi11.DEVICE_TRIGGER:
+            self.execute(b'*TRG')
+            return struct.pack('>I', 0)
+        elif proc == vxi11.DEVICE_CLEAR:
+            self.inbuf.clear()
+            self.outq = []
+            return struct.pack('>I', 0)
+        elif proc == vxi11.DESTROY_LINK:
+            self.active_links.discard(struct.unpack_from('>I', args)[0])
+            return struct.pack('>I', 0)
+        return None
+
+
+    def _rpc(self, conn, service):
+        record = self._recv_record(conn)
+        self.rpc_calls += 1
+        xid, mtype, rpcvers, prog, vers, proc = struct.unpack_from('>IIIIII', record)
+        cred, pos = self._opaque(record, 28)
+        verf, pos = self._opaque(record, pos + 4)
+        args = record[pos:]
+        if service == 'pmap' and prog == vxi11.PMAP_PROG:
+            if proc != vxi11.PMAPPROC_GETPORT:
+                return self._send_reply(conn, xid, b'', 3)
+            prog, vers = struct.unpack_from('>II', args)
+            port = self.port if (prog, vers) == (vxi11.DEVICE_CORE, 1) else 0
+            return self._send_reply(conn, xid, struct.pack('>I', port))
+        if service == 'core' and prog == vxi11.DEVICE_CORE:
+            results = self._core_call(proc, args)
+            if results is None:
+                return self._send_reply(conn, xid, b'', 3)
+            return self._send_reply(conn, xid, results)
+        self._send_reply(conn, xid, b'', 1)
+
+
+    def _run(self):
+        conns = {}
+        while not self._stop.is_set():
+            r, w, x = select.select([self.sock, self.pmap_sock] + list(conns), [], [], 0.05)
+            for conn in r:
+                if conn in (self.sock, self.pmap_sock):
+                    service = 'core' if conn is self.sock else 'pmap'
+                    conn, addr = conn.accept()
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    conns[conn] = service
+                    continue
+                try:
+                    self._rpc(conn, conns[conn])
+                except (EOFError, OSError, struct.error):
+                    del conns[conn]
+                    conn.close()
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,114 @@
+#
+# cache.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import os
+import tempfile
+import time
+
+from .exceptions import *
+
+
+__all__ = ['IdentityCache']
+
+
+def default_cache_dir():
+    """
+    Return default (per user) cache directory.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'scpi_lite')
+
+
+class IdentityCache(object):
+    """
+    IdentityCache is a persistent (on-disk) cache of instrument identities
+    (*IDN? responses) keyed by connection string. Entries expire after
+    given time-to-live (TTL).
+    """
+
+    def __init__(self, filename=None, ttl=86400):
+        """
+        Open identity cache.
+
+        :filename: cache file [Default: ~/.cache/scpi_lite/identity.json]
+        :ttl: time (in seconds) entries are considered valid [Default: 86400]
+        """
+        self.filename = filename or os.path.join(default_cache_dir(), 'identity.json')
+        self.ttl = ttl
+
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+    def _save(self, data):
+        try:
+            dirname = os.path.dirname(os.path.abspath(self.filename))
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.identity')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmpname, self.filename)
+        except OSError:
+            # cache is an optimization only, ignore errors
+            pass
+
+
+    def get(self, device):
+        """
+        Return cached identity (*IDN? response) for device,
+        or None if not found (or entry has expired).
+        """
+        entry = self._load().get(device)
+        if not entry:
+            return None
+        if self.ttl is not None and time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry.get('idn')
+
+
+    def put(self, device, idn):
+        """
+        Store identity (*IDN? response) for device.
+        """
+        data = self._load()
+        data[device] = {'idn': idn, 'time': time.time()}
+        self._save(data)
+
+
+    def invalidate(self, device=None):
+        """
+        Remove cached identity of a device (or all devices if device not specified).
+        """
+        data = self._load()
+        if device is None:
+            data = {}
+        elif device in data:
+            del data[device]
+        else:
+            return
+        self._save(data)
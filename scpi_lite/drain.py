@@ -0,0 +1,207 @@
+#
+# drain.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import array
+import functools
+import time
+
+from .exceptions import *
+
+
+__all__ = ['BufferDrain', 'BUFFER_PRESETS']
+
+
+# (fill level query, fetch query) presets for common instrument families.
+# Fetch query may contain {start} and {end} (indexes of the first and last
+# readings to fetch, buffer keeps readings) or {count} (number of readings,
+# fetch removes readings from the buffer).
+BUFFER_PRESETS = {
+    'trace': ('TRAC:POIN:ACT?', 'TRAC:DATA? {start},{end}'),
+    'trace-actual': ('TRAC:ACT?', 'TRAC:DATA? {start},{end}'),
+    'data-remove': ('DATA:POIN?', 'DATA:REM? {count}'),
+}
+
+
+class BufferDrain(object):
+    """
+    BufferDrain fetches readings from instrument's internal reading buffer
+    incrementally (in chunks) while the instrument keeps acquiring, by
+    polling the buffer fill level. Readings are appended to a sink:
+    array.array (or any object with extend()), file object (readings
+    written as native doubles), or a function called with each chunk
+    (array.array('d') or NumPy array).
+
+    Fill level and fetch queries are sent without checking that device
+    is ready (readiness policy would wait for the acquisition to complete
+    using *OPC?), followed by SYST:ERR? (unless device doesn't support it).
+
+    Drain is normally run using SCPIDevice.drain_buffer().
+    """
+
+    def __init__(self, device, sink=None, preset='trace', count_query=None,
+                 fetch_query=None, first_index=1, chunk=10000, datatype=None,
+                 byteorder='little'):
+        """
+        Create buffer drain.
+
+        :device: SCPIDevice
+        :sink: array.array, file object or function [Default: new array('d')]
+        :preset: query preset (see BUFFER_PRESETS) [Default: 'trace']
+        :count_query: buffer fill level query (overrides preset)
+        :fetch_query: fetch query (overrides preset)
+        :first_index: index of the first reading in the buffer [Default: 1]
+        :chunk: maximum number of readings to fetch at once [Default: 10000]
+        :datatype: None (ASCII response) or array typecode of binary block
+                   response items ('f', 'd', ...) [Default: None]
+        :byteorder: byte order of binary block response [Default: 'little']
+        """
+        if preset not in BUFFER_PRESETS:
+            raise SCPIError("Unknown buffer preset: '%s'" % (preset))
+        self.device = device
+        self.sink = array.array('d') if sink is None else sink
+        self.count_query = count_query or BUFFER_PRESETS[preset][0]
+        self.fetch_query = fetch_query or BUFFER_PRESETS[preset][1]
+        self.remove = '{start}' not in self.fetch_query
+        self.first_index = first_index
+        self.chunk = chunk
+        self.datatype = datatype
+        self.byteorder = byteorder
+        self.fetched = 0
+        self.chunks = 0
+
+
+    def _call(self, func, *args):
+        """
+        Run function atomically in device's I/O worker (if enabled).
+        """
+        w = self.device.worker
+        if w and not w.in_worker():
+            return w.submit(func, *args).result()
+        return func(*args)
+
+
+    def _query(self, cmd, read):
+        """
+        Send query (bypassing readiness policy) and read the response
+        using given function, then check errors.
+        """
+        dev = self.device
+        if dev.verbose:
+            print('%s: drain: %s' % (__name__, cmd))
+        dev.write(cmd)
+        r = read()
+        if not dev.quirk_no_syst_err:
+            dev._syst_err()
+        return r
+
+
+    def available(self):
+        """
+        Return number of new readings available in the buffer.
+        """
+        r = self._call(self._query, self.count_query, self.device.read)
+        try:
+            level = int(float(r))
+        except ValueError:
+            raise SCPIError("Invalid response to %s: '%s'" % (self.count_query, r))
+        return level if self.remove else level - self.fetched
+
+
+    def _store(self, values):
+        sink = self.sink
+        if hasattr(sink, 'extend'):
+            sink.extend(values)
+        elif hasattr(sink, 'write'):
+            if isinstance(values, array.array) and values.typecode != 'd':
+                values = array.array('d', values)
+            sink.write(memoryview(values).cast('B'))
+        else:
+            sink(values)
+
+
+    def fetch(self, count):
+        """
+        Fetch (upto) count readings from the buffer into the sink.
+        Returns number of readings fetched.
+        """
+        start = self.first_index + self.fetched
+        cmd = self.fetch_query.format(start=start, end=start + count - 1, count=count)
+        dev = self.device
+        if self.datatype:
+            read = functools.partial(dev.read_binary, datatype=self.datatype,
+                                     byteorder=self.byteorder)
+        else:
+            read = dev.read_values
+        values = self._call(self._query, cmd, read)
+        self._store(values)
+        self.fetched += len(values)
+        self.chunks += 1
+        return len(values)
+
+
+    def poll(self, limit=None):
+        """
+        Fetch all currently available readings (in chunks), but no more
+        than :limit: readings. Returns number of readings fetched.
+        """
+        n = 0
+        avail = self.available()
+        if limit is not None:
+            avail = min(avail, limit)
+        while avail > 0:
+            r = self.fetch(min(avail, self.chunk))
+            if r == 0:
+                break
+            n += r
+            avail -= r
+        return n
+
+
+    def run(self, total=None, operation=None, interval=0.1, timeout=None):
+        """
+        Drain buffer until :total: readings have been fetched, or the
+        :operation: (SCPIOperation, or function returning True when
+        acquisition is complete) has completed and remaining readings
+        have been fetched.
+
+        :interval: polling interval (seconds) when no new readings are
+                   available [Default: 0.1]
+        :timeout: maximum time to run (seconds) [Default: None]
+
+        Return value: sink
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            finished = False
+            if operation is not None:
+                finished = operation() if callable(operation) else self._call(operation.done)
+            n = self.poll(None if total is None else total - self.fetched)
+            if total is not None and self.fetched >= total:
+                break
+            if finished:
+                break
+            if end is not None and time.monotonic() >= end:
+                raise SCPIError("Buffer drain timeout (fetched %d readings)" % (self.fetched))
+            if operation is None and total is None and n == 0:
+                break
+            if n == 0:
+                time.sleep(interval)
+        return self.sink
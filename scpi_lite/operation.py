@@ -0,0 +1,244 @@
+#
+# operation.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import select
+import time
+
+from .stats import normalize_header
+from .exceptions import *
+
+
+__all__ = ['SCPIOperation', 'wait_operations', 'async_wait_operations']
+
+# IEEE 488.2 status byte bits
+STB_ESB = 0x20
+STB_MSS = 0x40
+
+
+class SCPIOperation(object):
+    """
+    SCPIOperation represents a long (overlapped) operation started using
+    SCPIDevice.start_operation(). Completion is detected from the status
+    byte (*OPC sets Operation Complete bit in the standard event status
+    register, summarized in ESB bit of the status byte), either from a
+    service request (USBTMC) or by reading status byte with adaptive
+    backoff (READ_STATUS_BYTE request on USBTMC, *STB? otherwise).
+
+    Operations can be waited individually (wait(), or await in asyncio),
+    or across multiple devices using wait_operations().
+    """
+
+    def __init__(self, device, cmd, min_interval=0.001, max_interval=0.25):
+        """
+        Create operation handle (see SCPIDevice.start_operation()).
+
+        :min_interval: initial status polling interval (seconds)
+        :max_interval: maximum status polling interval (seconds)
+        """
+        self.device = device
+        self.cmd = cmd
+        self.header = normalize_header(cmd)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.start = time.monotonic()
+        self.end = None
+        self.error = None
+        self.interval = min_interval
+        # start polling shortly before the operation is expected to complete
+        expected = device._op_times.get(self.header)
+        self.next_poll = self.start + (0.9 * expected if expected else min_interval)
+
+
+    def __repr__(self):
+        return '<SCPIOperation %s: %s>' % (self.cmd, 'done' if self.end else 'pending')
+
+
+    def __await__(self):
+        return self.async_wait().__await__()
+
+
+    @property
+    def elapsed(self):
+        """
+        Time (seconds) operation took to complete (or has been running).
+        """
+        return (self.end or time.monotonic()) - self.start
+
+
+    def done(self):
+        """
+        Return True if operation has completed (reads status byte
+        if completion has not been seen yet).
+        """
+        return self.end is not None or self.poll()
+
+
+    def poll(self):
+        """
+        Read status byte and check if operation has completed.
+        """
+        if self.end is not None:
+            return True
+        w = self.device.worker
+        if w and not w.in_worker():
+            # status byte read and clearing of the event status register
+            # must not interleave with I/O of other threads
+            return w.submit(self.poll).result()
+        stb = self.device.read_stb()
+        if stb & STB_ESB:
+            self._complete()
+            return True
+        self.interval = min(self.interval * 2, self.max_interval)
+        self.next_poll = time.monotonic() + self.interval
+        return False
+
+
+    def _complete(self):
+        dev = self.device
+        self.end = time.monotonic()
+        # clear event status register (and the service request)
+        dev.write('*ESR?')
+        dev.read()
+        if not dev.quirk_no_syst_err:
+            self.error = dev._syst_err()
+        prev = dev._op_times.get(self.header)
+        dur = self.end - self.start
+        dev._op_times[self.header] = dur if prev is None else 0.75 * prev + 0.25 * dur
+
+
+    def wait(self, timeout=None):
+        """
+        Wait upto :timeout: seconds (None = forever) for operation to complete.
+        Returns True if operation has completed.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        conn = self.device.conn
+        while self.end is None:
+            now = time.monotonic()
+            if end is not None and now >= end:
+                return self.poll()
+            delay = self.next_poll - now
+            if end is not None:
+                delay = min(delay, end - now)
+            if delay > 0:
+                if conn.wait_srq(delay) is None:
+                    time.sleep(delay)
+            self.poll()
+        return True
+
+
+    async def async_wait(self, timeout=None):
+        """
+        Wait (in asyncio event loop) upto :timeout: seconds for operation
+        to complete. Returns True if operation has completed.
+
+        Status byte is read in the default executor (thread pool), so
+        the (blocking) device I/O doesn't stall the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.end is None:
+            now = time.monotonic()
+            if end is not None and now >= end:
+                return await loop.run_in_executor(None, self.poll)
+            delay = self.next_poll - now
+            if end is not None:
+                delay = min(delay, end - now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await loop.run_in_executor(None, self.poll)
+        return True
+
+
+    def result(self, timeout=None):
+        """
+        Wait for operation to complete and return response to SYST:ERR?
+        after the operation. SCPIError is raised on timeout.
+        """
+        if not self.wait(timeout):
+            raise SCPIError("Operation not complete: %s" % (self.cmd))
+        return self.error
+
+
+
+def wait_operations(ops, timeout=None):
+    """
+    Wait upto :timeout: seconds (None = forever) for multiple operations
+    (on any number of devices) to complete. Status of each device is polled
+    only when due (adaptive backoff) or when service request is received
+    from the device.
+
+    Return value: tuple of sets (done, not_done)
+    """
+    ops = set(ops)
+    end = None if timeout is None else time.monotonic() + timeout
+    poller = select.poll() if hasattr(select, 'poll') else None
+    srq = {}
+    for op in ops:
+        fd = op.device.conn.srq_fileno()
+        if fd is not None and poller:
+            srq.setdefault(fd, []).append(op)
+            poller.register(fd, select.POLLPRI | select.POLLIN)
+
+    pending = set([op for op in ops if op.end is None])
+    while pending:
+        now = time.monotonic()
+        if end is not None and now >= end:
+            break
+        due = min([op.next_poll for op in pending])
+        delay = due - now
+        if end is not None:
+            delay = min(delay, end - now)
+        if delay > 0:
+            if srq:
+                for fd, ev in poller.poll(int(delay * 1000 + 0.999)):
+                    for op in srq[fd]:
+                        op.next_poll = 0
+            else:
+                time.sleep(delay)
+        now = time.monotonic()
+        for op in list(pending):
+            if op.next_poll <= now and op.poll():
+                pending.discard(op)
+        if srq:
+            for fd in list(srq):
+                if all([op.end is not None for op in srq[fd]]):
+                    poller.unregister(fd)
+                    del srq[fd]
+
+    done = set([op for op in ops if op.end is not None])
+    return (done, ops - done)
+
+
+async def async_wait_operations(ops, timeout=None):
+    """
+    Wait (in asyncio event loop) upto :timeout: seconds for multiple
+    operations to complete.
+
+    Return value: tuple of sets (done, not_done)
+    """
+    ops = set(ops)
+    if not ops:
+        return (set(), set())
+    await asyncio.wait([asyncio.ensure_future(op.async_wait(timeout)) for op in ops])
+    done = set([op for op in ops if op.end is not None])
+    return (done, ops - done)
@@ -0,0 +1,256 @@
+#
+# pool.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from .scpi import SCPIDevice
+from .exceptions import *
+
+
+__all__ = ['InstrumentPool', 'PoolResult']
+
+
+class PoolResult(object):
+    """
+    PoolResult holds result of an operation run on one device of
+    InstrumentPool: return value (or exception) and elapsed time.
+    """
+
+    def __init__(self, name, value=None, error=None, elapsed=0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<PoolResult %s: error %r (%.3fs)>' % (self.name, self.error, self.elapsed)
+        return '<PoolResult %s: %r (%.3fs)>' % (self.name, self.value, self.elapsed)
+
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+
+class InstrumentPool(object):
+    """
+    InstrumentPool opens connections to multiple instruments in parallel
+    and runs commands/queries on all of them concurrently (using a thread
+    pool with bounded number of threads).
+
+    Results are returned as dictionaries keyed by device name, containing
+    PoolResult objects with the response, error and timing for each device.
+    Errors on one device do not affect the others.
+
+        with InstrumentPool(['192.168.42.10:5025', '/dev/usbtmc0']) as pool:
+            res = pool.query_all('MEAS:VOLT?')
+            for name, r in res.items():
+                print(name, r.value, r.error, r.elapsed)
+    """
+
+    def __init__(self, devices, max_workers=16, deadline=None, **args):
+        """
+        Create pool of instruments and open connections to them (in parallel).
+
+        :devices: list of connection strings, or dictionary of
+                  name: connection string.
+        :max_workers: maximum number of concurrent operations [Default: 16]
+        :deadline: default deadline (seconds) for each device to complete
+                   an operation (measured from start of the operation),
+                   either single value or dictionary of name: deadline.
+                   [Default: None (no deadline)]
+
+        Additional options are passed to SCPIDevice (see SCPIDevice()).
+
+        Devices that fail to open are not included in the pool, their
+        errors are available in the open_results dictionary.
+        """
+        if not isinstance(devices, dict):
+            devices = dict([(d, d) for d in devices])
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.deadline = deadline
+        self.devices = {}
+        self.busy = {}
+        self.open_results = self._run(
+            dict([(name, (lambda d=dev: SCPIDevice(d, **args)))
+                  for name, dev in devices.items()]), deadline, open=True)
+        for name, r in self.open_results.items():
+            if r.ok:
+                self.devices[name] = r.value
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __len__(self):
+        return len(self.devices)
+
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+
+    def _deadline(self, name, deadline):
+        if deadline is None:
+            deadline = self.deadline
+        if isinstance(deadline, dict):
+            return deadline.get(name)
+        return deadline
+
+
+    def _call(self, func, started):
+        start = time.monotonic()
+        started.time = start
+        started.set()
+        try:
+            value = func()
+        except Exception as err:
+            return PoolResult(None, error=err, elapsed=time.monotonic() - start)
+        return PoolResult(None, value=value, elapsed=time.monotonic() - start)
+
+
+    def _run(self, funcs, deadline, open=False):
+        """
+        Run functions (dictionary of name: function) concurrently.
+        """
+        futures = {}
+        results = {}
+        for name, func in funcs.items():
+            if not open:
+                if name not in self.devices:
+                    results[name] = PoolResult(name, error=SCPIError("No such device: %s" % (name)))
+                    continue
+                prev = self.busy.get(name)
+                if prev and not prev.done():
+                    results[name] = PoolResult(name, error=SCPIError("Device busy (previous operation still running)"))
+                    continue
+                dev = self.devices[name]
+                func = (lambda f=func, d=dev: f(d))
+            started = threading.Event()
+            futures[name] = (self.executor.submit(self._call, func, started), started)
+
+        for name, (f, started) in futures.items():
+            dl = self._deadline(name, deadline)
+            timeout = None
+            if dl is not None:
+                # deadline is measured from the start of the operation
+                # (not including time queued waiting for a free thread)
+                started.wait()
+                timeout = max(0, started.time + dl - time.monotonic())
+            try:
+                res = f.result(timeout=timeout)
+            except TimeoutError:
+                if open:
+                    # close device if it gets opened after the deadline
+                    f.add_done_callback(self._close_late)
+                else:
+                    self.busy[name] = f
+                res = PoolResult(name, error=SCPIError("Deadline exceeded"),
+                                 elapsed=time.monotonic() - started.time)
+            res.name = name
+            results[name] = res
+        return results
+
+
+    def _close_late(self, f):
+        r = f.result()
+        if r.ok:
+            try:
+                r.value.close()
+            except Exception:
+                pass
+
+
+    def call_all(self, func, deadline=None):
+        """
+        Call function on all devices concurrently, function is called
+        with SCPIDevice as an argument.
+
+        :deadline: deadline (seconds) overriding pool default.
+
+        Return value: dictionary of name: PoolResult
+        """
+        return self._run(dict([(name, func) for name in self.devices]), deadline)
+
+
+    def query_all(self, cmd, deadline=None, **options):
+        """
+        Send same query to all devices concurrently (see SCPIDevice.query()).
+
+        Return value: dictionary of name: PoolResult
+        """
+        return self.call_all(lambda dev: dev.query(cmd, **options), deadline)
+
+
+    def command_all(self, cmd, deadline=None):
+        """
+        Send same command to all devices concurrently (see SCPIDevice.command()).
+
+        Return value: dictionary of name: PoolResult
+        """
+        return self.call_all(lambda dev: dev.command(cmd), deadline)
+
+
+    def query_map(self, cmds, deadline=None):
+        """
+        Send device specific queries concurrently.
+
+        :cmds: dictionary of name: query
+
+        Return value: dictionary of name: PoolResult
+        """
+        return self._run(dict([(name, (lambda dev, c=cmd: dev.query(c)))
+                               for name, cmd in cmds.items()]), deadline)
+
+
+    def command_map(self, cmds, deadline=None):
+        """
+        Send device specific commands concurrently.
+
+        :cmds: dictionary of name: command
+
+        Return value: dictionary of name: PoolResult
+        """
+        return self._run(dict([(name, (lambda dev, c=cmd: dev.command(c)))
+                               for name, cmd in cmds.items()]), deadline)
+
+
+    def close(self):
+        """
+        Close connections to all devices.
+        """
+        self.executor.shutdown(wait=True)
+        for dev in self.devices.values():
+            try:
+                dev.close()
+            except Exception:
+                pass
+        self.devices = {}
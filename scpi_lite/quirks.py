@@ -0,0 +1,197 @@
+#
+# quirks.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import os
+import re
+import tempfile
+import time
+
+from .batch import ERROR_RE
+from .exceptions import *
+
+
+__all__ = ['QuirkProfiles', 'probe_quirks', 'BUILTIN_PROFILES']
+
+
+# Built-in quirk profiles. Each profile is a dictionary with following keys
+# (all optional, except either 'idn' or 'device'):
+#
+#   name: description of the device(s)
+#   idn: regular expression matching *IDN? response
+#   device: connection string (for profiles saved by probe_quirks())
+#   idn_supported: device responds to *IDN? (bool)
+#   opc: device supports *OPC? (bool)
+#   err: device supports SYST:ERR? (bool)
+#   command_terminator: command terminator (string)
+#   terminator: response terminator (string or list of strings)
+#   ready_delay: delay (seconds) used instead of *OPC? readiness check
+#   ready_delays: per command header delays (dictionary of seconds) used
+#                 instead of ready_delay by 'learned' readiness policy
+
+BUILTIN_PROFILES = [
+    {'name': 'Korad/Tenma/RND KA3005P family power supplies',
+     'idn': r'^\s*(KORAD|TENMA|RND|VELLEMAN)?\s*(\d+\s*)?KA\d{4}',
+     'opc': False, 'err': False, 'ready_delay': 0.05},
+]
+
+
+def default_quirks_file():
+    """
+    Return default (per user) quirk profiles file.
+    """
+    base = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(base, 'scpi_lite', 'quirks.json')
+
+
+class QuirkProfiles(object):
+    """
+    QuirkProfiles is a registry of device quirk profiles, matched by
+    *IDN? response (regular expression) or by connection string.
+
+    Profiles are loaded from the built-in table (BUILTIN_PROFILES), user
+    profiles file (~/.config/scpi_lite/quirks.json) and optional additional
+    files (JSON list of profiles). Profiles loaded later take precedence.
+    """
+
+    def __init__(self, files=None, builtin=True):
+        """
+        Load quirk profiles.
+
+        :files: list of additional profile files to load. [Default: None]
+        :builtin: include built-in profiles. [Default: True]
+        """
+        self.filename = default_quirks_file()
+        self.profiles = list(BUILTIN_PROFILES) if builtin else []
+        for f in [self.filename] + list(files or []):
+            self.profiles.extend(self.load(f, f != self.filename))
+
+
+    def load(self, filename, required=True):
+        """
+        Load profiles from file. Returns list of profiles.
+        """
+        try:
+            with open(filename, 'r') as f:
+                profiles = json.load(f)
+        except OSError as err:
+            if required:
+                raise SCPIError('Cannot read quirk profiles: %s' % (err))
+            return []
+        except ValueError as err:
+            raise SCPIError('Invalid quirk profiles file: %s: %s' % (filename, err))
+        if not isinstance(profiles, list):
+            raise SCPIError('Invalid quirk profiles file: %s' % (filename))
+        return profiles
+
+
+    def match(self, idn=None, device=None):
+        """
+        Find profile for the device, either by connection string (device)
+        or by *IDN? response. Returns profile (dictionary) or None.
+        """
+        for p in reversed(self.profiles):
+            if device and p.get('device') == device:
+                return p
+        if idn is None:
+            return None
+        for p in reversed(self.profiles):
+            if p.get('idn') and re.search(p['idn'], idn):
+                return p
+        return None
+
+
+    def save(self, profile, filename=None):
+        """
+        Save (add or replace) profile into user profiles file.
+        """
+        filename = filename or self.filename
+        profiles = [p for p in self.load(filename, False)
+                    if not (profile.get('device') and p.get('device') == profile.get('device'))]
+        profiles.append(profile)
+        try:
+            dirname = os.path.dirname(os.path.abspath(filename))
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.quirks')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(profiles, f, indent=1)
+            os.replace(tmpname, filename)
+        except OSError as err:
+            raise SCPIError('Cannot save quirk profiles: %s' % (err))
+        self.profiles = [p for p in self.profiles
+                         if not (profile.get('device') and p.get('device') == profile.get('device'))]
+        self.profiles.append(profile)
+
+
+
+def probe_quirks(device, timeout=1, save=True, files=None, **args):
+    """
+    Probe device for quirks (*IDN?, *OPC? and SYST:ERR? support, response
+    time) and save profile for it, so that later connections to the
+    device can skip probing (and timeouts).
+
+    :device: connection string.
+    :timeout: timeout (seconds) for each probe. [Default: 1]
+    :save: save profile into user profiles file. [Default: True]
+    :files: additional profile files (see QuirkProfiles).
+
+    Additional options are passed to SCPIDevice.
+
+    Return value: profile (dictionary).
+    """
+    from .scpi import SCPIDevice
+
+    dev = SCPIDevice(device, idn=False, opc=False, err=False, quirks=False,
+                     fast_connect=True, identity_cache=False, timeout=timeout, **args)
+    profile = {'device': device}
+    try:
+        start = time.monotonic()
+        dev.write('*IDN?')
+        idn = dev.read()
+        rtt = time.monotonic() - start
+        if idn:
+            profile['name'] = idn
+            profile['idn'] = '^' + re.escape(idn.strip())
+            m = re.match(r'^([^,]*,[^,]*,)', idn)
+            if m:
+                profile['name'] = m.group(1).strip(',').replace(',', ' ')
+                profile['idn'] = '^' + re.escape(m.group(1))
+        else:
+            profile['idn_supported'] = False
+        dev.flush_input()
+
+        dev.write('*OPC?')
+        profile['opc'] = dev.read() == '1'
+        dev.flush_input()
+
+        dev.write('SYST:ERR?')
+        profile['err'] = ERROR_RE.match(dev.read()) is not None
+        dev.flush_input()
+
+        if not profile['opc']:
+            # calibrate readiness delay using measured response time
+            profile['ready_delay'] = round(max(2 * rtt, 0.01), 3) if idn else 0.25
+    finally:
+        dev.close()
+
+    if save:
+        QuirkProfiles(files).save(profile)
+    return profile
@@ -0,0 +1,252 @@
+#
+# readiness.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+
+from .batch import split_responses
+from .stats import normalize_header
+from .exceptions import *
+
+
+__all__ = ['ReadinessPolicy', 'AlwaysReadiness', 'NeverReadiness',
+           'OverlappedReadiness', 'LearnedReadiness', 'get_readiness']
+
+
+def message_headers(cmd):
+    """
+    Return list of normalized headers of commands in a program message.
+    """
+    return [normalize_header(c) for c in split_responses(cmd) if c]
+
+
+class ReadinessPolicy(object):
+    """
+    Base class for readiness policies, that decide when SCPIDevice needs
+    to check (using *OPC?) or wait for device to be ready before sending
+    next command or query.
+
+    Policy instance holds state of a single device.
+    """
+
+    def wait_ready(self, device, cmd):
+        """
+        Called before sending :cmd: to device. Checks/waits device to be
+        ready as needed. Returns True if device is ready.
+        """
+        return device.unit_ready() == 1
+
+
+    def completed(self, device, cmd, query):
+        """
+        Called after command has been sent to device (or response to
+        a query has been received).
+        """
+
+
+
+class AlwaysReadiness(ReadinessPolicy):
+    """
+    Check that device is ready before every command and query.
+    (This is the default policy.)
+    """
+
+
+
+class NeverReadiness(ReadinessPolicy):
+    """
+    Never check if device is ready.
+    """
+
+    def wait_ready(self, device, cmd):
+        return True
+
+
+
+class OverlappedReadiness(ReadinessPolicy):
+    """
+    Check that device is ready only after overlapped commands, that
+    device may still be executing after the command has been received.
+    """
+
+    OVERLAPPED = ('*RST', '*TRG', '*RCL', '*SAV', '*CAL?', '*TST?', 'INIT',
+                  'INIT:IMM', 'INIT:CONT', 'ABOR', 'CAL', 'CAL:ALL',
+                  'SYST:PRES', 'MMEM:LOAD', 'MMEM:STOR')
+
+    def __init__(self, headers=None):
+        """
+        :headers: list of overlapped command headers (long or short form).
+                  [Default: OVERLAPPED]
+        """
+        self.headers = set([normalize_header(h) for h in (headers or self.OVERLAPPED)])
+        self.pending = False
+
+
+    def wait_ready(self, device, cmd):
+        if not self.pending:
+            return True
+        if device.unit_ready() != 1:
+            return False
+        self.pending = False
+        return True
+
+
+    def completed(self, device, cmd, query):
+        for h in message_headers(cmd):
+            if h in self.headers:
+                self.pending = True
+
+
+
+class LearnedReadiness(ReadinessPolicy):
+    """
+    Learn how long device stays busy after each command (by header),
+    and only wait for that long before next command (without using
+    *OPC?). Response to a query implies that preceding commands have
+    completed.
+
+    Busy time of a command is measured using *OPC? until :samples:
+    measurements have been collected, and re-checked every :recheck:
+    times after that.
+
+    Busy time can't be measured from devices that don't support *OPC?,
+    so per command delays are taken from the quirk profile instead
+    (ready_delays: {header: seconds}, other commands use ready_delay),
+    and only the remaining part of the delay is waited before next command.
+    """
+
+    def __init__(self, samples=3, recheck=100, margin=1.25):
+        """
+        :samples: measurements needed before using learned estimate [Default: 3]
+        :recheck: re-measure busy time after this many uses [Default: 100]
+        :margin: safety margin (multiplier) for the estimate [Default: 1.25]
+        """
+        self.samples = samples
+        self.recheck = recheck
+        self.margin = margin
+        self.model = {}
+        self.rtt = None
+        self.last = None
+        self.last_time = 0.0
+        self.delays = {}
+        self._profile = None
+
+
+    def estimate(self, header):
+        """
+        Return estimated busy time (seconds) after command, or None if unknown.
+        """
+        if header in self.delays:
+            return self.delays[header]
+        m = self.model.get(header)
+        if m is None or m[1] < self.samples:
+            return None
+        return m[0]
+
+
+    def _update(self, header, busy):
+        mean, count, uses = self.model.get(header, (0.0, 0, 0))
+        if count == 0:
+            mean = busy
+        else:
+            mean += (busy - mean) / min(count + 1, 8)
+        self.model[header] = (mean, count + 1, 0)
+
+
+    def ready_delay(self, device, header):
+        """
+        Return delay (seconds) to wait after command (without *OPC?).
+        """
+        if self._profile is not device.quirk_profile:
+            self._profile = device.quirk_profile
+            delays = (self._profile or {}).get('ready_delays') or {}
+            self.delays = dict([(normalize_header(k), v) for k, v in delays.items()])
+        return max([self.delays.get(h, device.no_opc_delay) for h in header.split(';')])
+
+
+    def wait_ready(self, device, cmd):
+        header = self.last
+        if header is None:
+            return True
+        self.last = None
+        if device.quirk_no_opc:
+            delay = self.last_time + self.ready_delay(device, header) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return True
+        mean, count, uses = self.model.get(header, (0.0, 0, 0))
+        if count >= self.samples and uses < self.recheck:
+            self.model[header] = (mean, count, uses + 1)
+            delay = self.last_time + mean * self.margin - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return True
+
+        start = time.monotonic()
+        if device.unit_ready() != 1:
+            return False
+        now = time.monotonic()
+        rtt = now - start
+        if self.rtt is None:
+            # measure baseline *OPC? round trip time (device is ready now)
+            device.unit_ready()
+            self.rtt = time.monotonic() - now
+        self.rtt = min(self.rtt, rtt)
+        gap = start - self.last_time
+        wait = rtt - self.rtt
+        if wait > max(0.0005, self.rtt / 2):
+            # device was still busy: busy time is known exactly
+            busy = gap + wait
+        else:
+            # device was already ready: busy time is at most the gap,
+            # but gap includes caller's think time, so it is only used
+            # to lower the estimate learned from actual waits
+            busy = min(gap, mean) if count > 0 else 0.0
+        self._update(header, busy)
+        return True
+
+
+    def completed(self, device, cmd, query):
+        if query:
+            self.last = None
+            return
+        self.last = ';'.join(message_headers(cmd))
+        self.last_time = time.monotonic()
+
+
+
+POLICIES = {
+    'always': AlwaysReadiness,
+    'never': NeverReadiness,
+    'overlapped': OverlappedReadiness,
+    'learned': LearnedReadiness,
+}
+
+
+def get_readiness(policy):
+    """
+    Return readiness policy instance for policy name ('always', 'never',
+    'overlapped', 'learned') or ReadinessPolicy instance.
+    """
+    if isinstance(policy, ReadinessPolicy):
+        return policy
+    if policy not in POLICIES:
+        raise SCPIError("Unknown readiness policy: '%s'" % (policy))
+    return POLICIES[policy]()
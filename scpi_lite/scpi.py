@@ -20,11 +20,35 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import array
 import importlib
+import io
+import os
 import re
+import sys
 import time
 
 from .exceptions import *
+from .batch import SCPIBatch
+from .stats import Statistics, StatsTransport
+from .worker import SCPIWorker
+from .cache import IdentityCache
+from .quirks import QuirkProfiles
+from .operation import SCPIOperation
+from .readiness import get_readiness
+from .values import parse_values
+from .stream import SCPIStream
+from .drain import BufferDrain
+from .transport import SCPITransport
+
+
+def block_header(length):
+    """
+    Return IEEE 488.2 definite length block header (#<n><length>)
+    for a block of :length: bytes.
+    """
+    size = str(length)
+    return ('#%d%s' % (len(size), size)).encode('ascii')
 
 
 def load_transport(name):
@@ -36,6 +60,123 @@ def load_transport(name):
     return module
 
 
+VISA_TCPIP_RE = re.compile(r'^\s*TCPIP\d*::(?P<host>[^:]+)(::(?P<name>[^:]+))?'
+                           r'::(?P<cls>INSTR|SOCKET)\s*$', re.IGNORECASE)
+
+
+def parse_device(device, transport=None):
+    """
+    Parse device connection string.
+
+    Returns tuple (transport, device, port), where transport is one of:
+    'usbtmc', 'tcp', 'linux_usbtmc', 'serial', 'hislip', 'vxi11', or 'replay'.
+
+    VISA style TCPIP resource strings are supported for HiSLIP
+    (TCPIP::host::hislip0[,port]::INSTR), VXI-11 (TCPIP::host[::inst0]::INSTR),
+    and raw sockets (TCPIP::host::port::SOCKET).
+
+    :transport: use given transport instead of determining it from
+                the connection string.
+    """
+    m = VISA_TCPIP_RE.match(device)
+    if m:
+        host = m.group('host')
+        name = m.group('name')
+        if m.group('cls').upper() == 'SOCKET':
+            return (transport or 'tcp', host, name)
+        if name and name.lower().startswith('hislip'):
+            return (transport or 'hislip', host, name)
+        return (transport or 'vxi11', host, name or 'inst0')
+    m = re.match(r'^\s*(?P<device>\S+?)(\s*:\s*(?P<port>\S+))?\s*$', device)
+    if not m:
+        raise SCPIError("Invalid device string: '%s'" % (device))
+    dev = m.group('device')
+    port = m.group('port')
+    if transport:
+        if transport not in ('usbtmc', 'tcp', 'linux_usbtmc', 'serial', 'hislip', 'vxi11',
+                             'replay'):
+            raise SCPIError("Unknown transport: '%s'" % (transport))
+        if transport not in ('tcp', 'hislip', 'vxi11'):
+            dev = device.strip()
+        return (transport, dev, port)
+    if dev == 'USB':
+        return ('usbtmc', dev, port)
+    elif dev == 'replay' and port:
+        return ('replay', port, None)
+    elif port:
+        return ('tcp', dev, port)
+    elif (dev.startswith("/dev/usbtmc")):
+        return ('linux_usbtmc', dev, port)
+    return ('serial', dev, port)
+
+
+def parse_idn(idn):
+    """
+    Parse *IDN? response.
+
+    Returns tuple (manufacturer, model, serial, firmware).
+    """
+    i = idn.split(',')
+    if (len(i) < 2):
+        raise SCPIError("Invalid IDN response: '%s'" % (idn))
+    if (len(i) < 3):
+        return (i[0], i[1], 'Unknown', 'Unknown')
+    if (len(i) < 4):
+        return (i[0], i[1], 'Unknown', i[2])
+    return (i[0], i[1], i[2], i[3])
+
+
+class MultiLineResponse(object):
+    """
+    MultiLineResponse collects lines of a multi-line response and
+    determines when the response is complete (see SCPIDevice.query()).
+    """
+
+    def __init__(self, lines=None, end=None, opc=False):
+        self.count = lines
+        self.end = end
+        self.opc = opc
+        self.lines = []
+        self.complete = False
+        self.deterministic = bool(lines or end is not None or opc)
+
+
+    def _match_end(self, line):
+        if isinstance(self.end, str):
+            return line.strip() == self.end
+        return self.end.search(line) is not None
+
+
+    def add(self, text, more=False):
+        """
+        Add received text (one or more lines) to the response.
+        Returns True if the response is complete.
+
+        :more: more input is already pending (response to *OPC? is
+               accepted only as the last line of the received input)
+        """
+        lines = text.split('\n')
+        for i, line in enumerate(lines):
+            if (self.opc and not more and i == len(lines) - 1 and
+                    (line == '1' or line.endswith(';1'))):
+                line = line[:-2] if len(line) > 1 else None
+                self.complete = True
+            if line is not None:
+                self.lines.append(line)
+            if self.count and len(self.lines) >= self.count:
+                self.complete = True
+            if self.end is not None and line is not None and self._match_end(line):
+                self.complete = True
+        return self.complete
+
+
+    def text(self):
+        """
+        Return response as a string.
+        """
+        return '\n'.join(self.lines)
+
+
 class SCPIDevice(object):
     """
     SCPIDevice class reporesents a SCPI device (instrument).
@@ -52,82 +193,225 @@ class SCPIDevice(object):
     quirk_no_opc = False
     quirk_no_syst_err = False
     no_opc_delay = 0.25
-    manufacturer = 'Unknown'
-    model = 'Unknown'
-    serial = 'Unknown'
-    firmware = 'Unknown'
-    idn = ''
+    device = None
     last_error = ''
-
-
-    def __init__(self, device, command_terminator='\n',
-                 idn=True, opc=True, err=True,
-                 encoding='utf-8', **args):
+    _stats = None
+    _identity = None
+    _identity_cache = None
+    _quirks = None
+    quirk_profile = None
+    worker = None
+    _srq_enabled = False
+
+
+    def __init__(self, device, command_terminator=None,
+                 idn=None, opc=None, err=None,
+                 encoding='utf-8', stats=False, transport=None, record=None,
+                 worker=False, fast_connect=False, identity_cache=True,
+                 identity_ttl=86400, quirks=True, quirk_files=None,
+                 readiness='always', **args):
         """
         Creates an instance of SCPIDevice to commmunicate with instruments.
 
         :device: Connection string identifying the device to connect to.
+        :command_terminator: Command terminator. [Default: \n]
         :idn: Device supports *IDN? command (True/False). [Default: True]
         :opc: Device supports *OPC? command (True/False). [Default: True]
         :err: Device support SYST:ERR? command (True/False). [Default: True]
+        :stats: Enable statistics collection (True/False). [Default: False]
+        :transport: Transport to use ('tcp', 'serial', 'linux_usbtmc',
+                    'usbtmc', 'replay') instead of determining it from the
+                    device string. [Default: None]
+        :record: Record all exchanges with the device into given file,
+                 recording can be played back using 'replay:<file>'
+                 as the device string. [Default: None]
+        :worker: Run all I/O in a dedicated worker thread, making the
+                 device safe to share between threads (see
+                 enable_worker()). [Default: False]
+        :fast_connect: Skip the connection handshake (*OPC?, *IDN?, *CLS),
+                       device identity (idn, manufacturer, model, serial,
+                       firmware) is resolved when first accessed (or from
+                       the identity cache). [Default: False]
+        :identity_cache: Cache identities on disk in fast_connect mode
+                         (True/False or cache file name). [Default: True]
+        :identity_ttl: Time (seconds) cached identities are valid.
+                       [Default: 86400]
+        :quirks: Apply matching device quirk profile (see QuirkProfiles)
+                 for options not explicitly specified. [Default: True]
+        :quirk_files: Additional quirk profile files. [Default: None]
+        :readiness: Readiness policy, when to check that device is ready
+                    before commands/queries: 'always', 'never', 'overlapped'
+                    (only after overlapped commands), 'learned' (learned
+                    per command busy times), or ReadinessPolicy instance.
+                    [Default: 'always']
 
         Additionally transport specific options can be added that are passed
         directly to underlying transport class (SCPITransport).
         """
-        m = re.match(r'^\s*(?P<device>\S+?)(\s*:\s*(?P<port>\S+))?\s*$', device)
-        if m:
-            dev = m.group('device')
-            port = m.group('port')
-            if dev == 'USB':
-                transport = load_transport('usbtmc')
-                conn = transport.USBTMCDevice(device, **args)
-            elif port:
-                transport = load_transport('tcp')
-                conn = transport.TCPDevice(dev, port, **args)
-            elif (dev.startswith("/dev/usbtmc")):
-                transport = load_transport('linux_usbtmc')
-                conn = transport.LinuxUSBTMCDevice(dev, **args)
-            else:
-                transport = load_transport('serial')
-                conn = transport.SerialDevice(dev, **args)
+        transport, dev, port = parse_device(device, transport)
+        if transport == 'usbtmc':
+            conn = load_transport('usbtmc').USBTMCDevice(device, **args)
+        elif transport == 'tcp':
+            conn = load_transport('tcp').TCPDevice(dev, port, **args)
+        elif transport == 'linux_usbtmc':
+            conn = load_transport('linux_usbtmc').LinuxUSBTMCDevice(dev, **args)
+        elif transport == 'hislip':
+            conn = load_transport('hislip').HiSLIPDevice(dev, port or 'hislip0', **args)
+        elif transport == 'vxi11':
+            conn = load_transport('vxi11').VXI11Device(dev, port or 'inst0', **args)
+        elif transport == 'replay':
+            conn = load_transport('replay').ReplayDevice(dev, **args)
         else:
-            raise SCPIError("Invalid device string: '%s'" % (device))
+            conn = load_transport('serial').SerialDevice(dev, **args)
+        if record:
+            conn = load_transport('replay').RecordingTransport(conn, record, device)
 
         self.conn = conn
+        self.device = device
+        self._op_times = {}
+        self.readiness = get_readiness(readiness)
         self.encoding = encoding
-        self.command_terminator = command_terminator
-        self.quirk_no_idn = not idn
-        self.quirk_no_opc = not opc
-        self.quirk_no_syst_err = not err
+        self._quirk_args = {'idn_supported': idn, 'opc': opc, 'err': err,
+                            'command_terminator': command_terminator}
+        profile = None
+        if quirks:
+            self._quirks = QuirkProfiles(quirk_files)
+            profile = self._quirks.match(device=device)
+        self._apply_quirks(profile)
+        if stats:
+            self.enable_stats()
+        if worker:
+            self.enable_worker()
 
         self.conn.flush_input()
+        if fast_connect:
+            if identity_cache:
+                self._identity_cache = IdentityCache(
+                    identity_cache if isinstance(identity_cache, str) else None,
+                    ttl=identity_ttl)
+                res = self._identity_cache.get(device)
+                if res:
+                    self._set_identity(res)
+            return
+
+        if self._quirks and not self.quirk_profile and not self.quirk_no_idn:
+            # identify first, so that quirk profile is applied before
+            # relying on *OPC? and SYST:ERR?
+            self.write('*IDN?')
+            res = self.read()
+            if not res:
+                raise SCPIError("No response to *IDN? (not SCPI compliant device?): %s" % (device))
+            self._set_identity(res)
+
         if (self.unit_ready() != 1):
             raise SCPIError("No response (Not SCPI compatible device?): %s" % (device))
 
         if self.quirk_no_idn:
             return
 
-        res = self._idn()
-        if res:
-            if self.verbose:
-                print('IDN: %s' % (res))
-            self.idn = res
-            i = res.split(',')
-            if (len(i) < 2):
-                raise SCPIError("Invalid IDN response: '%s'" % (res))
-            self.manufacturer = i[0]
-            self.model = i[1]
-            if (len(i) < 4):
-                self.serial='Unknown'
-                self.firmware=i[2]
-            else:
-                self.serial = i[2]
-                self.firmware = i[3]
-        else:
-            raise SCPIError("No response to *IDN? (not SCPI compliant device?): %s" % (device))
+        if self._identity is None:
+            self._identify()
         self._cls()
 
 
+    def _apply_quirks(self, profile):
+        """
+        Apply quirk profile (options explicitly given to SCPIDevice()
+        take precedence).
+        """
+        p = profile or {}
+        opt = dict([(k, v if v is not None else p.get(k, True))
+                    for k, v in self._quirk_args.items()])
+        self.quirk_no_idn = not opt['idn_supported']
+        self.quirk_no_opc = not opt['opc']
+        self.quirk_no_syst_err = not opt['err']
+        term = self._quirk_args['command_terminator']
+        self.command_terminator = term if term is not None else \
+            p.get('command_terminator', '\n')
+        if 'ready_delay' in p:
+            self.no_opc_delay = p['ready_delay']
+        if 'terminator' in p:
+            conn = self.conn
+            while isinstance(getattr(conn, 'transport', None), SCPITransport):
+                conn = conn.transport
+            if hasattr(conn, 'terminator'):
+                t = p['terminator']
+                if isinstance(t, list):
+                    conn.terminator = tuple([x.encode() for x in t])
+                else:
+                    conn.terminator = t.encode()
+        self.quirk_profile = profile
+        if self.verbose and profile:
+            print('%s: quirk profile: %s' % (__name__, profile.get('name', profile)))
+
+
+    def _set_identity(self, idn):
+        if self._quirks and not self.quirk_profile:
+            profile = self._quirks.match(idn=idn)
+            if profile:
+                self._apply_quirks(profile)
+        try:
+            self._identity = (idn,) + parse_idn(idn)
+        except SCPIError:
+            if not self.quirk_profile:
+                raise
+            # non-standard *IDN? response from a known (quirky) device
+            self._identity = (idn, 'Unknown', idn.strip(), 'Unknown', 'Unknown')
+
+
+    def _identify(self):
+        """
+        Identify device using *IDN?.
+        """
+        if self.quirk_no_idn:
+            self._identity = ('', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+            return self._identity
+        res = self._idn()
+        if not res:
+            raise SCPIError("No response to *IDN? (not SCPI compliant device?): %s" % (self.device))
+        if self.verbose:
+            print('IDN: %s' % (res))
+        self._set_identity(res)
+        if self._identity_cache:
+            self._identity_cache.put(self.device, res)
+        return self._identity
+
+
+    @property
+    def idn(self):
+        return (self._identity or self._identify())[0]
+
+
+    @property
+    def manufacturer(self):
+        return (self._identity or self._identify())[1]
+
+
+    @property
+    def model(self):
+        return (self._identity or self._identify())[2]
+
+
+    @property
+    def serial(self):
+        return (self._identity or self._identify())[3]
+
+
+    @property
+    def firmware(self):
+        return (self._identity or self._identify())[4]
+
+
+    def invalidate_identity(self):
+        """
+        Forget device identity (and remove it from the identity cache),
+        identity is queried again when next accessed.
+        """
+        self._identity = None
+        if self._identity_cache:
+            self._identity_cache.invalidate(self.device)
+
+
 
     def write(self, cmd):
         """
@@ -136,6 +420,9 @@ class SCPIDevice(object):
 
         This function expects a string argument that is encoded to bytes.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.write, cmd).result()
         if self.verbose:
             print('%s: write: %s' % (__name__, cmd))
 
@@ -150,6 +437,9 @@ class SCPIDevice(object):
         """
         Send "raw" data to device. Data is send as is withouth any transformations.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.write_raw, cmd).result()
         if self.verbose:
             print('%s: write_raw: %s' % (__name__, cmd))
 
@@ -163,6 +453,9 @@ class SCPIDevice(object):
 
         Returned data is encoded to a string.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.read).result()
         buf = self.conn.read()
         buf = buf.decode(self.encoding)
 
@@ -176,10 +469,396 @@ class SCPIDevice(object):
         """
         Read raw response from device. This function returns bytes.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.read_raw).result()
+        buf = self.conn.read()
         if self.verbose:
             print('%s: read_raw: %s' % (__name__, buf))
 
-            return self.conn.read()
+        return buf
+
+
+    def read_bytes(self, buffer=None):
+        """
+        Read response from device without decoding it to a string.
+
+        :buffer: (writable) buffer to read response into, instead of
+                 allocating a new bytes object for every response.
+                 SCPITransportError is raised if response doesn't fit
+                 in the buffer. [Default: None]
+
+        Return value: Response (bytes), or memoryview of :buffer: containing
+        the response.
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.read_bytes, buffer).result()
+        if buffer is None:
+            r = self.conn.read()
+        else:
+            view = memoryview(buffer).cast('B')
+            r = view[:self.conn.read_into(view)]
+        if self.verbose:
+            print('%s: read_bytes: %d bytes' % (__name__, len(r)))
+        return r
+
+
+    def _read_block_header(self):
+        c = self.conn.read_exact(1)
+        while c.isspace():
+            c = self.conn.read_exact(1)
+        if c != b'#':
+            raise SCPIError("Invalid binary block header: %s" % (c))
+        n = self.conn.read_exact(1)
+        if not n.isdigit():
+            raise SCPIError("Invalid binary block header: #%s" % (n))
+        if n == b'0':
+            raise SCPIError("Indefinite length binary blocks not supported")
+        length = self.conn.read_exact(int(n))
+        if not length.isdigit():
+            raise SCPIError("Invalid binary block length: %s" % (length))
+        return int(length)
+
+
+    def read_binary(self, datatype=None, byteorder='little', numpy=False,
+                    buffer=None):
+        """
+        Read IEEE 488.2 definite length binary block (#<n><length><data>)
+        from device. Data is read directly into a single preallocated buffer
+        without any intermediate copies.
+
+        :datatype: None to return data as bytearray, otherwise array module
+                   typecode ('h', 'f', 'd', ...) or NumPy dtype (if numpy=True)
+                   of the data items. [Default: None]
+        :byteorder: byte order of data items ('little' or 'big') [Default: 'little']
+        :numpy: return NumPy array instead of array.array [Default: False]
+        :buffer: (writable) buffer to read data into, instead of allocating
+                 new one. Memoryview of the data in buffer is returned.
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.read_binary, datatype=datatype, byteorder=byteorder,
+                            numpy=numpy, buffer=buffer).result()
+        length = self._read_block_header()
+        swap = False
+
+        if buffer is not None:
+            view = memoryview(buffer).cast('B')
+            if len(view) < length:
+                raise SCPIError("Buffer too small for binary block: %d < %d"
+                                % (len(view), length))
+            view = view[:length]
+            data = view
+            if datatype:
+                if byteorder != sys.byteorder:
+                    raise SCPIError("Non-native byte order not supported with buffer")
+                data = view.cast(datatype)
+        elif numpy:
+            import numpy as np
+            dtype = np.dtype(datatype or 'u1')
+            dtype = dtype.newbyteorder('<' if byteorder == 'little' else '>')
+            if length % dtype.itemsize:
+                raise SCPIError("Binary block length (%d) not multiple of item size (%d)"
+                                % (length, dtype.itemsize))
+            data = np.empty(length // dtype.itemsize, dtype=dtype)
+            view = memoryview(data.view(np.uint8))
+        elif datatype:
+            itemsize = array.array(datatype).itemsize
+            if length % itemsize:
+                raise SCPIError("Binary block length (%d) not multiple of item size (%d)"
+                                % (length, itemsize))
+            data = array.array(datatype, [0]) * (length // itemsize)
+            view = memoryview(data).cast('B')
+            swap = (itemsize > 1 and byteorder != sys.byteorder)
+        else:
+            data = bytearray(length)
+            view = memoryview(data)
+
+        self.conn.read_exact_into(view)
+        # discard response message terminator
+        self.conn.read()
+        if buffer is None:
+            view.release()
+
+        if swap:
+            data.byteswap()
+
+        if self.verbose:
+            print('%s: read_binary: %d bytes' % (__name__, length))
+
+        return data
+
+
+    def query_binary(self, cmd, datatype=None, byteorder='little', numpy=False,
+                     buffer=None):
+        """
+        Send a SCPI query to device and read IEEE 488.2 definite length
+        binary block response (#<n><length><data>).
+        Before sending command check and wait for device to be ready.
+        If device is not ready SCPIError exception is raised.
+
+        See read_binary() for the description of the options.
+
+        Return value: Response data (bytearray, memoryview, array.array
+        or NumPy array).
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.query_binary(cmd, datatype=datatype, byteorder=byteorder,
+                                  numpy=numpy, buffer=buffer).result()
+        if self.verbose:
+            print('%s: send_query_binary: %s' % (__name__, cmd))
+
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
+            raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
+
+        self.write(cmd)
+        if st:
+            rec.mark('write', 'read')
+        resp = self.read_binary(datatype=datatype, byteorder=byteorder,
+                                numpy=numpy, buffer=buffer)
+        self.readiness.completed(self, cmd, True)
+        if st:
+            rec.mark('read', 'error_check')
+        if not self.quirk_no_syst_err:
+            self._syst_err()
+
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
+        return resp
+
+
+    def read_values(self, numpy=False, separator=',', sentinels=True, buffer=None):
+        """
+        Read ASCII numeric response (comma separated values) from device,
+        parsed directly from the received bytes (see parse_values()).
+
+        :numpy: return NumPy array instead of array.array('d') [Default: False]
+        :separator: value separator [Default: ',']
+        :sentinels: convert SCPI 9.9E37 overflow values to +/-infinity
+                    and 9.91E37 to NaN [Default: True]
+        :buffer: (writable) buffer to receive response into (see read_bytes())
+                 [Default: None]
+        """
+        data = self.read_bytes(buffer)
+        if self.verbose:
+            print('%s: read_values: %d bytes' % (__name__, len(data)))
+        return parse_values(data, numpy=numpy, separator=separator,
+                            sentinels=sentinels)
+
+
+    def query_values(self, cmd, numpy=False, separator=',', sentinels=True,
+                     buffer=None):
+        """
+        Send a SCPI query to device and parse ASCII numeric response
+        (comma separated values) into array.array('d') or NumPy array.
+        Before sending command check and wait for device to be ready.
+        If device is not ready SCPIError exception is raised.
+
+        See read_values() for the description of the options.
+
+        Return value: Response values (array.array('d') or NumPy array).
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.query_values, cmd, numpy=numpy, separator=separator,
+                            sentinels=sentinels, buffer=buffer).result()
+        if self.verbose:
+            print('%s: send_query_values: %s' % (__name__, cmd))
+
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
+            raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
+
+        self.write(cmd)
+        if st:
+            rec.mark('write', 'read')
+        resp = self.read_values(numpy=numpy, separator=separator, sentinels=sentinels,
+                                buffer=buffer)
+        self.readiness.completed(self, cmd, True)
+        if st:
+            rec.mark('read', 'error_check')
+        if not self.quirk_no_syst_err:
+            self._syst_err()
+
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
+        return resp
+
+
+    def query_bytes(self, cmd, buffer=None):
+        """
+        Send a SCPI query to device and return response without decoding
+        it to a string. Before sending command check and wait for device
+        to be ready. If device is not ready SCPIError exception is raised.
+
+        :buffer: (writable) buffer to read response into (see read_bytes())
+                 [Default: None]
+
+        Return value: Response (bytes), or memoryview of :buffer: containing
+        the response.
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.query_bytes, cmd, buffer=buffer).result()
+        if self.verbose:
+            print('%s: send_query_bytes: %s' % (__name__, cmd))
+
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
+            raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
+
+        self.write(cmd)
+        if st:
+            rec.mark('write', 'read')
+        resp = self.read_bytes(buffer)
+        self.readiness.completed(self, cmd, True)
+        if st:
+            rec.mark('read', 'error_check')
+        if not self.quirk_no_syst_err:
+            self._syst_err()
+
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
+        return resp
+
+
+    def write_binary(self, cmd, data):
+        """
+        Send a SCPI command with IEEE 488.2 definite length binary block
+        argument (#<n><length><data>) to device after waiting device to
+        become ready. If device is not ready SCPIError exception is raised.
+
+        Data can be any object supporting buffer protocol (bytes, bytearray,
+        memoryview, array.array, NumPy array, ...). Data is sent as is
+        (in native byte order) without copying it.
+
+        Return value: Response to SYST:ERR? after executing command.
+        """
+        return self.write_block(cmd, data)
+
+
+    def _block_chunks(self, header, data, size, chunk_size, progress):
+        """
+        Generate chunks of binary block command (header, payload, terminator).
+        """
+        yield header
+        sent = 0
+        if hasattr(data, 'readinto'):
+            # file: read into two alternating buffers (see write_chunks())
+            bufs = [memoryview(bytearray(min(chunk_size, size) or 1)) for i in range(2)]
+            while sent < size:
+                view = bufs[(sent // chunk_size) % 2][:min(chunk_size, size - sent)]
+                n = 0
+                while n < len(view):
+                    r = data.readinto(view[n:])
+                    if not r:
+                        raise SCPIError("File ended before %d bytes were sent" % (size))
+                    n += r
+                yield view
+                sent += n
+                if progress:
+                    progress(sent, size)
+        else:
+            while sent < size:
+                view = data[sent:sent + chunk_size]
+                yield view
+                sent += len(view)
+                if progress:
+                    progress(sent, size)
+        yield self.command_terminator.encode(self.encoding)
+
+
+    def write_block(self, cmd, data, progress=None, chunk_size=None, size=None):
+        """
+        Send a SCPI command with (large) IEEE 488.2 definite length binary
+        block argument (#<n><length><data>) to device, sending the data in
+        chunks without copying or concatenating it. Before sending command
+        check and wait for device to be ready.
+        If device is not ready SCPIError exception is raised.
+
+        :data: object supporting buffer protocol (bytes, memoryview,
+               array.array, NumPy array, mmap, ...) or a file object (opened
+               in binary mode, data is read from current position).
+        :progress: function called after each chunk with arguments
+                   (bytes sent, total bytes). [Default: None]
+        :chunk_size: chunk size (bytes) [Default: transport specific]
+        :size: number of bytes to send from file [Default: until end of file]
+
+        Return value: Response to SYST:ERR? after executing command.
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.write_block, cmd, data, progress=progress,
+                            chunk_size=chunk_size, size=size).result()
+        if self.verbose:
+            print('%s: write_block: %s' % (__name__, cmd))
+
+        chunk_size = chunk_size or self.conn.WRITE_CHUNK_SIZE
+        if hasattr(data, 'readinto'):
+            if size is None:
+                try:
+                    size = os.fstat(data.fileno()).st_size - data.tell()
+                except (AttributeError, OSError, io.UnsupportedOperation):
+                    pos = data.tell()
+                    size = data.seek(0, io.SEEK_END) - pos
+                    data.seek(pos)
+        else:
+            try:
+                data = memoryview(data).cast('B')
+            except (TypeError, ValueError) as err:
+                raise SCPIError("Unsupported data for binary block: %s" % (err))
+            size = len(data)
+
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
+            raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
+
+        if cmd.endswith(self.command_terminator):
+            cmd = cmd[:len(cmd) - len(self.command_terminator)]
+        header = cmd.encode(self.encoding) + b' ' + block_header(size)
+        if isinstance(data, memoryview) and size <= chunk_size and not progress:
+            self.conn.write_parts((header, data, self.command_terminator.encode(self.encoding)))
+        else:
+            self.conn.write_chunks(self._block_chunks(header, data, size, chunk_size, progress))
+        self.readiness.completed(self, cmd, False)
+        if st:
+            rec.mark('write', 'error_check')
+
+        if self.quirk_no_syst_err:
+            res = '0, "No Error"'
+        else:
+            res = self._syst_err()
+
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
+        return res
 
 
     def unit_ready(self, retries=3, delay=0.1):
@@ -198,13 +877,15 @@ class SCPIDevice(object):
             time.sleep(self.no_opc_delay)
             return 1
 
+        self._opc()
         while (count < retries):
-            self._opc()
             r = self.read()
             if (r == '1'):
                 return 1
             count += 1
-            time.sleep(delay)
+            # wait for (late) response before sending *OPC? again
+            if not self.conn.wait_readable(delay):
+                self._opc()
 
         return 0
 
@@ -218,31 +899,43 @@ class SCPIDevice(object):
 
         Return value: Response to SYST:ERR? after executing command.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.command(cmd).result()
         if self.verbose:
             print('%s: send_command: %s' % (__name__, cmd))
 
-        if not self.unit_ready():
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
             raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
 
         self.write(cmd)
+        self.readiness.completed(self, cmd, False)
+        if st:
+            rec.mark('write', 'error_check')
 
         if self.quirk_no_syst_err:
-            return '0, "No Error"'
+            res = '0, "No Error"'
+        else:
+            res = self._syst_err()
 
-        return self._syst_err()
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
+        return res
 
 
     def _wait_input(self, timeout):
-        count = 0
-        while count < timeout:
-            if self.conn.pending_input() > 0:
-                return 1
-            time.sleep(0.001)
-            count += 1
-        return 0
+        return 1 if self.conn.wait_readable(timeout / 1000) else 0
 
 
-    def query(self, cmd, multi_line=False, multi_line_wait=100):
+    def query(self, cmd, multi_line=False, multi_line_wait=100,
+              lines=None, end=None, opc=False, block=False):
         """
         Send a SCPI command to device and wait for response.
         Before sending command check and wait for device to be ready.
@@ -250,30 +943,304 @@ class SCPIDevice(object):
 
         If command is missing terminator (default: \n) it is appended automatically.
 
+        Multi-line response is complete when any of the following conditions
+        are met (if none are specified, response is considered complete
+        when no more input is received within :multi_line_wait: ms):
+
+        :lines: expected number of lines in the response.
+        :end: sentinel line (string) or regular expression (compiled)
+              matching the last line of the response.
+        :opc: append *OPC? to the command, its response ("1") ends the response.
+        :block: response is IEEE 488.2 definite length block.
+
         Return value: Response from unit to the command.
         """
+        w = self.worker
+        if w and not w.in_worker():
+            if multi_line or lines or end is not None or opc or block:
+                return w.query(cmd, multi_line=multi_line,
+                               multi_line_wait=multi_line_wait, lines=lines,
+                               end=end, opc=opc, block=block).result()
+            return w.query(cmd).result()
         if self.verbose:
             print('%s: send_query: %s' % (__name__, cmd))
 
-        if not self.unit_ready():
+        st = self._stats
+        if st:
+            rec = st.begin(cmd)
+
+        if not self.readiness.wait_ready(self, cmd):
             raise SCPIError("Device not ready!")
+        if st:
+            rec.mark('ready')
 
+        if opc:
+            cmd = cmd.rstrip(self.command_terminator) + ';*OPC?'
         self.write(cmd)
-        resp = self.read()
-        if multi_line:
-            while self._wait_input(multi_line_wait):
-                next = self.read()
-                if len(next) > 0:
-                    resp += '\n' + next
+        if st:
+            rec.mark('write', 'read')
 
+        if block:
+            resp = self.read_binary().decode(self.encoding)
+        else:
+            resp = self.read()
+            m = MultiLineResponse(lines=lines, end=end, opc=opc)
+            if multi_line or m.deterministic:
+                m.add(resp, opc and self.conn.wait_readable(0))
+                while not m.complete:
+                    if m.deterministic:
+                        next = self.read()
+                        if len(next) == 0 and not self._wait_input(0):
+                            raise SCPIError("Incomplete multi-line response: %s"
+                                            % (m.text()))
+                    elif self._wait_input(multi_line_wait):
+                        next = self.read()
+                        if len(next) == 0:
+                            continue
+                    else:
+                        break
+                    m.add(next, opc and self.conn.wait_readable(0))
+                resp = m.text()
+
+        self.readiness.completed(self, cmd, True)
         if self.verbose:
             print("%s: response: '%s'" % (__name__, resp))
+        if st:
+            rec.mark('read', 'error_check')
 
-        self._syst_err()
+        if not self.quirk_no_syst_err:
+            self._syst_err()
 
+        if st:
+            rec.mark('error_check')
+            st.end(rec)
         return resp
 
 
+    def read_stb(self):
+        """
+        Read status byte. Uses transport specific method if available
+        (USBTMC READ_STATUS_BYTE), otherwise *STB? query.
+
+        Return value: status byte (int)
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.read_stb).result()
+        stb = self.conn.read_stb()
+        if stb is not None:
+            return stb
+        self.write('*STB?')
+        r = self.read()
+        try:
+            return int(r)
+        except ValueError:
+            raise SCPIError("Invalid response to *STB?: '%s'" % (r))
+
+
+    def start_operation(self, cmd, min_interval=0.001, max_interval=0.25):
+        """
+        Start a long (overlapped) operation, and return SCPIOperation
+        handle for waiting its completion without blocking the connection
+        in *OPC? (see SCPIOperation).
+
+        Status reporting is configured (*ESE 1;*SRE 32) so that *OPC
+        (appended to the command) generates a service request when
+        operation completes.
+
+        :min_interval: initial status polling interval (seconds) [Default: 0.001]
+        :max_interval: maximum status polling interval (seconds) [Default: 0.25]
+
+        Example:
+
+            op = dev.start_operation('INIT')
+            ...
+            op.wait(timeout=30)
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.start_operation, cmd, min_interval=min_interval,
+                            max_interval=max_interval).result()
+        if self.quirk_no_opc:
+            raise SCPIError("Device does not support *OPC: %s" % (cmd))
+        if self.verbose:
+            print('%s: start_operation: %s' % (__name__, cmd))
+
+        if not self.readiness.wait_ready(self, cmd):
+            raise SCPIError("Device not ready!")
+
+        # clear pending events before starting the operation
+        if self._srq_enabled:
+            self.write('*ESR?')
+        else:
+            self.write('*ESE 1;*SRE 32;*ESR?')
+            self._srq_enabled = True
+        self.read()
+
+        self.write(cmd.rstrip(self.command_terminator) + ';*OPC')
+        return SCPIOperation(self, cmd, min_interval=min_interval,
+                             max_interval=max_interval)
+
+
+    def stream(self, query, rate=None, size=1024, overflow='drop', parse=None,
+               count=None):
+        """
+        Start streaming acquisition: send query repeatedly (at given rate)
+        in a background thread, and return SCPIStream for consuming the
+        timestamped samples (timestamp, value), either as an iterator
+        or as an asyncio async iterator. Samples are buffered in a bounded
+        ring buffer.
+
+        :rate: samples per second (None = as fast as possible) [Default: None]
+        :size: ring buffer size (samples) [Default: 1024]
+        :overflow: 'drop' (drop oldest samples) or 'block' (pause acquisition)
+                   when ring buffer is full [Default: 'drop']
+        :parse: None (string), 'float', or 'values' (array.array('d'))
+                [Default: None]
+        :count: number of samples to take [Default: None (until stopped)]
+
+        Device should not be used for other commands while streaming,
+        unless I/O worker is enabled (see enable_worker()).
+
+        Example:
+
+            with dev.stream('READ?', rate=100, parse='float') as s:
+                for ts, v in s:
+                    ...
+        """
+        if not self.readiness.wait_ready(self, query):
+            raise SCPIError("Device not ready!")
+        return SCPIStream(self, query, rate=rate, size=size, overflow=overflow,
+                          parse=parse, count=count)
+
+
+    def drain_buffer(self, sink=None, total=None, operation=None, interval=0.1,
+                     timeout=None, **options):
+        """
+        Fetch readings from instrument's reading buffer incrementally while
+        the instrument keeps acquiring, polling the buffer fill level and
+        fetching new readings in chunks into a sink (see BufferDrain).
+
+        :sink: array.array (or object with extend()), file object, or function
+               [Default: new array.array('d')]
+        :total: stop after this many readings [Default: None]
+        :operation: stop (after fetching remaining readings) when this
+                    SCPIOperation (or function returning True) completes.
+        :interval: polling interval (seconds) [Default: 0.1]
+        :timeout: maximum time (seconds) [Default: None]
+
+        Additional options (preset, count_query, fetch_query, first_index,
+        chunk, datatype, byteorder) are passed to BufferDrain. Defaults for
+        preset, count_query and fetch_query can be given in device quirk
+        profile (keys: buffer_preset, buffer_count, buffer_fetch).
+
+        Example:
+
+            op = dev.start_operation('INIT')
+            data = dev.drain_buffer(operation=op)
+
+        Return value: sink
+        """
+        p = self.quirk_profile or {}
+        for key, opt in (('buffer_preset', 'preset'), ('buffer_count', 'count_query'),
+                         ('buffer_fetch', 'fetch_query')):
+            if key in p and opt not in options:
+                options[opt] = p[key]
+        drain = BufferDrain(self, sink, **options)
+        return drain.run(total=total, operation=operation, interval=interval,
+                         timeout=timeout)
+
+
+    def enable_stats(self, hook=None):
+        """
+        Enable collection of per command statistics: timings of each phase
+        (readiness wait, write, first byte, full read, error check) and
+        number of bytes moved, keyed by normalized command header.
+
+        :hook: optional callback function called with timings (dictionary)
+               of each command/query.
+
+        Statistics are disabled by default and cause no overhead then.
+        """
+        if self._stats is None:
+            self._stats = Statistics()
+            self.conn = StatsTransport(self.conn, self._stats)
+        if hook:
+            self._stats.hooks.append(hook)
+
+
+    def disable_stats(self):
+        """
+        Disable statistics collection.
+        """
+        if self._stats is not None:
+            self.conn = self.conn.transport
+            self._stats = None
+
+
+    def stats(self, reset=False):
+        """
+        Return snapshot of the collected statistics as a dictionary
+        keyed by normalized command header (see enable_stats()).
+
+        :reset: clear statistics after taking the snapshot [Default: False]
+        """
+        if self._stats is None:
+            return {}
+        res = self._stats.snapshot()
+        if reset:
+            self._stats.reset()
+        return res
+
+
+    def batch(self, max_size=None):
+        """
+        Create a batch (SCPIBatch) for sending multiple commands and
+        queries pipelined in as few program messages as possible.
+        Readiness (*OPC?) is checked once at the end of the batch, and
+        errors are mapped back to the command that caused them.
+
+        :max_size: maximum program message size (in bytes)
+                   [Default: transport specific]
+
+        Example:
+
+            with dev.batch() as b:
+                b.command('VOLT 5')
+                v = b.query('MEAS:VOLT?')
+            print(v.result(), b.errors)
+        """
+        return SCPIBatch(self, max_size=max_size)
+
+
+    def enable_worker(self, coalesce=True):
+        """
+        Start I/O worker thread (SCPIWorker) for the device. After this
+        device I/O methods (command(), query(), query_binary(), write(),
+        read(), read_stb(), clear(), ...), batches and operation status
+        polling called from any thread are run atomically in the worker
+        thread, and queries
+        queued back-to-back (from different threads) are coalesced into
+        one program message when possible.
+
+        :coalesce: coalesce queued queries [Default: True]
+
+        Return value: SCPIWorker (for submitting requests returning Futures).
+        """
+        if self.worker is None:
+            self.worker = SCPIWorker(self, coalesce=coalesce)
+        return self.worker
+
+
+    def disable_worker(self):
+        """
+        Stop I/O worker thread (after completing queued requests).
+        """
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+
     def flush_input(self):
         """
         Flush input buffer.
@@ -287,10 +1254,27 @@ class SCPIDevice(object):
         """
         self.conn.flush_output()
 
+
+    def clear(self):
+        """
+        Device clear: abort pending operations and clear device
+        input/output buffers. Uses transport specific method if available
+        (USBTMC INITIATE_CLEAR), otherwise only flushes local buffers.
+
+        Return value: True if device clear was done successfully
+        """
+        w = self.worker
+        if w and not w.in_worker():
+            return w.submit(self.clear).result()
+        r = self.conn.clear()
+        self.conn.flush_input()
+        return bool(r)
+
     def close(self):
         """
         Close connection to device.
         """
+        self.disable_worker()
         self.conn.close()
 
 
@@ -0,0 +1,362 @@
+#
+# sink.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import array
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+from .exceptions import *
+
+
+__all__ = ['ColumnarSink']
+
+MAGIC = b'SCPICOL1'
+# magic, version, header size, block rows, channels, committed rows
+HEADER = struct.Struct('<8sIIQIxxxxQ')
+ROWS_OFFSET = 32
+VERSION = 1
+
+
+class ColumnarSink(object):
+    """
+    ColumnarSink is an append-only, memory-mapped, columnar file format for
+    logging timestamped numeric samples (one or more channels, each with
+    its own array module typecode, like 'd', 'f', 'i', 'h').
+
+    File consists of a header followed by fixed size blocks. Each block
+    stores :block_rows: rows column by column (timestamp column first),
+    so that any column range within a block can be read without copying
+    (memoryview, or NumPy array using np.frombuffer()). Timestamps must be
+    non-decreasing, and they serve as the time index: time range lookups
+    use binary search.
+
+    Number of committed rows is stored in the header, and it is updated
+    only after the row data has been written, so a process crash can only
+    lose uncommitted rows. OS crash or power loss is different: the kernel
+    may write the header page back to disk before the data pages, so rows
+    appended after the last flush() may be lost or contain garbage. flush()
+    (see :sync_rows:) syncs data to disk before the row count, so rows up
+    to the last flush() are durable.
+
+        with ColumnarSink('log.col', [('volt', 'd'), ('curr', 'f')]) as sink:
+            sink.append(time.time(), (dev.query_values('MEAS:VOLT?')[0], ...))
+    """
+
+    def __init__(self, filename, channels=None, block_rows=65536, readonly=False,
+                 sync_rows=0):
+        """
+        Open (or create) columnar sink file.
+
+        :filename: file name
+        :channels: list of (name, typecode) tuples (needed for new file only)
+        :block_rows: rows per block (for new file) [Default: 65536]
+        :readonly: open existing file for reading only [Default: False]
+        :sync_rows: flush() to disk after every N rows (0 = only on close)
+                    [Default: 0]
+        """
+        self.filename = filename
+        self.readonly = readonly
+        self.sync_rows = sync_rows
+        self.maps = []
+        self._unsynced = 0
+        exists = os.path.exists(filename) and os.path.getsize(filename) > 0
+        try:
+            if readonly or exists:
+                self.fd = os.open(filename, os.O_RDONLY if readonly else os.O_RDWR)
+            else:
+                self.fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as err:
+            raise SCPIError("Cannot open sink file: %s" % (err))
+
+        if exists or readonly:
+            self._read_header()
+        else:
+            if not channels:
+                os.close(self.fd)
+                raise SCPIError("Channels must be specified for new sink file")
+            self._create(channels, block_rows)
+        self.header = mmap.mmap(self.fd, self.header_size,
+                                access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        self.rows = self._committed()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __len__(self):
+        if self.readonly:
+            self.rows = self._committed()
+        return self.rows
+
+
+    def _layout(self):
+        self.itemsizes = [8] + [array.array(t).itemsize for n, t in self.channels]
+        self.typecodes = ['d'] + [t for n, t in self.channels]
+        self.names = dict([(n, i + 1) for i, (n, t) in enumerate(self.channels)])
+        self.names['time'] = 0
+        self.offsets = []
+        offset = 0
+        for size in self.itemsizes:
+            self.offsets.append(offset)
+            offset += size * self.block_rows
+        self.block_size = offset
+
+
+    def _create(self, channels, block_rows):
+        channels = [(str(n), t) for n, t in channels]
+        for n, t in channels:
+            if t not in 'bBhHiIlLqQfd' or n == 'time':
+                raise SCPIError("Invalid channel: %s (%s)" % (n, t))
+        rowsize = 8 + sum([array.array(t).itemsize for n, t in channels])
+        gran = mmap.ALLOCATIONGRANULARITY
+        # block size must be multiple of allocation granularity (for mmap offset)
+        step = gran // math.gcd(gran, rowsize)
+        step = step * 8 // math.gcd(step, 8)
+        self.block_rows = max(step, (block_rows + step - 1) // step * step)
+        self.channels = channels
+        self.header_size = max(gran, 65536)
+        self._layout()
+        meta = json.dumps({'channels': channels, 'byteorder': sys.byteorder}).encode('utf-8')
+        if HEADER.size + 4 + len(meta) > self.header_size:
+            raise SCPIError("Too many channels")
+        hdr = HEADER.pack(MAGIC, VERSION, self.header_size, self.block_rows,
+                          len(channels), 0) + struct.pack('<I', len(meta)) + meta
+        os.ftruncate(self.fd, self.header_size)
+        os.pwrite(self.fd, hdr, 0)
+
+
+    def _read_header(self):
+        hdr = os.pread(self.fd, HEADER.size + 4, 0)
+        if len(hdr) < HEADER.size + 4:
+            raise SCPIError("Invalid sink file: %s" % (self.filename))
+        magic, version, self.header_size, self.block_rows, n, rows = HEADER.unpack(hdr[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise SCPIError("Invalid sink file: %s" % (self.filename))
+        size = struct.unpack('<I', hdr[HEADER.size:])[0]
+        meta = json.loads(os.pread(self.fd, size, HEADER.size + 4).decode('utf-8'))
+        if meta['byteorder'] != sys.byteorder:
+            raise SCPIError("Sink file byte order (%s) not supported" % (meta['byteorder']))
+        self.channels = [tuple(c) for c in meta['channels']]
+        self._layout()
+
+
+    def _committed(self):
+        return struct.unpack_from('<Q', self.header, ROWS_OFFSET)[0]
+
+
+    def _block(self, i):
+        """
+        Return mmap of block i (mapping it if needed).
+        """
+        while len(self.maps) <= i:
+            n = len(self.maps)
+            offset = self.header_size + n * self.block_size
+            if os.fstat(self.fd).st_size < offset + self.block_size:
+                if self.readonly:
+                    raise SCPIError("Sink file truncated: %s" % (self.filename))
+                os.ftruncate(self.fd, offset + self.block_size)
+            self.maps.append(mmap.mmap(self.fd, self.block_size, offset=offset,
+                                       access=mmap.ACCESS_READ if self.readonly
+                                       else mmap.ACCESS_WRITE))
+        return self.maps[i]
+
+
+    def _column(self, block, col):
+        off = self.offsets[col]
+        return memoryview(self._block(block))[off:off + self.block_rows * self.itemsizes[col]] \
+            .cast(self.typecodes[col])
+
+
+    def append(self, timestamp, values):
+        """
+        Append a row: timestamp and channel values (sequence in channel order,
+        or dictionary of channel name: value).
+        """
+        if self.readonly:
+            raise SCPIError("Sink opened read only")
+        if isinstance(values, dict):
+            values = [values[n] for n, t in self.channels]
+        if len(values) != len(self.channels):
+            raise SCPIError("Expected %d values, got %d" % (len(self.channels), len(values)))
+        row = self.rows
+        if row > 0 and timestamp < self.time(row - 1):
+            raise SCPIError("Timestamps must be non-decreasing")
+        b, i = divmod(row, self.block_rows)
+        m = self._block(b)
+        struct.pack_into('d', m, i * 8, timestamp)
+        for col, v in enumerate(values, 1):
+            t = self.typecodes[col]
+            struct.pack_into(t, m, self.offsets[col] + i * self.itemsizes[col], v)
+        self.rows = row + 1
+        # commit row (after data has been written)
+        struct.pack_into('<Q', self.header, ROWS_OFFSET, self.rows)
+        if self.sync_rows:
+            self._unsynced += 1
+            if self._unsynced >= self.sync_rows:
+                self.flush()
+
+
+    def extend(self, timestamps, columns):
+        """
+        Append multiple rows: timestamps (sequence) and list of channel
+        value sequences (array.array, NumPy arrays, ..., in channel order),
+        copying data block by block.
+        """
+        if self.readonly:
+            raise SCPIError("Sink opened read only")
+        cols = [array.array('d', timestamps)]
+        for col, values in enumerate(columns, 1):
+            t = self.typecodes[col]
+            if isinstance(values, array.array) and values.typecode == t:
+                cols.append(values)
+            else:
+                cols.append(array.array(t, values))
+        count = len(cols[0])
+        if len(cols) != len(self.typecodes) or [c for c in cols if len(c) != count]:
+            raise SCPIError("Invalid number of channels or values")
+        if count == 0:
+            return
+        if (self.rows > 0 and cols[0][0] < self.time(self.rows - 1)) or \
+           [1 for i in range(1, count) if cols[0][i] < cols[0][i - 1]]:
+            raise SCPIError("Timestamps must be non-decreasing")
+        done = 0
+        while done < count:
+            b, i = divmod(self.rows + done, self.block_rows)
+            n = min(self.block_rows - i, count - done)
+            for col, c in enumerate(cols):
+                self._column(b, col)[i:i + n] = memoryview(c)[done:done + n]
+            done += n
+        self.rows += count
+        struct.pack_into('<Q', self.header, ROWS_OFFSET, self.rows)
+        if self.sync_rows:
+            self._unsynced += count
+            if self._unsynced >= self.sync_rows:
+                self.flush()
+
+
+    def time(self, row):
+        """
+        Return timestamp of a row.
+        """
+        b, i = divmod(row, self.block_rows)
+        return struct.unpack_from('d', self._block(b), i * 8)[0]
+
+
+    def time_range(self, start=None, end=None):
+        """
+        Return range of rows (start, stop) with timestamps
+        start <= timestamp < end.
+        """
+        rows = len(self)
+        lo = 0 if start is None else self._bisect(start, rows)
+        hi = rows if end is None else self._bisect(end, rows)
+        return (lo, hi)
+
+
+    def _bisect(self, t, rows):
+        lo, hi = 0, rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    def slices(self, channel, start=0, stop=None):
+        """
+        Return list of zero-copy memoryview slices (one per block) of
+        a channel ('time' for timestamps) for rows start..stop.
+        """
+        col = self.names[channel]
+        rows = len(self)
+        stop = rows if stop is None else min(stop, rows)
+        res = []
+        row = start
+        while row < stop:
+            b, i = divmod(row, self.block_rows)
+            n = min(self.block_rows - i, stop - row)
+            res.append(self._column(b, col)[i:i + n])
+            row += n
+        return res
+
+
+    def read(self, channel, start=0, stop=None, numpy=False):
+        """
+        Return channel values for rows start..stop as memoryview (or NumPy
+        array if numpy=True). Data is not copied if the range is within
+        a single block, otherwise values are copied into a new array.
+        """
+        parts = self.slices(channel, start, stop)
+        typecode = self.typecodes[self.names[channel]]
+        if numpy:
+            import numpy as np
+            if len(parts) == 1:
+                return np.frombuffer(parts[0], dtype=typecode)
+            if not parts:
+                return np.empty(0, dtype=typecode)
+            return np.concatenate([np.frombuffer(p, dtype=typecode) for p in parts])
+        if len(parts) == 1:
+            return parts[0]
+        a = array.array(typecode)
+        for p in parts:
+            a.frombytes(p.cast('B'))
+        return memoryview(a)
+
+
+    def flush(self):
+        """
+        Sync data, and then the committed row count, to disk.
+        """
+        if self.readonly:
+            return
+        for m in self.maps:
+            m.flush()
+        self.header.flush()
+        self._unsynced = 0
+
+
+    def close(self):
+        """
+        Flush and close file. (Memoryviews of the data must be released
+        before closing.)
+        """
+        if self.fd is None:
+            return
+        self.flush()
+        for m in self.maps:
+            m.close()
+        self.header.close()
+        self.maps = []
+        os.close(self.fd)
+        self.fd = None
+
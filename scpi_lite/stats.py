@@ -0,0 +1,314 @@
+#
+# stats.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import re
+import time
+
+from .transport import TransportWrapper
+
+
+__all__ = ['Histogram', 'Statistics', 'normalize_header']
+
+PHASES = ('ready', 'write', 'first_byte', 'read', 'error_check', 'total')
+
+MNEMONIC_RE = re.compile(r'^([*A-Z]+)(.*)$')
+
+
+def normalize_header(cmd):
+    """
+    Return normalized command header (short form, upper case) of a
+    SCPI command. For example: 'MEASure:VOLTage? 10' -> 'MEAS:VOLT?'
+    """
+    header = cmd.strip().split(None, 1)[0] if cmd.strip() else ''
+    header = header.split(';', 1)[0].upper().lstrip(':')
+    res = []
+    for mnemonic in header.split(':'):
+        m = MNEMONIC_RE.match(mnemonic)
+        if m and not mnemonic.startswith('*'):
+            alpha = m.group(1)
+            if len(alpha) > 4:
+                alpha = alpha[:3] if alpha[3] in 'AEIOU' else alpha[:4]
+            mnemonic = alpha + m.group(2)
+        res.append(mnemonic)
+    return ':'.join(res)
+
+
+
+class Histogram(object):
+    """
+    Low overhead histogram of durations (in seconds) using
+    logarithmic (power of 2 microseconds) buckets.
+    """
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+
+    def add(self, value):
+        """
+        Add value (seconds) to the histogram.
+        """
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.buckets[min(int(value * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+
+
+    def percentile(self, p):
+        """
+        Return (upper bound estimate of) the :p: percentile value.
+        """
+        if self.count < 1:
+            return None
+        limit = self.count * p / 100.0
+        n = 0
+        for b, c in enumerate(self.buckets):
+            n += c
+            if n >= limit:
+                return min((1 << b) / 1e6, self.max)
+        return self.max
+
+
+    def snapshot(self):
+        """
+        Return histogram summary as a dictionary.
+        """
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(self.buckets),
+        }
+
+
+
+class Record(object):
+    """
+    Timings of a single command/query.
+    """
+
+    __slots__ = ('command', 'header', 'start', 'last', 'phase', 'phases',
+                 'bytes_written', 'bytes_read')
+
+    def __init__(self, command):
+        self.command = command
+        self.header = normalize_header(command)
+        self.start = self.last = time.perf_counter()
+        self.phase = 'ready'
+        self.phases = {}
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+
+    def mark(self, phase, next_phase=None):
+        """
+        Mark end of :phase:.
+        """
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+        self.phase = next_phase
+
+
+    def first_byte(self):
+        """
+        Mark arrival of the first byte of the response.
+        """
+        if 'first_byte' not in self.phases:
+            self.phases['first_byte'] = time.perf_counter() - self.last
+
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'header': self.header,
+            'phases': dict(self.phases),
+            'bytes_written': self.bytes_written,
+            'bytes_read': self.bytes_read,
+        }
+
+
+
+class Statistics(object):
+    """
+    Statistics collects per command (header) phase timings and number
+    of bytes moved. Optional hooks are called with the timings (dictionary)
+    of each command/query.
+    """
+
+    def __init__(self, hook=None):
+        self.hooks = []
+        if hook:
+            self.hooks.append(hook)
+        self.current = None
+        self.reset()
+
+
+    def reset(self):
+        """
+        Clear all collected statistics.
+        """
+        self.commands = {}
+
+
+    def begin(self, command):
+        """
+        Start timing a command. Returns Record.
+        """
+        self.current = Record(command)
+        return self.current
+
+
+    def end(self, rec):
+        """
+        Finish timing a command, update statistics and call hooks.
+        """
+        rec.phases['total'] = time.perf_counter() - rec.start
+        self.current = None
+
+        s = self.commands.get(rec.header)
+        if s is None:
+            s = self.commands[rec.header] = {
+                'count': 0, 'bytes_written': 0, 'bytes_read': 0, 'phases': {}}
+        s['count'] += 1
+        s['bytes_written'] += rec.bytes_written
+        s['bytes_read'] += rec.bytes_read
+        for phase, value in rec.phases.items():
+            h = s['phases'].get(phase)
+            if h is None:
+                h = s['phases'][phase] = Histogram()
+            h.add(value)
+
+        for hook in self.hooks:
+            hook(rec.as_dict())
+
+
+    def snapshot(self):
+        """
+        Return snapshot of the statistics as a dictionary (keyed by
+        normalized command header).
+        """
+        res = {}
+        for header, s in self.commands.items():
+            res[header] = {
+                'count': s['count'],
+                'bytes_written': s['bytes_written'],
+                'bytes_read': s['bytes_read'],
+                'phases': dict([(p, h.snapshot()) for p, h in s['phases'].items()]),
+            }
+        return res
+
+
+
+class StatsTransport(TransportWrapper):
+    """
+    StatsTransport wraps SCPITransport counting bytes moved and
+    measuring response first byte latency for the current Record.
+
+    Transport is only wrapped when statistics are enabled, so there
+    is no overhead when they are disabled.
+    """
+
+    def __init__(self, transport, stats):
+        super().__init__(transport)
+        self.stats = stats
+
+
+    def _first_byte(self, rec):
+        """
+        Wait for the first byte of the response, returns False on timeout.
+        """
+        if (rec is not None and rec.phase == 'read' and 'first_byte' not in rec.phases
+                and not self.transport.MESSAGE_BASED):
+            if not self.transport.wait_readable(self.transport.timeout):
+                return False
+            rec.first_byte()
+        return True
+
+
+    def read(self):
+        rec = self.stats.current
+        if not self._first_byte(rec):
+            # timeout
+            return b''
+        r = self.transport.read()
+        if rec is not None:
+            rec.bytes_read += len(r)
+        return r
+
+
+    def read_into(self, buffer):
+        rec = self.stats.current
+        if not self._first_byte(rec):
+            # timeout
+            return 0
+        n = self.transport.read_into(buffer)
+        if rec is not None:
+            rec.bytes_read += n
+        return n
+
+
+    def read_exact_into(self, buffer):
+        rec = self.stats.current
+        n = self.transport.read_exact_into(buffer)
+        if rec is not None:
+            if rec.phase == 'read':
+                rec.first_byte()
+            rec.bytes_read += n
+        return n
+
+
+    def write(self, data):
+        rec = self.stats.current
+        if rec is not None:
+            rec.bytes_written += len(data)
+        return self.transport.write(data)
+
+
+    def write_parts(self, parts):
+        rec = self.stats.current
+        if rec is not None:
+            rec.bytes_written += sum([memoryview(p).nbytes for p in parts])
+        return self.transport.write_parts(parts)
+
+
+    def write_chunks(self, chunks):
+        n = self.transport.write_chunks(chunks)
+        rec = self.stats.current
+        if rec is not None:
+            rec.bytes_written += n
+        return n
@@ -0,0 +1,289 @@
+#
+# stream.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import array
+import asyncio
+import threading
+import time
+
+from .values import parse_values
+from .exceptions import *
+
+
+__all__ = ['SCPIStream']
+
+
+class SCPIStream(object):
+    """
+    SCPIStream runs a query repeatedly (at given rate) in a background
+    thread, storing timestamped responses into a bounded preallocated ring
+    buffer. Samples are consumed by iterating the stream, either as a
+    generator or as an asyncio async iterator. Each sample is a tuple
+    (timestamp, value).
+
+    Readiness check and error check (SYST:ERR?) are not done for each
+    sample, only the query itself is sent. If a response is not received
+    within the timeout, device clear (see SCPIDevice.clear()) is done
+    before the next query, or if device clear is not supported (or fails),
+    the late response is waited (upto timeout) and discarded, so it is
+    not taken as the response to the next query.
+
+    When ring buffer is full, either the oldest sample is dropped
+    (overflow='drop') or the reader waits for the consumer (overflow='block').
+    Counters of dropped samples and missed deadlines (samples that could not
+    be taken at the requested rate) are kept.
+
+    Stream is normally created using SCPIDevice.stream():
+
+        with dev.stream('READ?', rate=100, parse='float') as s:
+            for ts, v in s:
+                ...
+    """
+
+    def __init__(self, device, query, rate=None, size=1024, overflow='drop',
+                 parse=None, count=None):
+        """
+        Start streaming.
+
+        :device: SCPIDevice
+        :query: query to send
+        :rate: samples per second (None = as fast as possible) [Default: None]
+        :size: ring buffer size (samples) [Default: 1024]
+        :overflow: 'drop' (drop oldest samples) or 'block' (wait for the
+                   consumer) when ring buffer is full. [Default: 'drop']
+        :parse: None (response as string), 'float' (response as float), or
+                'values' (response as array.array('d')) [Default: None]
+        :count: stop after this many samples [Default: None (no limit)]
+        """
+        if overflow not in ('drop', 'block'):
+            raise SCPIError("Invalid overflow policy: '%s'" % (overflow))
+        if parse not in (None, 'float', 'values'):
+            raise SCPIError("Invalid parse option: '%s'" % (parse))
+        self.device = device
+        self.query = query
+        self.period = 1.0 / rate if rate else 0.0
+        self.size = size
+        self.overflow = overflow
+        self.parse = parse
+        self.count = count
+        self.times = array.array('d', [0.0]) * size
+        if parse == 'float':
+            self.data = array.array('d', [0.0]) * size
+        else:
+            self.data = [None] * size
+        self.head = 0
+        self.tail = 0
+        self.samples = 0
+        self.dropped = 0
+        self.missed = 0
+        self.timeouts = 0
+        self.error = None
+        self.running = True
+        self.cond = threading.Condition()
+        self._async_waiters = []
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name='SCPIStream')
+        self.thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+    def stats(self):
+        """
+        Return stream counters as a dictionary.
+        """
+        return {'samples': self.samples, 'dropped': self.dropped,
+                'missed': self.missed, 'timeouts': self.timeouts,
+                'buffered': self.head - self.tail}
+
+
+    def stop(self):
+        """
+        Stop streaming (buffered samples can still be consumed).
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+        self._wake_async()
+
+
+    def _sample(self):
+        dev = self.device
+        dev.write(self.query)
+        ts = time.time()
+        if self.parse:
+            v = dev.conn.read()
+            if not v:
+                self._resync()
+                return (ts, None)
+            v = parse_values(v)
+            if self.parse == 'float':
+                v = v[0] if len(v) else float('nan')
+        else:
+            v = dev.read()
+            if not v:
+                self._resync()
+                return (ts, None)
+        return (ts, v)
+
+
+    def _resync(self):
+        """
+        Discard late response to the query after a timeout.
+        """
+        dev = self.device
+        if dev.clear():
+            return
+        if dev.conn.wait_readable(dev.conn.timeout):
+            dev.conn.read()
+
+
+    def _put(self, ts, v):
+        with self.cond:
+            if self.head - self.tail >= self.size:
+                if self.overflow == 'block':
+                    while self.running and self.head - self.tail >= self.size:
+                        self.cond.wait()
+                    if not self.running:
+                        return
+                else:
+                    self.tail += 1
+                    self.dropped += 1
+            i = self.head % self.size
+            self.times[i] = ts
+            self.data[i] = v
+            self.head += 1
+            self.samples += 1
+            self.cond.notify_all()
+        self._wake_async()
+
+
+    def _wake_async(self):
+        with self.cond:
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(self._set_waiter, fut)
+
+
+    @staticmethod
+    def _set_waiter(fut):
+        if not fut.done():
+            fut.set_result(None)
+
+
+    def _run(self):
+        dev = self.device
+        w = dev.worker
+        next = time.monotonic()
+        try:
+            while self.running and (self.count is None or self.samples < self.count):
+                if self.period:
+                    now = time.monotonic()
+                    if now < next:
+                        time.sleep(next - now)
+                    elif now - next >= self.period:
+                        # could not keep up with the requested rate
+                        late = int((now - next) / self.period)
+                        self.missed += late
+                        next += late * self.period
+                    next += self.period
+                if w:
+                    ts, v = w.submit(self._sample).result()
+                else:
+                    ts, v = self._sample()
+                if v is None:
+                    self.timeouts += 1
+                    continue
+                self._put(ts, v)
+        except Exception as err:
+            self.error = err
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self._wake_async()
+
+
+    def _get(self):
+        i = self.tail % self.size
+        sample = (self.times[i], self.data[i])
+        if self.parse != 'float':
+            self.data[i] = None
+        self.tail += 1
+        self.cond.notify_all()
+        return sample
+
+
+    def get(self, timeout=None):
+        """
+        Get next sample (timestamp, value), waiting upto :timeout: seconds.
+        Returns None if no sample is available (or stream has ended).
+        """
+        with self.cond:
+            if self.head == self.tail:
+                self.cond.wait_for(lambda: self.head != self.tail or not self.running,
+                                   timeout)
+            if self.head == self.tail:
+                if self.error:
+                    raise SCPIError("Stream failed: %s" % (self.error))
+                return None
+            return self._get()
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        sample = self.get()
+        if sample is None:
+            raise StopIteration
+        return sample
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self):
+        while True:
+            with self.cond:
+                if self.head != self.tail:
+                    return self._get()
+                if not self.running:
+                    if self.error:
+                        raise SCPIError("Stream failed: %s" % (self.error))
+                    raise StopAsyncIteration
+                loop = asyncio.get_running_loop()
+                fut = loop.create_future()
+                self._async_waiters.append((loop, fut))
+            await fut
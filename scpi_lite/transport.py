@@ -20,6 +20,13 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import asyncio
+import select
+import time
+
+from .exceptions import *
+
+
 class SCPITransport:
     """
     A base class for implementing a transport for SCPIDevice class.
@@ -27,6 +34,17 @@ class SCPITransport:
 
     conn = None
     verbose = 0
+    _poll = None
+
+    # maximum size of a program message sent to the device at once
+    MAX_MESSAGE_SIZE = 1024
+    # chunk size for sending large messages (see write_chunks())
+    WRITE_CHUNK_SIZE = 1024*1024
+    # device sends data only when requested by a read (USBTMC)
+    MESSAGE_BASED = False
+    # multiple messages can be sent before reading responses
+    # (HiSLIP overlapped mode)
+    pipelined = False
 
     def __init__(self, device):
         """
@@ -49,12 +67,157 @@ class SCPITransport:
 
         raise NotImplementedError()
 
+    def read_into(self, buffer):
+        """
+        Read data (response) from the device into buffer (any writable
+        object supporting buffer protocol), the same data read() would
+        return. Returns the number of bytes stored in the buffer.
+
+        SCPITransportError is raised if response doesn't fit in the buffer
+        (response is discarded).
+
+        Transports should override this to copy the response directly into
+        the buffer, this default implementation copies the result of read().
+        """
+        return self._store(buffer, self.read())
+
+    @staticmethod
+    def _store(buffer, data, start=0, end=None):
+        """
+        Copy response (data[start:end]) into buffer, returns number
+        of bytes copied.
+        """
+        view = memoryview(buffer).cast('B')
+        if end is None:
+            end = len(data)
+        n = end - start
+        if n > len(view):
+            raise SCPITransportError('Response does not fit in buffer (%d > %d bytes)'
+                                     % (n, len(view)))
+        with memoryview(data) as src:
+            view[:n] = src[start:end]
+        return n
+
+    @staticmethod
+    def _rstrip_end(data, start, end):
+        """
+        Return end position of data[start:end] excluding trailing whitespace
+        (without making a copy like rstrip()).
+        """
+        while end > start and data[end - 1] in b' \t\n\r\x0b\x0c':
+            end -= 1
+        return end
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from the device into buffer
+        (any writable object supporting buffer protocol).
+
+        SCPITransportError is raised if device doesn't send the data
+        within the timeout.
+        """
+
+        raise NotImplementedError()
+
+    def read_exact(self, size):
+        """
+        Read exactly :size: bytes from the device.
+        """
+        buf = bytearray(size)
+        self.read_exact_into(buf)
+        return buf
+
+    def write_parts(self, parts):
+        """
+        Send data consisting of multiple parts (bytes-like objects)
+        as a single message to the device.
+        """
+        return self.write(b''.join(parts))
+
+    def write_chunks(self, chunks):
+        """
+        Send (large) message to the device in chunks, from an iterable of
+        bytes-like objects, that may be generated on demand reusing buffers
+        (chunk must stay valid until the chunk after the next one has been
+        requested). Returns number of bytes sent.
+
+        Chunks are written as they come on stream based transports, message
+        based transports should override this to send chunks as parts of
+        a single message (default implementation joins the chunks).
+        """
+        if self.MESSAGE_BASED:
+            return self.write(b''.join([bytes(c) for c in chunks]))
+        n = 0
+        for c in chunks:
+            self.write(c)
+            n += len(c)
+        return n
+
     def pending_input(self):
         """
         Return the number of bytes in the input buffer.
         """
         return 0
 
+    def wait_readable(self, timeout):
+        """
+        Wait upto :timeout: seconds for input to become available.
+        Returns True if there is input available.
+
+        Transports should override this with an event driven implementation
+        (see _wait_fd()), this default implementation polls pending_input().
+        """
+        end = time.monotonic() + timeout
+        while self.pending_input() < 1:
+            if time.monotonic() >= end:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _wait_fd(self, fd, timeout):
+        """
+        Wait upto :timeout: seconds for file descriptor :fd: to become
+        readable (without polling). Returns True if fd is readable.
+        """
+        if not hasattr(select, 'poll'):
+            r, w, x = select.select([fd], [], [], timeout)
+            return len(r) > 0
+        if self._poll is None:
+            self._poll = select.poll()
+            self._poll.register(fd, select.POLLIN | select.POLLPRI)
+        return len(self._poll.poll(max(0, int(timeout * 1000 + 0.999)))) > 0
+
+    def read_stb(self):
+        """
+        Read status byte out-of-band (without using the message channel,
+        like USBTMC READ_STATUS_BYTE request).
+        Returns status byte, or None if not supported by the transport.
+        """
+        return None
+
+    def wait_srq(self, timeout):
+        """
+        Wait upto :timeout: seconds for a service request (SRQ).
+        Returns True if SRQ was received, False on timeout,
+        or None if not supported by the transport.
+        """
+        return None
+
+    def srq_fileno(self):
+        """
+        Return file descriptor that becomes readable (POLLIN or POLLPRI)
+        when service request is received, or None if not supported.
+        """
+        return None
+
+    def clear(self):
+        """
+        Device clear: abort pending operations and clear device
+        input/output buffers (like USBTMC INITIATE_CLEAR or IEEE-488 SDC).
+        Returns True if successful, or None if not supported by the transport.
+        """
+        return None
+
     def flush_input(self):
         """
         Flush input buffer, discarding all its contents.
@@ -71,3 +234,192 @@ class SCPITransport:
         """
 
 
+
+class TransportWrapper(SCPITransport):
+    """
+    A base class for transports that wrap another transport (to collect
+    statistics, record exchanges, etc.).
+
+    Transport methods and attributes are passed through to the wrapped
+    transport, subclasses override only the methods they intercept.
+    Helpers implemented using other methods (read_exact()) are not passed
+    through, so they go through the overridden methods.
+    """
+
+    # SCPITransport methods and attributes passed through to the wrapped transport
+    PASSTHROUGH_METHODS = ('read', 'write', 'read_into', 'read_exact_into',
+                           'write_parts', 'write_chunks', 'pending_input',
+                           'wait_readable', 'read_stb', 'wait_srq', 'srq_fileno',
+                           'clear', 'flush_input', 'flush_output', 'close')
+    PASSTHROUGH_ATTRS = ('conn', 'verbose', 'MAX_MESSAGE_SIZE', 'WRITE_CHUNK_SIZE',
+                         'MESSAGE_BASED', 'pipelined')
+
+    def __init__(self, transport):
+        """
+        Wrap given transport.
+        """
+        self.transport = transport
+
+    def __getattr__(self, name):
+        # attributes not defined in SCPITransport (timeout, terminator, ...)
+        return getattr(self.transport, name)
+
+
+def _passthrough_method(name):
+    def method(self, *args):
+        return getattr(self.transport, name)(*args)
+    method.__name__ = name
+    method.__doc__ = getattr(SCPITransport, name).__doc__
+    return method
+
+
+for _name in TransportWrapper.PASSTHROUGH_METHODS:
+    setattr(TransportWrapper, _name, _passthrough_method(_name))
+for _name in TransportWrapper.PASSTHROUGH_ATTRS:
+    setattr(TransportWrapper, _name,
+            property(lambda self, name=_name: getattr(self.transport, name)))
+del _name
+
+
+
+class AsyncSCPITransport:
+    """
+    A base class for implementing an asyncio transport for AsyncSCPIDevice.
+
+    Transport implementation feeds received data into the receive buffer
+    using _feed() (typically from an event loop callback). This class then
+    takes care of framing the responses on the terminator.
+    """
+
+    conn = None
+    verbose = 0
+    timeout = 5
+    terminator = b'\n'
+
+    # maximum size of a program message sent to the device at once
+    MAX_MESSAGE_SIZE = 1024
+
+    def __init__(self, timeout=5, verbose=False):
+        self.timeout = timeout
+        self.verbose = verbose
+        self.rxbuf = bytearray()
+        self.scan_pos = 0
+        self._waiter = None
+        self._error = None
+
+    async def open(self):
+        """
+        Open connection. A transport implementation must override this.
+        """
+
+        raise NotImplementedError()
+
+    def _feed(self, data):
+        """
+        Add received data to the receive buffer.
+        """
+        self.rxbuf.extend(data)
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _set_error(self, exc):
+        """
+        Report connection error (or lost connection) to the reader.
+        """
+        self._error = exc
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _recv(self, timeout):
+        """
+        Wait for more data to arrive into the receive buffer.
+        Returns number of bytes received (0 on timeout).
+        """
+        if self._error:
+            raise self._error
+        n = len(self.rxbuf)
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiter = None
+        if self._error and len(self.rxbuf) == n:
+            raise self._error
+        return len(self.rxbuf) - n
+
+    async def read(self):
+        """
+        Read data (reponse) from the device.
+        Read until response terminator received.
+
+        Returns the data excluding any trailing whitespace.
+        """
+        term = self.terminator
+        while True:
+            pos = self.rxbuf.find(term, self.scan_pos)
+            if pos >= 0:
+                r = bytes(self.rxbuf[:pos])
+                del self.rxbuf[:pos + len(term)]
+                self.scan_pos = 0
+                break
+            self.scan_pos = max(0, len(self.rxbuf) - len(term) + 1)
+            if await self._recv(self.timeout) == 0:
+                # timeout, return whatever was received so far
+                r = bytes(self.rxbuf)
+                self.rxbuf.clear()
+                self.scan_pos = 0
+                break
+
+        if self.verbose:
+            print('Read: %d: %s' % (len(r), r))
+        return r.rstrip()
+
+    async def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from the device into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        while len(self.rxbuf) < len(view):
+            if await self._recv(self.timeout) == 0:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (len(self.rxbuf), len(view)))
+        view[:] = self.rxbuf[:len(view)]
+        del self.rxbuf[:len(view)]
+        self.scan_pos = 0
+        return len(view)
+
+    async def write(self, data):
+        """
+        Send data (command) to the device.
+        """
+
+        raise NotImplementedError()
+
+    async def wait_readable(self, timeout):
+        """
+        Wait upto :timeout: seconds for input to become available.
+        Returns True if there is input available.
+        """
+        if len(self.rxbuf) > 0:
+            return True
+        return await self._recv(timeout) > 0
+
+    def pending_input(self):
+        """
+        Return the number of bytes in the input buffer.
+        """
+        return len(self.rxbuf)
+
+    async def flush_input(self):
+        """
+        Flush input buffer, discarding all its contents.
+        """
+        self.rxbuf.clear()
+        self.scan_pos = 0
+
+    async def close(self):
+        """
+        Close connection.
+        """
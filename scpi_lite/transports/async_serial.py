@@ -0,0 +1,112 @@
+#
+# async_serial.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import os
+import serial
+
+from ..transport import *
+from ..exceptions import *
+
+
+class AsyncSerialDevice(AsyncSCPITransport):
+    """
+    AsyncSerialDevice class implements asyncio Serial (RS-232/TTL) transport.
+
+    Serial port is used in non-blocking mode and watched by the event loop
+    (works only on POSIX systems).
+    """
+
+    MAX_MESSAGE_SIZE = 256
+
+    def __init__(self, device, timeout=5, verbose=0, **args):
+        """
+        Create asyncio serial transport for the specified device.
+        Connection is opened using open().
+
+        :device: string specifying serial port (/dev/tty*, ...)
+        :timeout: timeout for device to respond in seconds [Default: 5 seconds]
+
+        Other options (baudrate, bytesize, ...) are same as for SerialDevice.
+        """
+        super().__init__(timeout=timeout, verbose=verbose)
+        self.device = device
+        self.args = args
+        self.args.pop('terminator', None)
+        self.fd = None
+
+
+    async def open(self):
+        """
+        Open serial port.
+        """
+        try:
+            self.conn = serial.Serial(port=self.device, timeout=0,
+                                      **self.args)
+        except (OSError, ValueError, serial.SerialException) as err:
+            raise SCPITransportError(err)
+        self.fd = self.conn.fileno()
+        os.set_blocking(self.fd, False)
+        asyncio.get_running_loop().add_reader(self.fd, self._on_readable)
+
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            self._set_error(SCPITransportError(err))
+            return
+        if self.verbose > 1:
+            print('Received: %s' % (data))
+        self._feed(data)
+
+
+    async def write(self, data):
+        """
+        Write data (command) to device.
+        """
+        if self.verbose:
+            print('Write: %d: %s' % (len(data), data))
+        try:
+            res = self.conn.write(data)
+        except serial.SerialException as err:
+            raise SCPITransportError(err)
+        return res
+
+
+    async def flush_input(self):
+        """
+        Flush serial input buffer.
+        """
+        self.conn.reset_input_buffer()
+        await super().flush_input()
+
+
+    async def close(self):
+        """
+        Close serial connection.
+        """
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            self.fd = None
+        return self.conn.close()
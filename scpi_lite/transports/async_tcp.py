@@ -0,0 +1,103 @@
+#
+# async_tcp.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import socket
+
+from ..transport import *
+from ..exceptions import *
+
+
+class _Protocol(asyncio.Protocol):
+    """
+    asyncio protocol feeding received data to AsyncTCPDevice.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def data_received(self, data):
+        self.device._feed(data)
+
+    def connection_lost(self, exc):
+        self.device._set_error(SCPITransportError(exc or 'Connection closed by device'))
+
+
+
+class AsyncTCPDevice(AsyncSCPITransport):
+    """
+    AsyncTCPDevice class implements asyncio TCP/IP transport.
+    """
+
+    MAX_MESSAGE_SIZE = 4096
+    DEFAULT_PORT = 5555
+
+
+    def __init__(self, device, port, timeout=5, verbose=False):
+        """
+        Create asyncio TCP transport for the specified device.
+        Connection is opened using open().
+
+        :device: Target device hostname or IP address.
+        :port: Target device TCP port.
+        :timeout: Timeout for device to respond in seconds [Default: 5 seconds]
+        """
+        super().__init__(timeout=timeout, verbose=verbose)
+        self.host = device
+        self.port = port or self.DEFAULT_PORT
+
+
+    async def open(self):
+        """
+        Open TCP connection to device.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            self.conn, protocol = await asyncio.wait_for(
+                loop.create_connection(lambda: _Protocol(self), self.host, self.port),
+                self.timeout)
+        except (OSError, asyncio.TimeoutError) as err:
+            errmsg = "Connection to %s:%s failed: %s" % (self.host, self.port, err)
+            raise SCPITransportError(errmsg)
+        sock = self.conn.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+    async def write(self, data):
+        """
+        Write data (command) to device.
+        """
+
+        if self.verbose:
+            print('Write: %d: %s' % (len(data), data))
+
+        if self._error:
+            raise self._error
+        self.conn.write(data)
+
+
+    async def close(self):
+        """
+        Close TCP connection.
+        """
+        if self.conn:
+            self.conn.close()
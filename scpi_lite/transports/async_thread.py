@@ -0,0 +1,87 @@
+#
+# async_thread.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+
+from ..transport import *
+from ..exceptions import *
+
+
+class AsyncThreadDevice(AsyncSCPITransport):
+    """
+    AsyncThreadDevice class wraps a (blocking) SCPITransport as an asyncio
+    transport by running its blocking I/O in the event loop's default
+    executor (thread pool).
+
+    This is used for the USBTMC transports, since USBTMC reads are blocking
+    bulk transfers that can't be watched by the event loop (and for the
+    replay transport).
+    """
+
+    def __init__(self, transport, timeout=5, verbose=False):
+        """
+        Create asyncio transport for a blocking transport.
+
+        :transport: function returning opened SCPITransport instance
+                    (called in a worker thread).
+        """
+        super().__init__(timeout=timeout, verbose=verbose)
+        self.transport = transport
+
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+    async def open(self):
+        """
+        Open connection.
+        """
+        self.conn = await self._run(self.transport)
+        self.MAX_MESSAGE_SIZE = self.conn.MAX_MESSAGE_SIZE
+
+
+    async def read(self):
+        return await self._run(self.conn.read)
+
+
+    async def read_exact_into(self, buffer):
+        return await self._run(self.conn.read_exact_into, buffer)
+
+
+    async def write(self, data):
+        return await self._run(self.conn.write, data)
+
+
+    async def wait_readable(self, timeout):
+        return await self._run(self.conn.wait_readable, timeout)
+
+
+    def pending_input(self):
+        return self.conn.pending_input()
+
+
+    async def flush_input(self):
+        return await self._run(self.conn.flush_input)
+
+
+    async def close(self):
+        return await self._run(self.conn.close)
@@ -0,0 +1,656 @@
+#
+# hislip.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import re
+import select
+import socket
+import struct
+import threading
+
+from ..transport import *
+from ..exceptions import *
+
+
+HISLIP_PORT = 4880
+PROTOCOL_VERSION = 0x0100
+VENDOR_ID = b'SL'
+MESSAGE_ID_START = 0xffffff00
+
+# message header: prologue, message type, control code, message parameter,
+# payload length
+HEADER = struct.Struct('>2sBBIQ')
+PROLOGUE = b'HS'
+
+# message types
+INITIALIZE = 0
+INITIALIZE_RESPONSE = 1
+FATAL_ERROR = 2
+ERROR = 3
+ASYNC_LOCK = 4
+ASYNC_LOCK_RESPONSE = 5
+DATA = 6
+DATA_END = 7
+DEVICE_CLEAR_COMPLETE = 8
+DEVICE_CLEAR_ACKNOWLEDGE = 9
+ASYNC_REMOTE_LOCAL_CONTROL = 10
+ASYNC_REMOTE_LOCAL_RESPONSE = 11
+TRIGGER = 12
+INTERRUPTED = 13
+ASYNC_INTERRUPTED = 14
+ASYNC_MAXIMUM_MESSAGE_SIZE = 15
+ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE = 16
+ASYNC_INITIALIZE = 17
+ASYNC_INITIALIZE_RESPONSE = 18
+ASYNC_DEVICE_CLEAR = 19
+ASYNC_SERVICE_REQUEST = 20
+ASYNC_STATUS_QUERY = 21
+ASYNC_STATUS_RESPONSE = 22
+ASYNC_DEVICE_CLEAR_ACKNOWLEDGE = 23
+
+SIZE = struct.Struct('>Q')
+
+
+def parse_sub_address(name):
+    """
+    Parse HiSLIP sub address from VISA resource string (hislip0[,port]).
+
+    Returns tuple (sub_address, port).
+    """
+    m = re.match(r'^\s*([^,\s]+)\s*(,\s*(\d+))?\s*$', name or '')
+    if not m:
+        raise SCPITransportError('Invalid HiSLIP sub address: %s' % (name))
+    return (m.group(1), int(m.group(3)) if m.group(3) else HISLIP_PORT)
+
+
+def message(mtype, control=0, param=0, payload=b''):
+    """
+    Return HiSLIP message (with payload) as bytes.
+    """
+    return HEADER.pack(PROLOGUE, mtype, control, param, len(payload)) + bytes(payload)
+
+
+def send_message(sock, mtype, control=0, param=0, payload=b''):
+    """
+    Send HiSLIP message without copying the payload.
+    """
+    header = HEADER.pack(PROLOGUE, mtype, control, param, len(payload))
+    if not payload:
+        sock.sendall(header)
+        return
+    view = memoryview(payload).cast('B')
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(header + bytes(view))
+        return
+    n = sock.sendmsg([header, view])
+    if n < len(header):
+        sock.sendall(header[n:])
+        n = len(header)
+    sock.sendall(view[n - len(header):])
+
+
+def recv_exact_into(sock, view):
+    """
+    Receive exactly len(view) bytes from socket.
+    """
+    n = 0
+    while n < len(view):
+        r = sock.recv_into(view[n:])
+        if r == 0:
+            raise SCPITransportError('Connection closed by device')
+        n += r
+
+
+def recv_message(sock):
+    """
+    Receive complete HiSLIP message from socket (blocking).
+
+    Returns tuple (message type, control code, parameter, payload).
+    """
+    header = bytearray(HEADER.size)
+    recv_exact_into(sock, memoryview(header))
+    prologue, mtype, control, param, length = HEADER.unpack(header)
+    if prologue != PROLOGUE:
+        raise SCPITransportError('Invalid HiSLIP message header: %s' % (bytes(header)))
+    payload = bytearray(length)
+    recv_exact_into(sock, memoryview(payload))
+    return (mtype, control, param, payload)
+
+
+
+class HiSLIPDevice(SCPITransport):
+    """
+    HiSLIPDevice class implements HiSLIP (IVI-6.1) transport.
+
+    Synchronous channel carries the commands and responses framed into
+    Data/DataEnd messages, asynchronous channel is used for status byte
+    queries, service requests and device clear.
+
+    In overlapped mode multiple commands can be sent before reading the
+    responses (pipelined attribute is set).
+    """
+
+    READ_BUF_SIZE = 64*1024
+    MAX_MESSAGE_SIZE = 4096
+    # maximum message size we are able to receive (no limit)
+    MAX_RECEIVE_SIZE = 1 << 62
+
+
+    def __init__(self, host, sub_address='hislip0', timeout=5, verbose=False,
+                 overlapped=None):
+        """
+        Open HiSLIP connection (synchronous and asynchronous channels)
+        to specified device.
+
+        :host: Target device hostname or IP address.
+        :sub_address: HiSLIP sub address (device name), optionally followed by
+                      TCP port: hislip0[,port] [Default: hislip0]
+        :timeout: Timeout for device to respond in seconds [Default: 5 seconds]
+        :overlapped: request overlapped (True) or synchronized (False) mode,
+                     None to use the mode device prefers [Default: None]
+        """
+        self.host = host
+        self.sub_address, self.port = parse_sub_address(sub_address)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.conn = None
+        self.async_conn = None
+        self.async_lock = threading.Lock()
+        self.async_poll = None
+
+        self.header = bytearray(HEADER.size)
+        self.header_view = memoryview(self.header)
+        self.header_pos = 0
+        self.rxbuf = bytearray(self.READ_BUF_SIZE)
+        self.rxview = memoryview(self.rxbuf)
+        # current Data/DataEnd message being received
+        self.in_data = False
+        self.data_end = False
+        self.remaining = 0
+        self.response_id = None
+        self.clear_ack = None
+
+        self.message_id = MESSAGE_ID_START
+        self.rmt = 0
+        self.srq = None
+        self.max_write = 1 << 20
+
+        try:
+            self.conn = self._connect()
+            self.conn.settimeout(timeout)
+            vendor = (VENDOR_ID[0] << 8) | VENDOR_ID[1]
+            send_message(self.conn, INITIALIZE, 0, (PROTOCOL_VERSION << 16) | vendor,
+                         self.sub_address.encode('ascii'))
+            mtype, control, param, payload = self._expect(self.conn, INITIALIZE_RESPONSE)
+            self.overlapped = (control & 0x01) != 0
+            self.server_version = param >> 16
+            self.session_id = param & 0xffff
+
+            self.async_conn = self._connect()
+            self.async_conn.settimeout(timeout)
+            send_message(self.async_conn, ASYNC_INITIALIZE, 0, self.session_id)
+            mtype, control, param, payload = self._expect(self.async_conn,
+                                                          ASYNC_INITIALIZE_RESPONSE)
+            self.server_vendor = param
+            send_message(self.async_conn, ASYNC_MAXIMUM_MESSAGE_SIZE, 0, 0,
+                         SIZE.pack(self.MAX_RECEIVE_SIZE))
+            mtype, control, param, payload = self._expect(self.async_conn,
+                                                          ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE)
+            if len(payload) == SIZE.size:
+                self.max_write = max(1, min(SIZE.unpack(payload)[0], 1 << 30))
+        except (socket.error, struct.error) as err:
+            self.close()
+            raise SCPITransportError('HiSLIP connection to %s (%s) failed: %s'
+                                     % (self.host, self.sub_address, err))
+        except SCPITransportError:
+            self.close()
+            raise
+
+        if self.verbose:
+            print('%s: session %d, protocol version 0x%04x, overlapped mode: %s, '
+                  'max message size: %d' % (__name__, self.session_id, self.server_version,
+                                            self.overlapped, self.max_write))
+        if overlapped is not None and overlapped != self.overlapped:
+            self.clear(overlapped)
+
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+
+    @property
+    def pipelined(self):
+        return self.overlapped
+
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+
+    def _expect(self, sock, rtype):
+        """
+        Receive message of given type from socket (errors are raised
+        as SCPITransportError).
+        """
+        while True:
+            mtype, control, param, payload = recv_message(sock)
+            if mtype == rtype:
+                return (mtype, control, param, payload)
+            self._other_message(mtype, control, param, payload)
+
+
+    def _other_message(self, mtype, control, param, payload):
+        """
+        Handle messages other than responses (Data/DataEnd).
+        """
+        if mtype in (FATAL_ERROR, ERROR):
+            msg = payload.decode('ascii', 'replace')
+            if mtype == FATAL_ERROR:
+                self.close()
+                raise SCPITransportError('HiSLIP fatal error %d: %s' % (control, msg))
+            raise SCPITransportError('HiSLIP error %d: %s' % (control, msg))
+        elif mtype == ASYNC_SERVICE_REQUEST:
+            self.srq = control
+        elif mtype == DEVICE_CLEAR_ACKNOWLEDGE:
+            self.clear_ack = control
+        if self.verbose > 1:
+            print('%s: message %d (control %d, parameter 0x%08x, %d bytes)'
+                  % (__name__, mtype, control, param, len(payload)))
+
+
+    def _recv(self, view):
+        """
+        Receive data from synchronous channel, returns number of bytes
+        received (0 on timeout).
+        """
+        try:
+            n = self.conn.recv_into(view)
+        except socket.timeout:
+            return 0
+        except socket.error as err:
+            raise SCPITransportError(err)
+        if n == 0:
+            raise SCPITransportError('Connection closed by device')
+        return n
+
+
+    def _next_data(self):
+        """
+        Receive headers from synchronous channel until Data/DataEnd message.
+        Returns False on timeout (or if device clear was acknowledged).
+        """
+        while True:
+            while self.header_pos < HEADER.size:
+                n = self._recv(self.header_view[self.header_pos:])
+                if n == 0:
+                    return False
+                self.header_pos += n
+            self.header_pos = 0
+            prologue, mtype, control, param, length = HEADER.unpack(self.header)
+            if prologue != PROLOGUE:
+                raise SCPITransportError('Invalid HiSLIP message header: %s'
+                                         % (bytes(self.header)))
+            if mtype in (DATA, DATA_END):
+                self.in_data = True
+                self.data_end = (mtype == DATA_END)
+                self.remaining = length
+                self.response_id = param
+                return True
+            payload = bytearray(length)
+            recv_exact_into(self.conn, memoryview(payload))
+            self._other_message(mtype, control, param, payload)
+            if mtype == DEVICE_CLEAR_ACKNOWLEDGE:
+                return False
+
+
+    def _data_done(self):
+        """
+        Current Data/DataEnd message fully received. Returns True at the
+        end of the response message.
+        """
+        self.in_data = False
+        if self.data_end:
+            # response message completely delivered
+            self.rmt = 1
+            return True
+        return False
+
+
+    def _grow(self, size):
+        self.rxview.release()
+        self.rxbuf.extend(bytes(max(size, 2 * len(self.rxbuf)) - len(self.rxbuf)))
+        self.rxview = memoryview(self.rxbuf)
+        return self.rxview
+
+
+    def _read_message(self, view, grow=False):
+        """
+        Receive response message into view (payloads of the Data
+        messages are received directly into it). Receive buffer is grown
+        as needed if :grow: is True.
+
+        Returns number of bytes received (response so far on timeout).
+        """
+        n = 0
+        while True:
+            if not self.in_data and not self._next_data():
+                break
+            while self.remaining > 0:
+                if n >= len(view):
+                    if not grow:
+                        self._discard()
+                        raise SCPITransportError('Response does not fit in buffer (%d bytes)'
+                                                 % (len(view)))
+                    view = self._grow(n + self.remaining)
+                r = self._recv(view[n:n + self.remaining])
+                if r == 0:
+                    return n
+                n += r
+                self.remaining -= r
+            if self._data_done():
+                break
+        return n
+
+
+    def _discard(self):
+        """
+        Discard rest of the response message.
+        """
+        while True:
+            while self.remaining > 0:
+                r = self._recv(self.rxview[:self.remaining])
+                if r == 0:
+                    raise SCPITransportError('Read timeout')
+                self.remaining -= r
+            if self.in_data and self._data_done():
+                return
+            if not self._next_data():
+                return
+
+
+    def read(self):
+        """
+        Read data (response message) from device.
+
+        Returns the data excluding any trailing whitespace.
+        """
+        n = self._read_message(self.rxview, grow=True)
+        r = bytes(self.rxview[:self._rstrip_end(self.rxbuf, 0, n)])
+        if self.verbose:
+            print('Read: %d: %s' % (len(r), r))
+        return r
+
+
+    def read_into(self, buffer):
+        """
+        Read data (response message) from device directly into buffer.
+
+        Returns the number of bytes stored (excluding any trailing whitespace).
+        """
+        view = memoryview(buffer).cast('B')
+        n = self._rstrip_end(view, 0, self._read_message(view))
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes (of response message) from device
+        into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view):
+            if not self.in_data and not self._next_data():
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            if self.remaining == 0:
+                if self._data_done():
+                    raise SCPITransportError('End of message (received %d of %d bytes)'
+                                             % (n, len(view)))
+                continue
+            r = self._recv(view[n:n + min(self.remaining, len(view) - n)])
+            if r == 0:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            n += r
+            self.remaining -= r
+            if self.remaining == 0 and not self.data_end:
+                self.in_data = False
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def _send_data(self, data, end):
+        """
+        Send data as Data messages (DataEnd if :end: is True), split
+        to messages of at most maximum message size of the device.
+        """
+        view = memoryview(data).cast('B')
+        if len(view) == 0 and not end:
+            return 0
+        pos = 0
+        while True:
+            part = view[pos:pos + self.max_write]
+            pos += len(part)
+            last = end and pos >= len(view)
+            send_message(self.conn, DATA_END if last else DATA, self.rmt,
+                         self.message_id, part)
+            self.rmt = 0
+            if pos >= len(view):
+                break
+        if end:
+            self.message_id = (self.message_id + 2) & 0xffffffff
+        return len(view)
+
+
+    def write(self, data):
+        """
+        Write data (command) to device.
+        """
+        if self.verbose:
+            print('Write: %d: %s' % (len(data), data))
+        try:
+            return self._send_data(data, True)
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+
+    def write_parts(self, parts):
+        """
+        Send multiple parts as a single message (Data message for each part).
+        """
+        parts = list(parts)
+        try:
+            n = 0
+            for i, part in enumerate(parts):
+                n += self._send_data(part, i == len(parts) - 1)
+            return n
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+
+    def write_chunks(self, chunks):
+        """
+        Send message in chunks, End of message (DataEnd) is sent only with
+        the last chunk.
+        """
+        it = iter(chunks)
+        prev = next(it, None)
+        if prev is None:
+            return 0
+        n = 0
+        try:
+            for cur in it:
+                n += self._send_data(prev, False)
+                prev = cur
+            return n + self._send_data(prev, True)
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+
+    def trigger(self):
+        """
+        Send Trigger message (equivalent of GPIB GET).
+        """
+        try:
+            send_message(self.conn, TRIGGER, self.rmt, self.message_id)
+        except socket.error as err:
+            raise SCPITransportError(err)
+        self.rmt = 0
+        self.message_id = (self.message_id + 2) & 0xffffffff
+
+
+    def pending_input(self):
+        """
+        Return number of bytes remaining in current Data message
+        (or 1 if synchronous channel has data available for reading).
+        """
+        if self.in_data and self.remaining > 0:
+            return self.remaining
+        return 1 if self._wait_fd(self.conn.fileno(), 0) else 0
+
+
+    def wait_readable(self, timeout):
+        """
+        Wait upto :timeout: seconds for input to become available.
+        """
+        if self.in_data:
+            return True
+        return self._wait_fd(self.conn.fileno(), timeout)
+
+
+    def _async_query(self, mtype, control, param, rtype, payload=b''):
+        with self.async_lock:
+            try:
+                send_message(self.async_conn, mtype, control, param, payload)
+                return self._expect(self.async_conn, rtype)
+            except socket.error as err:
+                raise SCPITransportError(err)
+
+
+    def read_stb(self):
+        """
+        Read status byte using AsyncStatusQuery on the asynchronous channel.
+        """
+        mtype, control, param, payload = self._async_query(
+            ASYNC_STATUS_QUERY, self.rmt, (self.message_id - 2) & 0xffffffff,
+            ASYNC_STATUS_RESPONSE)
+        return control
+
+
+    def wait_srq(self, timeout):
+        """
+        Wait for service request (AsyncServiceRequest message on
+        the asynchronous channel).
+        """
+        with self.async_lock:
+            while self.srq is None:
+                if not self._wait_async(timeout):
+                    return False
+                try:
+                    self._other_message(*recv_message(self.async_conn))
+                except socket.error as err:
+                    raise SCPITransportError(err)
+            self.srq = None
+        return True
+
+
+    def _wait_async(self, timeout):
+        """
+        Wait upto :timeout: seconds for asynchronous channel to become readable
+        (_wait_fd() is used for the synchronous channel).
+        """
+        fd = self.async_conn.fileno()
+        if not hasattr(select, 'poll'):
+            r, w, x = select.select([fd], [], [], timeout)
+            return len(r) > 0
+        if self.async_poll is None:
+            self.async_poll = select.poll()
+            self.async_poll.register(fd, select.POLLIN)
+        return len(self.async_poll.poll(max(0, int(timeout * 1000 + 0.999)))) > 0
+
+
+    def srq_fileno(self):
+        """
+        Asynchronous channel becomes readable when service request is received.
+        """
+        return self.async_conn.fileno()
+
+
+    def clear(self, overlapped=None):
+        """
+        Device clear: AsyncDeviceClear followed by DeviceClearComplete on
+        the synchronous channel. Any pending responses are discarded.
+
+        :overlapped: request overlapped (True) or synchronized (False) mode,
+                     None to keep current mode. [Default: None]
+        """
+        if overlapped is None:
+            overlapped = self.overlapped
+        self._async_query(ASYNC_DEVICE_CLEAR, 0, 0, ASYNC_DEVICE_CLEAR_ACKNOWLEDGE)
+        self.clear_ack = None
+        try:
+            send_message(self.conn, DEVICE_CLEAR_COMPLETE, int(bool(overlapped)))
+        except socket.error as err:
+            raise SCPITransportError(err)
+        while self.clear_ack is None:
+            if self.in_data:
+                self._discard()
+            elif not self._next_data() and self.clear_ack is None:
+                raise SCPITransportError('Device clear timeout')
+        self.in_data = False
+        self.remaining = 0
+        self.overlapped = (self.clear_ack & 0x01) != 0
+        self.message_id = MESSAGE_ID_START
+        self.rmt = 0
+        return True
+
+
+    def flush_input(self):
+        """
+        Flush input: discard any responses already received.
+        """
+        if self.in_data:
+            self._discard()
+        while self._wait_fd(self.conn.fileno(), 0):
+            if self._next_data():
+                self._discard()
+
+
+    def close(self):
+        """
+        Close HiSLIP connection.
+        """
+        for sock in (self.async_conn, self.conn):
+            if sock is not None:
+                try:
+                    sock.close()
+                except socket.error:
+                    pass
+        self.conn = self.async_conn = None
@@ -20,11 +20,36 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import errno
+import fcntl
 import os
+import struct
 
 from ..transport import *
 from ..exceptions import *
 
+
+# ioctls from <linux/usb/tmc.h>
+USBTMC_IOC_NR = 91
+
+def _IOC(dir, nr, size):
+    return (dir << 30) | (size << 16) | (USBTMC_IOC_NR << 8) | nr
+
+USBTMC_IOCTL_CLEAR = _IOC(0, 2, 0)
+USBTMC_IOCTL_ABORT_BULK_OUT = _IOC(0, 3, 0)
+USBTMC_IOCTL_ABORT_BULK_IN = _IOC(0, 4, 0)
+USBTMC_IOCTL_GET_TIMEOUT = _IOC(2, 9, 4)
+USBTMC_IOCTL_SET_TIMEOUT = _IOC(1, 10, 4)
+USBTMC_IOCTL_EOM_ENABLE = _IOC(1, 11, 1)
+USBTMC488_IOCTL_READ_STB = _IOC(2, 18, 1)
+USBTMC488_IOCTL_WAIT_SRQ = _IOC(1, 23, 4)
+USBTMC_IOCTL_MSG_IN_ATTR = _IOC(2, 24, 1)
+USBTMC_IOCTL_AUTO_ABORT = _IOC(1, 25, 1)
+
+# errors returned for ioctls not supported by the kernel driver
+UNSUPPORTED = (errno.ENOTTY, errno.EINVAL)
+
+
 class LinuxUSBTMCDevice(SCPITransport):
     """
     LinuxUSBTMCDevice class implements Linux USBTMC driver transport.
@@ -33,13 +58,15 @@ class LinuxUSBTMCDevice(SCPITransport):
     """
 
     READ_BUF_SIZE = 1024*1024
+    MESSAGE_BASED = True
 
-    def __init__(self, device, timeout=5, verbose=False):
+    def __init__(self, device, timeout=5, verbose=False, auto_abort=True):
         """
         Open USBTMC device (/dev/usbtmc*) based connection.
 
         :device: device name (/dev/usbtmc0, ...)
         :timeout: timeout for device to respond in seconds [Default 5 seconds]
+        :auto_abort: let kernel driver abort failed transfers [Default: True]
         """
 
         try:
@@ -47,17 +74,67 @@ class LinuxUSBTMCDevice(SCPITransport):
         except OSError as err:
             raise SCPITransportError(err)
 
-        self.timeout = timeout
         self.verbose = verbose
+        self.timeout = timeout
+        self.set_timeout(timeout)
+        # with auto abort enabled kernel driver issues INITIATE_ABORT_BULK_IN
+        # (or OUT) itself when transfer fails, otherwise we do it on timeout
+        self.auto_abort = auto_abort and self._ioctl(USBTMC_IOCTL_AUTO_ABORT,
+                                                     struct.pack('B', 1))
+        # read buffer is allocated only once and reused for every read
+        self.rxbuf = bytearray(self.READ_BUF_SIZE)
+        self.rxview = memoryview(self.rxbuf)
 
 
     def __del__(self):
         try:
-            os.close(self.conn)
+            self.close()
         except:
             pass
 
 
+    def _ioctl(self, request, arg=0):
+        """
+        Perform ioctl on the device. Returns result, or None
+        if ioctl is not supported by the kernel driver.
+        """
+        try:
+            return fcntl.ioctl(self.conn, request, arg)
+        except OSError as err:
+            if err.errno in UNSUPPORTED:
+                return None
+            raise SCPITransportError('ioctl 0x%08x failed: %s' % (request, err))
+
+
+    def set_timeout(self, timeout):
+        """
+        Set kernel driver timeout for USB transfers (USBTMC_IOCTL_SET_TIMEOUT),
+        so reads fail fast (ETIMEDOUT) instead of using the driver
+        default of 5 seconds.
+        """
+        self.timeout = timeout
+        ms = max(100, int(timeout * 1000))
+        return self._ioctl(USBTMC_IOCTL_SET_TIMEOUT, struct.pack('I', ms)) is not None
+
+
+    def _readv(self, view=None):
+        try:
+            return os.readv(self.conn, [self.rxview if view is None else view])
+        except OSError as err:
+            if err.errno == errno.ETIMEDOUT:
+                return None
+            raise SCPITransportError('Read failed: %s' % (err))
+
+
+    def _eom(self):
+        """
+        Check if last read ended at End Of Message (USBTMC_IOCTL_MSG_IN_ATTR).
+        Returns None if not supported.
+        """
+        r = self._ioctl(USBTMC_IOCTL_MSG_IN_ATTR, bytes(1))
+        return None if r is None else (r[0] & 0x01) != 0
+
+
     def read(self):
         """
         Read data (reponse) from device.
@@ -65,16 +142,107 @@ class LinuxUSBTMCDevice(SCPITransport):
         Returns the data excluding any trailing whitespace.
         """
 
-        try:
-            r = os.read(self.conn, self.READ_BUF_SIZE)
-        except TimeoutError:
-            print('%s: read timeout' % (__name__))
-            r = bytes()
+        n = self._readv()
+        if n is None:
+            return self._timeout(0)
+        if n < len(self.rxbuf) or self._eom() is not False:
+            r = bytes(self.rxview[:n])
+        else:
+            # response larger than read buffer
+            parts = [bytes(self.rxbuf)]
+            while True:
+                n = self._readv()
+                if n is None:
+                    return self._timeout(sum(len(p) for p in parts))
+                parts.append(bytes(self.rxview[:n]))
+                if n < len(self.rxbuf) or self._eom() is not False:
+                    break
+            r = b''.join(parts)
         if self.verbose:
             print('Read: %d: %s' % (len(r), r))
         return r.rstrip()
 
 
+    def read_into(self, buffer):
+        """
+        Read data (reponse) from device directly into buffer.
+
+        Returns the number of bytes stored (excluding any trailing whitespace).
+        """
+        view = memoryview(buffer).cast('B')
+        n = self._readv(view)
+        if n is None:
+            self._timeout(0)
+            return 0
+        if n == len(view) and self._eom() is not True:
+            # discard rest of the response
+            while True:
+                r = self._readv()
+                if r is None or r < len(self.rxbuf) or self._eom():
+                    break
+            raise SCPITransportError('Response does not fit in buffer (%d bytes)'
+                                     % (len(view)))
+        n = self._rstrip_end(view, 0, n)
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def _timeout(self, received):
+        if self.verbose:
+            print('%s: read timeout (received %d bytes)' % (__name__, received))
+        if not self.auto_abort:
+            self.abort_bulk_in()
+        return bytes()
+
+
+    def abort_bulk_in(self):
+        """
+        Abort pending Bulk-IN transfer (USBTMC_IOCTL_ABORT_BULK_IN).
+        """
+        return self._ioctl(USBTMC_IOCTL_ABORT_BULK_IN) is not None
+
+
+    def abort_bulk_out(self):
+        """
+        Abort pending Bulk-OUT transfer (USBTMC_IOCTL_ABORT_BULK_OUT).
+        """
+        return self._ioctl(USBTMC_IOCTL_ABORT_BULK_OUT) is not None
+
+
+    def clear(self):
+        """
+        Device clear using USBTMC INITIATE_CLEAR request (USBTMC_IOCTL_CLEAR).
+        Clears device input and output buffers without a message round trip.
+        """
+        if self._ioctl(USBTMC_IOCTL_CLEAR) is None:
+            return None
+        return True
+
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from device into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view):
+            try:
+                r = os.readv(self.conn, [view[n:]])
+            except OSError as err:
+                if err.errno == errno.ETIMEDOUT and not self.auto_abort:
+                    self.abort_bulk_in()
+                raise SCPITransportError('Read failed (received %d of %d bytes): %s'
+                                         % (n, len(view), err))
+            if r == 0:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            n += r
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
     def write(self, data):
         """
         Write data (command) to device.
@@ -84,4 +252,106 @@ class LinuxUSBTMCDevice(SCPITransport):
             print('Write: %d: %s' % (len(data), data))
         return os.write(self.conn, data)
 
-        
+
+    def _set_eom(self, enable):
+        try:
+            fcntl.ioctl(self.conn, USBTMC_IOCTL_EOM_ENABLE, struct.pack('B', int(enable)))
+        except OSError as err:
+            if err.errno in (errno.ENOTTY, errno.EINVAL):
+                return False
+            raise SCPITransportError(err)
+        return True
+
+
+    def write_chunks(self, chunks):
+        """
+        Write message in chunks, End Of Message (EOM) is set only on
+        the last chunk (USBTMC_IOCTL_EOM_ENABLE).
+        """
+        it = iter(chunks)
+        prev = next(it, None)
+        if prev is None:
+            return 0
+        cur = next(it, None)
+        if cur is None:
+            return self.write(prev)
+        if not self._set_eom(False):
+            # old kernel: send as single message
+            return self.write(b''.join([bytes(prev), bytes(cur)] + [bytes(c) for c in it]))
+        n = 0
+        try:
+            while cur is not None:
+                n += self._write_all(prev)
+                prev, cur = cur, next(it, None)
+        finally:
+            self._set_eom(True)
+        return n + self._write_all(prev)
+
+
+    def _write_all(self, data):
+        view = memoryview(data).cast('B')
+        n = 0
+        try:
+            while n < len(view):
+                n += os.write(self.conn, view[n:])
+        except OSError as err:
+            raise SCPITransportError('Write failed: %s' % (err))
+        return n
+
+
+    def wait_readable(self, timeout):
+        """
+        USBTMC is message based: device sends data only when requested by
+        a read, and read returns the complete response message. So there is
+        never additional input to wait for after a read.
+        """
+        return False
+
+
+    def read_stb(self):
+        """
+        Read status byte using USB488 READ_STATUS_BYTE request
+        (USBTMC488_IOCTL_READ_STB). Returns status byte or None if
+        not supported by the device (or kernel driver).
+        """
+        buf = bytearray(1)
+        try:
+            fcntl.ioctl(self.conn, USBTMC488_IOCTL_READ_STB, buf)
+        except OSError as err:
+            if err.errno in (errno.ENOTTY, errno.EINVAL, errno.EPERM):
+                return None
+            raise SCPITransportError('READ_STB failed: %s' % (err))
+        return buf[0]
+
+
+    def wait_srq(self, timeout):
+        """
+        Wait for service request from the USBTMC interrupt endpoint
+        (USBTMC488_IOCTL_WAIT_SRQ).
+        """
+        try:
+            fcntl.ioctl(self.conn, USBTMC488_IOCTL_WAIT_SRQ,
+                        struct.pack('I', max(1, int(timeout * 1000))))
+        except OSError as err:
+            if err.errno == errno.ETIMEDOUT:
+                return False
+            if err.errno in (errno.ENOTTY, errno.EINVAL, errno.ENODEV, errno.EPERM):
+                return None
+            raise SCPITransportError('WAIT_SRQ failed: %s' % (err))
+        return True
+
+
+    def srq_fileno(self):
+        """
+        Linux USBTMC driver signals received SRQ with POLLPRI.
+        """
+        return self.conn
+
+
+    def close(self):
+        """
+        Close USBTMC device.
+        """
+        if self.conn is not None:
+            os.close(self.conn)
+            self.conn = None
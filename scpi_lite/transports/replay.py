@@ -0,0 +1,318 @@
+#
+# replay.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import os
+import struct
+import time
+
+from ..transport import *
+from ..exceptions import *
+
+
+MAGIC = b'SCPIREC1'
+RECORD = struct.Struct('<cdI')
+
+META = b'M'
+WRITE = b'W'
+READ = b'R'
+READ_EXACT = b'X'
+STB = b'S'
+
+
+def read_records(filename):
+    """
+    Read records from a recording file.
+    Returns list of sessions, each a list of tuples (type, timestamp, data).
+    """
+    sessions = []
+    try:
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise SCPITransportError('Not a recording file: %s' % (filename))
+            while True:
+                hdr = f.read(RECORD.size)
+                if len(hdr) < RECORD.size:
+                    break
+                rtype, ts, size = RECORD.unpack(hdr)
+                data = f.read(size)
+                if len(data) < size:
+                    # truncated (incomplete) record at the end of file
+                    break
+                if rtype == META:
+                    sessions.append([])
+                if not sessions:
+                    raise SCPITransportError('Invalid recording file: %s' % (filename))
+                sessions[-1].append((rtype, ts, data))
+    except OSError as err:
+        raise SCPITransportError(err)
+    return sessions
+
+
+
+class RecordingTransport(TransportWrapper):
+    """
+    RecordingTransport wraps a SCPITransport and records every write/read
+    exchange (and status byte read using transport specific method) with
+    timestamps to an append-only recording file.
+
+    Recording can be played back using ReplayDevice ('replay:<file>'
+    device string).
+    """
+
+    def __init__(self, transport, filename, device=''):
+        """
+        Start recording given transport.
+
+        :transport: SCPITransport to record.
+        :filename: recording file (new session is appended if file exists).
+        :device: connection string (stored in the recording).
+        """
+        super().__init__(transport)
+        try:
+            new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+            # (not opened in append mode, so that size of a streamed
+            # record can be updated after its data has been written)
+            self.file = open(filename, 'w+b' if new else 'r+b')
+            self.file.seek(0, os.SEEK_END)
+            if new:
+                self.file.write(MAGIC)
+        except OSError as err:
+            raise SCPITransportError(err)
+        self.start = time.monotonic()
+        meta = {'device': device, 'time': time.time(),
+                'transport': type(transport).__name__}
+        self._record(META, json.dumps(meta).encode('utf-8'))
+
+
+    def _record(self, rtype, data):
+        self.file.write(RECORD.pack(rtype, time.monotonic() - self.start, len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+
+    def _record_chunks(self, rtype, chunks):
+        """
+        Generator that writes chunks to a record while passing them through.
+        Record size is updated when the record is complete, until then the
+        record appears truncated.
+        """
+        size = 0
+        pos = self.file.tell()
+        ts = time.monotonic() - self.start
+        self.file.write(RECORD.pack(rtype, ts, 0xffffffff))
+        try:
+            for chunk in chunks:
+                self.file.write(chunk)
+                size += memoryview(chunk).nbytes
+                yield chunk
+        finally:
+            self.file.seek(pos)
+            self.file.write(RECORD.pack(rtype, ts, size))
+            self.file.seek(0, os.SEEK_END)
+            self.file.flush()
+
+
+    def read(self):
+        r = self.transport.read()
+        self._record(READ, r)
+        return r
+
+
+    def read_into(self, buffer):
+        n = self.transport.read_into(buffer)
+        self._record(READ, memoryview(buffer).cast('B')[:n])
+        return n
+
+
+    def read_exact_into(self, buffer):
+        n = self.transport.read_exact_into(buffer)
+        self._record(READ_EXACT, memoryview(buffer).cast('B')[:n])
+        return n
+
+
+    def write(self, data):
+        self._record(WRITE, data)
+        return self.transport.write(data)
+
+
+    def write_parts(self, parts):
+        self._record(WRITE, b''.join(parts))
+        return self.transport.write_parts(parts)
+
+
+    def write_chunks(self, chunks):
+        # chunks are recorded as they are sent (chunks may reuse the same
+        # buffer, so each chunk is recorded before the next is generated)
+        gen = self._record_chunks(WRITE, chunks)
+        try:
+            return self.transport.write_chunks(gen)
+        finally:
+            gen.close()
+
+
+    def read_stb(self):
+        stb = self.transport.read_stb()
+        if stb is not None:
+            self._record(STB, bytes((stb,)))
+        return stb
+
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        return self.transport.close()
+
+
+
+class ReplayDevice(SCPITransport):
+    """
+    ReplayDevice class implements a transport that plays back exchanges
+    recorded by RecordingTransport, without any hardware attached.
+    """
+
+    def __init__(self, device, speed=0, strict=True, session=-1,
+                 timeout=5, verbose=False):
+        """
+        Open recording file for playback.
+
+        :device: recording file name.
+        :speed: playback speed relative to the original timing, or 0 to
+                play back without any delays. [Default: 0]
+        :strict: raise SCPITransportError if written data doesn't match
+                 the recording. [Default: True]
+        :session: recording session to play back (sessions are appended to
+                  the same file) [Default: -1 (last session)]
+        """
+        sessions = read_records(device)
+        if not sessions:
+            raise SCPITransportError('Empty recording file: %s' % (device))
+        try:
+            self.records = sessions[session]
+        except IndexError:
+            raise SCPITransportError('No session %d in recording: %s' % (session, device))
+        self.meta = json.loads(self.records[0][2].decode('utf-8'))
+        self.pos = 1
+        self.conn = device
+        self.speed = speed
+        self.strict = strict
+        self.timeout = timeout
+        self.verbose = verbose
+        self.last_ts = 0.0
+        self.last_time = time.monotonic()
+
+
+    def _next(self, rtypes):
+        if self.pos >= len(self.records):
+            return None
+        rec = self.records[self.pos]
+        if rec[0] not in rtypes:
+            if self.strict:
+                raise SCPITransportError('Replay mismatch: expected %s, got %s (record %d)'
+                                         % (rtypes, rec[0], self.pos))
+            return None
+        self.pos += 1
+        if self.speed:
+            delay = (rec[1] - self.last_ts) / self.speed - (time.monotonic() - self.last_time)
+            if delay > 0:
+                time.sleep(delay)
+            self.last_ts = rec[1]
+            self.last_time = time.monotonic()
+        return rec
+
+
+    def read(self):
+        """
+        Return next recorded response.
+        """
+        rec = self._next((READ,))
+        r = rec[2] if rec else bytes()
+        if self.verbose:
+            print('Read: %d: %s' % (len(r), r))
+        return r
+
+
+    def read_exact_into(self, buffer):
+        view = memoryview(buffer).cast('B')
+        rec = self._next((READ_EXACT,))
+        if rec is None or len(rec[2]) != len(view):
+            raise SCPITransportError('Replay mismatch: read of %d bytes not in recording'
+                                     % (len(view)))
+        view[:] = rec[2]
+        return len(view)
+
+
+    def write(self, data):
+        """
+        Check written data against the recording.
+        """
+        if self.verbose:
+            print('Write: %d: %s' % (len(data), data))
+        rec = self._next((WRITE,))
+        if self.strict and (rec is None or rec[2] != bytes(data)):
+            raise SCPITransportError('Replay mismatch: write %s, recorded %s'
+                                     % (bytes(data), rec[2] if rec else None))
+        return len(data)
+
+
+    def write_parts(self, parts):
+        return self.write(b''.join(parts))
+
+
+    def write_chunks(self, chunks):
+        """
+        Check written chunks against the recording (without joining them).
+        """
+        rec = self._next((WRITE,))
+        data = memoryview(rec[2] if rec else b'')
+        n = 0
+        for chunk in chunks:
+            chunk = memoryview(chunk).cast('B')
+            if self.strict and data[n:n + len(chunk)] != chunk:
+                raise SCPITransportError('Replay mismatch: write differs from recording at byte %d'
+                                         % (n))
+            n += len(chunk)
+        if self.strict and (rec is None or n != len(data)):
+            raise SCPITransportError('Replay mismatch: write of %d bytes, recorded %s'
+                                     % (n, len(data) if rec else None))
+        if self.verbose:
+            print('Write: %d bytes' % (n))
+        return n
+
+
+    def read_stb(self):
+        """
+        Return next recorded status byte, or None if status byte was not
+        read using transport specific method at this point (*STB? query).
+        """
+        if self.pos < len(self.records) and self.records[self.pos][0] == STB:
+            return self._next((STB,))[2][0]
+        return None
+
+
+    def pending_input(self):
+        if self.pos < len(self.records) and self.records[self.pos][0] in (READ, READ_EXACT):
+            return max(1, len(self.records[self.pos][2]))
+        return 0
+
+
+    def wait_readable(self, timeout):
+        return self.pending_input() > 0
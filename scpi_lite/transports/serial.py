@@ -32,6 +32,9 @@ class SerialDevice(SCPITransport):
     SerialDevice class implements Serial (RS-232/TTL) transport.
     """
 
+    MAX_MESSAGE_SIZE = 256
+    WRITE_CHUNK_SIZE = 64*1024
+
     def __init__(self, device, timeout=5, terminator=(b'\r\n', b'\n'), verbose=0,
                  baudrate=115200, bytesize=serial.EIGHTBITS,
                  parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
@@ -57,8 +60,13 @@ class SerialDevice(SCPITransport):
         except (OSError, ValueError, serial.SerialException) as err:
             raise SCPITransportError(err)
 
-        self.terminator = terminator
+        if isinstance(terminator, (bytes, bytearray)):
+            terminator = (terminator,)
+        self.terminator = tuple(terminator)
+        self.timeout = timeout
         self.verbose = verbose
+        self.rxbuf = bytearray()
+        self.scan_pos = 0
 
 
     def read(self):
@@ -66,32 +74,102 @@ class SerialDevice(SCPITransport):
         Read data (reponse) from device.
         Read until response trerminator received (default: \r\n or \n).
 
+        All bytes available from the port are read at once into a receive
+        buffer, which is then searched for the terminator. Any bytes following
+        the terminator are kept in the buffer for the next read.
+
         Returns the data up to the terminator.
         """
-        buf = bytearray()
+        pos, end = self._find_response()
+        r = bytes(self.rxbuf[:pos])
+        del self.rxbuf[:end]
+        if self.verbose:
+            print('Read: %d: %s' % (len(r), r))
+        return r
+
+
+    def read_into(self, buffer):
+        """
+        Read data (reponse) from device directly into buffer.
+
+        Returns the number of bytes stored (excluding the terminator).
+        """
+        pos, end = self._find_response()
+        try:
+            n = self._store(buffer, self.rxbuf, 0, pos)
+        finally:
+            del self.rxbuf[:end]
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def _find_response(self):
+        """
+        Receive until response terminator is in the receive buffer.
+        Returns end position of the response and of the terminator
+        (on timeout whatever was received so far is the response).
+        """
         while True:
+            r = self._find_terminator()
+            if r is not None:
+                return r
             try:
-                r = self.conn.read(1)
+                data = self.conn.read(max(1, self.conn.in_waiting))
             except serial.SerialException as err:
                 raise SCPITransportError(err)
-            if (len(r) < 1):
-                break
+            if (len(data) < 1):
+                self.scan_pos = 0
+                return len(self.rxbuf), len(self.rxbuf)
             if self.verbose > 1:
-                print('Received: %s' % (r))
-            buf.extend(r)
-            endofline = 0
-            for term in self.terminator:
-                if (buf.endswith(term)):
-                    buf = buf.rstrip(term)
-                    endofline = 1
-                    break
-            if endofline:
-                break
-
-        buf = bytes(buf)
+                print('Received: %s' % (data))
+            self.rxbuf.extend(data)
+
+
+    def _find_terminator(self):
+        """
+        Search receive buffer for (earliest) response terminator.
+
+        Returns position of the terminator and end of the terminator,
+        or None if no terminator found.
+        """
+        buf = self.rxbuf
+        best = None
+        for term in self.terminator:
+            pos = buf.find(term, max(0, self.scan_pos - len(term) + 1))
+            if pos < 0:
+                continue
+            end = pos + len(term)
+            if best is None or end < best[1] or (end == best[1] and pos < best[0]):
+                best = (pos, end)
+        if best is None:
+            self.scan_pos = len(buf)
+            return None
+        self.scan_pos = 0
+        return best
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from device into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = min(len(self.rxbuf), len(view))
+        if n > 0:
+            view[:n] = self.rxbuf[:n]
+            del self.rxbuf[:n]
+            self.scan_pos = 0
+        while n < len(view):
+            try:
+                r = self.conn.readinto(view[n:])
+            except serial.SerialException as err:
+                raise SCPITransportError(err)
+            if not r:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            n += r
         if self.verbose:
-            print('Read: %d: %s' % (len(buf), buf))
-        return buf
+            print('Read: %d bytes' % (n))
+        return n
 
     def write(self, data):
         """
@@ -105,6 +183,15 @@ class SerialDevice(SCPITransport):
             raise SCPITransportError(err)
         return res
 
+    def write_parts(self, parts):
+        """
+        Write data consisting of multiple parts to device.
+        """
+        res = 0
+        for part in parts:
+            res += self.write(part)
+        return res
+
     def flush_input(self):
         """
         Flush serial input buffer.
@@ -112,6 +199,8 @@ class SerialDevice(SCPITransport):
         if self.verbose:
             print("Flush serial input buffer.")
         self.conn.reset_input_buffer()
+        self.rxbuf.clear()
+        self.scan_pos = 0
 
     def flush_output(self):
         """
@@ -125,7 +214,17 @@ class SerialDevice(SCPITransport):
         """
         Return number of bytes waiting in input buffer.
         """
-        return self.conn.in_waiting
+        return len(self.rxbuf) + self.conn.in_waiting
+
+    def wait_readable(self, timeout):
+        """
+        Wait upto :timeout: seconds for input to become available.
+        """
+        if len(self.rxbuf) > 0:
+            return True
+        if not hasattr(self.conn, 'fileno'):
+            return super().wait_readable(timeout)
+        return self._wait_fd(self.conn.fileno(), timeout)
 
     def close(self):
         """
@@ -22,7 +22,6 @@
 
 import os
 import socket
-import select
 
 from ..transport import *
 from ..exceptions import *
@@ -32,7 +31,8 @@ class TCPDevice(SCPITransport):
     TCPDevice class implmeents TCP/IP transport.
     """
 
-    READ_BUF_SIZE = 1024*1024
+    READ_BUF_SIZE = 64*1024
+    MAX_MESSAGE_SIZE = 4096
     DEFAULT_PORT = 5555
 
 
@@ -57,6 +57,13 @@ class TCPDevice(SCPITransport):
         except (socket.gaierror, socket.error) as err:
             errmsg = "Connection to %s:%s failed: %s" % (self.host, self.port, err)
             raise SCPITransportError(errmsg)
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.rxbuf = bytearray(self.READ_BUF_SIZE)
+        self.rxview = memoryview(self.rxbuf)
+        self.rx_start = 0
+        self.rx_end = 0
+        self.scan_pos = 0
 
 
     def __del__(self):
@@ -66,24 +73,161 @@ class TCPDevice(SCPITransport):
             pass
 
 
+    def _recv(self):
+        """
+        Receive more data from the socket into the receive buffer.
+        Returns number of bytes received (0 on timeout).
+        """
+        if self.rx_end == len(self.rxbuf):
+            if self.rx_start > 0:
+                # move unread data to the beginning of the buffer
+                size = self.rx_end - self.rx_start
+                self.rxview[:size] = self.rxview[self.rx_start:self.rx_end]
+                self.scan_pos -= self.rx_start
+                self.rx_start = 0
+                self.rx_end = size
+            else:
+                self.rxview.release()
+                self.rxbuf.extend(bytes(len(self.rxbuf)))
+                self.rxview = memoryview(self.rxbuf)
+
+        try:
+            n = self.conn.recv_into(self.rxview[self.rx_end:])
+        except socket.timeout:
+            return 0
+        except socket.error as err:
+            raise SCPITransportError(err)
+        if n == 0:
+            raise SCPITransportError('Connection closed by device')
+        if self.verbose > 1:
+            print('Received: %d bytes' % (n))
+        self.rx_end += n
+        return n
+
+
+    def _consume(self, end, skip=0):
+        """
+        Remove data up to :end: from the receive buffer, returns the data.
+        """
+        r = bytes(self.rxview[self.rx_start:end])
+        self._skip(end + skip)
+        return r
+
+
+    def _skip(self, pos):
+        """
+        Remove data up to :pos: from the receive buffer.
+        """
+        self.rx_start = pos
+        if self.rx_start >= self.rx_end:
+            self.rx_start = self.rx_end = 0
+        self.scan_pos = self.rx_start
+
+
+    def _find_response(self):
+        """
+        Receive until response terminator (\n) is in the receive buffer.
+        Returns end position of the response and terminator length
+        (on timeout whatever was received so far is the response).
+        """
+        while True:
+            pos = self.rxbuf.find(b'\n', self.scan_pos, self.rx_end)
+            if pos >= 0:
+                return pos, 1
+            self.scan_pos = self.rx_end
+            if self._recv() == 0:
+                return self.rx_end, 0
+
+
     def read(self):
         """
         Read data (reponse) from device.
+        Read until response terminator (\n) received. Any data received
+        after the terminator is kept for the next read.
 
         Returns the data excluding any trailing whitespace.
         """
 
-        try:
-            r = self.conn.recv(self.READ_BUF_SIZE)
-        except socket.error:
-            raise SCPITransportError(err)
-
-        r = bytes()
+        r = self._consume(*self._find_response())
         if self.verbose:
             print('Read: %d: %s' % (len(r), r))
         return r.rstrip()
 
 
+    def read_into(self, buffer):
+        """
+        Read data (reponse) from device directly into buffer.
+
+        Returns the number of bytes stored (excluding any trailing whitespace).
+        """
+        end, skip = self._find_response()
+        start = self.rx_start
+        self._skip(end + skip)
+        # data stays in the receive buffer until next receive
+        n = self._store(buffer, self.rxbuf, start, self._rstrip_end(self.rxbuf, start, end))
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from device into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = min(self.rx_end - self.rx_start, len(view))
+        if n > 0:
+            view[:n] = self.rxview[self.rx_start:self.rx_start + n]
+            self._consume(self.rx_start + n)
+        while n < len(view):
+            try:
+                r = self.conn.recv_into(view[n:])
+            except socket.timeout:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            except socket.error as err:
+                raise SCPITransportError(err)
+            if r == 0:
+                raise SCPITransportError('Connection closed by device')
+            n += r
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def pending_input(self):
+        """
+        Return number of bytes waiting in input buffer
+        (or 1 if socket has data available for reading).
+        """
+        n = self.rx_end - self.rx_start
+        if n > 0:
+            return n
+        return 1 if self._wait_fd(self.conn.fileno(), 0) else 0
+
+
+    def wait_readable(self, timeout):
+        """
+        Wait upto :timeout: seconds for input to become available.
+        """
+        if self.rx_end > self.rx_start:
+            return True
+        return self._wait_fd(self.conn.fileno(), timeout)
+
+
+    def flush_input(self):
+        """
+        Flush input buffer.
+        """
+        self.rx_start = self.rx_end = self.scan_pos = 0
+        while self._wait_fd(self.conn.fileno(), 0):
+            try:
+                if self.conn.recv_into(self.rxview) == 0:
+                    break
+            except socket.error:
+                break
+
+
     def write(self, data):
         """
         Write data (command) to device.
@@ -98,3 +242,33 @@ class TCPDevice(SCPITransport):
             raise SCPITransportError(err)
         return res
 
+
+    def write_parts(self, parts):
+        """
+        Write data consisting of multiple parts to device
+        (using scatter/gather I/O when available).
+        """
+        if not hasattr(self.conn, 'sendmsg'):
+            return self.write(b''.join(parts))
+
+        if self.verbose:
+            print('Write: %d parts' % (len(parts)))
+
+        views = [memoryview(p).cast('B') for p in parts]
+        try:
+            while views:
+                n = self.conn.sendmsg(views)
+                while views and n >= len(views[0]):
+                    n -= len(views[0])
+                    views.pop(0)
+                if views:
+                    views[0] = views[0][n:]
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+
+    def close(self):
+        """
+        Close TCP connection.
+        """
+        return self.conn.close()
@@ -33,6 +33,7 @@ class USBTMCDevice(SCPITransport):
     """
 
     READ_BUF_SIZE = 1024*1024
+    MESSAGE_BASED = True
 
     def __init__(self, device, timeout=5, verbose=False):
         """
@@ -67,6 +68,40 @@ class USBTMCDevice(SCPITransport):
         return r.rstrip()
 
 
+    def read_into(self, buffer):
+        """
+        Read data (reponse) from device into buffer.
+
+        Returns the number of bytes stored (excluding any trailing whitespace).
+        """
+        r = self.conn.read_raw(self.READ_BUF_SIZE)
+        n = self._store(buffer, r, 0, self._rstrip_end(r, 0, len(r)))
+        if self.verbose:
+            print("%s: Read: %d bytes" % (__name__, n))
+        return n
+
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes from device into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view):
+            try:
+                r = self.conn.read_raw(min(len(view) - n, self.READ_BUF_SIZE))
+            except usbtmc.UsbtmcException as err:
+                raise SCPITransportError(err)
+            if len(r) == 0:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            view[n:n + len(r)] = r
+            n += len(r)
+        if self.verbose:
+            print("%s: Read: %d bytes" % (__name__, n))
+        return n
+
+
     def write(self, data):
         """
         Write data (command) to device.
@@ -76,4 +111,55 @@ class USBTMCDevice(SCPITransport):
             print("%s: Write: '%s'" % (__name__, data))
         return self.conn.write_raw(data)
 
-        
+
+    def write_chunks(self, chunks):
+        """
+        Write message in chunks (as USBTMC transfers), End Of Message (EOM)
+        is set only on the last transfer.
+        """
+        inst = self.conn
+        if not hasattr(inst, 'pack_dev_dep_msg_out_header'):
+            return self.write(b''.join([bytes(c) for c in chunks]))
+        if not inst.connected:
+            inst.open()
+        it = iter(chunks)
+        cur = next(it, None)
+        n = 0
+        try:
+            while cur is not None:
+                nxt = next(it, None)
+                view = memoryview(cur).cast('B')
+                for pos in range(0, max(len(view), 1), inst.max_transfer_size):
+                    block = view[pos:pos + inst.max_transfer_size]
+                    eom = nxt is None and pos + len(block) >= len(view)
+                    req = (inst.pack_dev_dep_msg_out_header(len(block), eom) + block
+                           + b'\0' * ((4 - (len(block) % 4)) % 4))
+                    inst.bulk_out_ep.write(req, timeout=int(self.timeout * 1000))
+                n += len(view)
+                cur = nxt
+        except (usb.core.USBError, usbtmc.UsbtmcException) as err:
+            raise SCPITransportError(err)
+        if self.verbose:
+            print("%s: Write: %d bytes" % (__name__, n))
+        return n
+
+
+    def wait_readable(self, timeout):
+        """
+        USBTMC is message based: device sends data only when requested by
+        a read, and read returns the complete response message. So there is
+        never additional input to wait for after a read.
+        """
+        return False
+
+
+    def read_stb(self):
+        """
+        Read status byte using USB488 READ_STATUS_BYTE control request.
+        """
+        try:
+            return self.conn.read_stb()
+        except usbtmc.UsbtmcException as err:
+            if self.verbose:
+                print('%s: read_stb failed: %s' % (__name__, err))
+            return None
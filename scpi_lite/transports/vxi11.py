@@ -0,0 +1,668 @@
+#
+# vxi11.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import socket
+import struct
+import threading
+
+from ..transport import *
+from ..exceptions import *
+
+
+UINT = struct.Struct('>I')
+
+# ONC RPC (RFC 5531)
+RPC_VERSION = 2
+CALL = 0
+REPLY = 1
+MSG_ACCEPTED = 0
+SUCCESS = 0
+LAST_FRAGMENT = 0x80000000
+# xid, msg_type, rpcvers, prog, vers, proc, cred (AUTH_NULL), verf (AUTH_NULL)
+CALL_HEADER = struct.Struct('>IIIIIIIIII')
+ACCEPT_ERRORS = {1: 'program unavailable', 2: 'program version mismatch',
+                 3: 'procedure unavailable', 4: 'garbage arguments', 5: 'system error'}
+
+# portmapper
+PMAP_PORT = 111
+PMAP_PROG = 100000
+PMAP_VERS = 2
+PMAPPROC_GETPORT = 3
+IPPROTO_TCP = 6
+
+# VXI-11 core channel
+DEVICE_CORE = 0x0607af
+DEVICE_CORE_VERSION = 1
+CREATE_LINK = 10
+DEVICE_WRITE = 11
+DEVICE_READ = 12
+DEVICE_READSTB = 13
+DEVICE_TRIGGER = 14
+DEVICE_CLEAR = 15
+DESTROY_LINK = 23
+
+# Device_Flags
+FLAG_WAITLOCK = 0x01
+FLAG_END = 0x08
+FLAG_TERMCHRSET = 0x80
+
+# device_read reasons
+REASON_REQCNT = 0x01
+REASON_CHR = 0x02
+REASON_END = 0x04
+
+# Device_ErrorCode
+ERROR_IO_TIMEOUT = 15
+ERRORS = {1: 'syntax error', 3: 'device not accessible', 4: 'invalid link identifier',
+          5: 'parameter error', 6: 'channel not established', 8: 'operation not supported',
+          9: 'out of resources', 11: 'device locked by another link',
+          12: 'no lock held by this link', 15: 'I/O timeout', 17: 'I/O error',
+          21: 'invalid address', 23: 'abort', 29: 'channel already established'}
+
+# lid, io_timeout, lock_timeout, flags, data length
+WRITE_PARMS = struct.Struct('>IIIII')
+# lid, requestSize, io_timeout, lock_timeout, flags, termChar
+READ_PARMS = struct.Struct('>IIIIII')
+# lid, flags, lock_timeout, io_timeout
+GENERIC_PARMS = struct.Struct('>IIII')
+
+PAD = (b'', b'\0\0\0', b'\0\0', b'\0')
+
+# portmapper lookup cache: (host, pmap_port, prog, vers) -> port
+_port_cache = {}
+_port_lock = threading.Lock()
+
+
+def xdr_opaque(data):
+    """
+    Return XDR variable length opaque (or string) as list of parts
+    (length, data, padding), so data doesn't need to be copied.
+    """
+    n = memoryview(data).nbytes
+    return [UINT.pack(n), data, PAD[n % 4]]
+
+
+def error_text(error):
+    return '%d (%s)' % (error, ERRORS.get(error, 'unknown error'))
+
+
+def sendmsg_all(sock, parts):
+    """
+    Send list of bytes-like objects using sendmsg() (without joining them).
+    """
+    parts = [memoryview(p).cast('B') for p in parts if len(p) > 0]
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(parts))
+        return
+    while parts:
+        n = sock.sendmsg(parts[:64])
+        while parts and n >= len(parts[0]):
+            n -= len(parts[0])
+            parts.pop(0)
+        if n > 0:
+            parts[0] = parts[0][n:]
+
+
+
+class RPCClient(object):
+    """
+    Minimal ONC RPC client over TCP (AUTH_NULL authentication).
+
+    Replies are parsed incrementally from the record marking stream,
+    so (large) results can be received directly into the caller's buffer:
+    call() receives the reply header, results are then read using
+    recv_uint()/recv_into() and the reply is finished using done().
+    """
+
+    def __init__(self, host, port, prog, vers, timeout=5):
+        self.prog = prog
+        self.vers = vers
+        self.xid = (os.getpid() << 16) & 0xffffffff
+        self.frag_left = 0
+        self.last_frag = True
+        self.word = bytearray(4)
+        self.word_view = memoryview(self.word)
+        self.marker = bytearray(4)
+        self.marker_view = memoryview(self.marker)
+        self.scratch = bytearray(4096)
+        # small reads (reply headers) are served from receive buffer,
+        # large ones received directly into the target
+        self.rxbuf = bytearray(4096)
+        self.rxview = memoryview(self.rxbuf)
+        self.rx_start = 0
+        self.rx_end = 0
+        try:
+            self.sock = socket.create_connection((host, port), timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except socket.error as err:
+            raise SCPITransportError('RPC connection to %s:%d failed: %s' % (host, port, err))
+
+
+    def _recv(self, view):
+        n = min(self.rx_end - self.rx_start, len(view))
+        if n > 0:
+            view[:n] = self.rxview[self.rx_start:self.rx_start + n]
+            self.rx_start += n
+        try:
+            while n < len(view):
+                if len(view) - n >= len(self.rxbuf):
+                    r = self.sock.recv_into(view[n:])
+                else:
+                    self.rx_start = self.rx_end = 0
+                    self.rx_end = self.sock.recv_into(self.rxbuf)
+                    r = min(self.rx_end, len(view) - n)
+                    view[n:n + r] = self.rxview[:r]
+                    self.rx_start = r
+                if r == 0:
+                    raise SCPITransportError('RPC connection closed')
+                n += r
+        except socket.timeout:
+            self.close()
+            raise SCPITransportError('RPC reply timeout')
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+
+    def _next_fragment(self):
+        if self.last_frag:
+            raise SCPITransportError('RPC reply too short')
+        self._recv(self.marker_view)
+        marker = UINT.unpack(self.marker)[0]
+        self.last_frag = (marker & LAST_FRAGMENT) != 0
+        self.frag_left = marker & ~LAST_FRAGMENT
+
+
+    def recv_into(self, view):
+        """
+        Receive len(view) bytes of the reply into view.
+        """
+        n = 0
+        while n < len(view):
+            if self.frag_left == 0:
+                self._next_fragment()
+                continue
+            r = min(self.frag_left, len(view) - n)
+            self._recv(view[n:n + r])
+            self.frag_left -= r
+            n += r
+
+
+    def recv_uint(self):
+        self.recv_into(self.word_view)
+        return UINT.unpack(self.word)[0]
+
+
+    def skip(self, size):
+        view = memoryview(self.scratch)
+        while size > 0:
+            r = min(size, len(view))
+            self.recv_into(view[:r])
+            size -= r
+
+
+    def done(self):
+        """
+        Skip rest of the reply (record).
+        """
+        while True:
+            if self.frag_left:
+                self.skip(self.frag_left)
+            if self.last_frag:
+                return
+            self._next_fragment()
+
+
+    def call(self, proc, parts):
+        """
+        Send RPC call (arguments as list of bytes-like objects) and
+        receive reply header.
+        """
+        if self.sock is None:
+            raise SCPITransportError('RPC connection closed')
+        self.xid = (self.xid + 1) & 0xffffffff
+        header = CALL_HEADER.pack(self.xid, CALL, RPC_VERSION, self.prog, self.vers,
+                                  proc, 0, 0, 0, 0)
+        size = len(header) + sum([memoryview(p).nbytes for p in parts])
+        try:
+            sendmsg_all(self.sock, [UINT.pack(LAST_FRAGMENT | size), header] + parts)
+        except socket.error as err:
+            raise SCPITransportError(err)
+
+        while True:
+            self.frag_left = 0
+            self.last_frag = False
+            xid = self.recv_uint()
+            mtype = self.recv_uint()
+            if xid == self.xid and mtype == REPLY:
+                break
+            # stale reply (to an earlier call)
+            self.done()
+        stat = self.recv_uint()
+        if stat != MSG_ACCEPTED:
+            self.done()
+            raise SCPITransportError('RPC call denied (%d)' % (stat))
+        self.recv_uint()
+        self.skip((self.recv_uint() + 3) & ~3)
+        accept = self.recv_uint()
+        if accept != SUCCESS:
+            self.done()
+            raise SCPITransportError('RPC call failed: %s'
+                                     % (ACCEPT_ERRORS.get(accept, accept)))
+
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+
+def get_port(host, prog, vers, timeout=5, pmap_port=PMAP_PORT, cache=True):
+    """
+    Look up TCP port of RPC program using portmapper (lookups are cached).
+    """
+    key = (host, pmap_port, prog, vers)
+    if cache:
+        with _port_lock:
+            port = _port_cache.get(key)
+        if port:
+            return port
+    rpc = RPCClient(host, pmap_port, PMAP_PROG, PMAP_VERS, timeout)
+    try:
+        rpc.call(PMAPPROC_GETPORT, [struct.pack('>IIII', prog, vers, IPPROTO_TCP, 0)])
+        port = rpc.recv_uint()
+        rpc.done()
+    finally:
+        rpc.close()
+    if port == 0:
+        raise SCPITransportError('RPC program 0x%x not available on %s' % (prog, host))
+    with _port_lock:
+        _port_cache[key] = port
+    return port
+
+
+def invalidate_port(host, prog, vers, pmap_port=PMAP_PORT):
+    with _port_lock:
+        _port_cache.pop((host, pmap_port, prog, vers), None)
+
+
+
+class VXI11Device(SCPITransport):
+    """
+    VXI11Device class implements VXI-11 (TCP/IP Instrument Protocol) transport.
+
+    A single core channel link is kept open for the connection. Responses
+    are read using large device_read requests (framed by the END flag),
+    directly into the target buffer when possible.
+    """
+
+    READ_BUF_SIZE = 64*1024
+    MAX_MESSAGE_SIZE = 4096
+    MESSAGE_BASED = True
+    # requestSize for device_read (device returns what it has available)
+    READ_SIZE = 16*1024*1024
+    # extra bytes requested with read_exact() (response terminator)
+    READ_EXTRA = 64
+
+
+    def __init__(self, host, name='inst0', timeout=5, verbose=False,
+                 pmap_port=PMAP_PORT, lock_timeout=0):
+        """
+        Open VXI-11 connection (core channel link) to specified device.
+
+        :host: Target device hostname or IP address.
+        :name: device name on the host (inst0, gpib0,5, ...) [Default: inst0]
+        :timeout: Timeout for device to respond in seconds [Default: 5 seconds]
+        :pmap_port: portmapper TCP port [Default: 111]
+        :lock_timeout: time to wait for lock held by another link in seconds
+                       [Default: 0]
+        """
+        self.host = host
+        self.name = name or 'inst0'
+        self.timeout = timeout
+        self.verbose = verbose
+        self.pmap_port = pmap_port
+        self.io_timeout = int(timeout * 1000)
+        self.lock_timeout = int(lock_timeout * 1000)
+        self.rpc = None
+        self.lid = None
+        self.conn = None
+
+        self.rxbuf = bytearray(self.READ_BUF_SIZE)
+        self.rxview = memoryview(self.rxbuf)
+        self.rx_start = 0
+        self.rx_end = 0
+        # end of response message received
+        self.rx_eom = False
+
+        for cached in (True, False):
+            port = get_port(host, DEVICE_CORE, DEVICE_CORE_VERSION, timeout,
+                            pmap_port, cached)
+            try:
+                # socket timeout longer than io_timeout, so device reports
+                # I/O timeout first
+                self.rpc = RPCClient(host, port, DEVICE_CORE, DEVICE_CORE_VERSION,
+                                     timeout + 2)
+                break
+            except SCPITransportError:
+                invalidate_port(host, DEVICE_CORE, DEVICE_CORE_VERSION, pmap_port)
+                if not cached:
+                    raise
+        self.conn = self.rpc.sock
+
+        name = self.name.encode('ascii')
+        self.rpc.call(CREATE_LINK, [struct.pack('>III', os.getpid() & 0x7fffffff, 0,
+                                                self.lock_timeout)] + xdr_opaque(name))
+        error, self.lid, self.abort_port, max_recv = [self.rpc.recv_uint() for i in range(4)]
+        self.rpc.done()
+        if error:
+            self.rpc.close()
+            raise SCPITransportError('VXI-11 create_link to %s (%s) failed: %s'
+                                     % (host, self.name, error_text(error)))
+        self.max_write = max(max_recv, 1024)
+        if self.verbose:
+            print('%s: link %d to %s:%d (%s), maxRecvSize %d' % (__name__, self.lid, host,
+                                                                   port, self.name, max_recv))
+
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+
+    def _reset_input(self):
+        self.rx_start = self.rx_end = 0
+        self.rx_eom = False
+
+
+    def _generic(self, proc):
+        """
+        Call procedure with Device_GenericParms, returns Device_Error.
+        """
+        self.rpc.call(proc, [GENERIC_PARMS.pack(self.lid, 0, self.lock_timeout,
+                                                 self.io_timeout)])
+        return self.rpc.recv_uint()
+
+
+    def _device_read(self, size, view=None):
+        """
+        Perform device_read. Data is received directly into view (upto its
+        length), and the rest into the receive buffer.
+
+        Returns number of bytes received into view, or None on I/O timeout.
+        """
+        rpc = self.rpc
+        rpc.call(DEVICE_READ, [READ_PARMS.pack(self.lid, size, self.io_timeout,
+                                               self.lock_timeout, 0, 0)])
+        error = rpc.recv_uint()
+        reason = rpc.recv_uint()
+        length = rpc.recv_uint()
+        n = 0
+        if view is not None and length > 0:
+            n = min(length, len(view))
+            rpc.recv_into(view[:n])
+        rest = length - n
+        if rest > 0:
+            if self.rx_end + rest > len(self.rxbuf):
+                self._make_room(rest)
+            rpc.recv_into(self.rxview[self.rx_end:self.rx_end + rest])
+            self.rx_end += rest
+        rpc.done()
+        if self.verbose > 1:
+            print('%s: device_read: %d bytes (reason %d, error %d)'
+                  % (__name__, length, reason, error))
+        if reason & REASON_END:
+            self.rx_eom = True
+        if error == ERROR_IO_TIMEOUT:
+            return None
+        if error:
+            raise SCPITransportError('VXI-11 device_read failed: %s' % (error_text(error)))
+        return n
+
+
+    def _make_room(self, size):
+        used = self.rx_end - self.rx_start
+        if self.rx_start > 0:
+            self.rxview[:used] = self.rxview[self.rx_start:self.rx_end]
+            self.rx_start = 0
+            self.rx_end = used
+        if used + size > len(self.rxbuf):
+            self.rxview.release()
+            self.rxbuf.extend(bytes(max(used + size, 2 * len(self.rxbuf)) - len(self.rxbuf)))
+            self.rxview = memoryview(self.rxbuf)
+
+
+    def read(self):
+        """
+        Read data (response message) from device.
+
+        Returns the data excluding any trailing whitespace.
+        """
+        while not self.rx_eom:
+            if self._device_read(self.READ_SIZE) is None:
+                if self.verbose:
+                    print('%s: read timeout' % (__name__))
+                break
+        r = bytes(self.rxview[self.rx_start:self._rstrip_end(self.rxbuf, self.rx_start,
+                                                             self.rx_end)])
+        self._reset_input()
+        if self.verbose:
+            print('Read: %d: %s' % (len(r), r))
+        return r
+
+
+    def read_into(self, buffer):
+        """
+        Read data (response message) from device directly into buffer.
+
+        Returns the number of bytes stored (excluding any trailing whitespace).
+        """
+        view = memoryview(buffer).cast('B')
+        n = self._store(buffer, self.rxbuf, self.rx_start, self.rx_end) \
+            if self.rx_end > self.rx_start else 0
+        self.rx_start = self.rx_end = 0
+        while not self.rx_eom:
+            if n >= len(view):
+                self.read()
+                raise SCPITransportError('Response does not fit in buffer (%d bytes)'
+                                         % (len(view)))
+            r = self._device_read(len(view) - n, view[n:])
+            if r is None:
+                break
+            n += r
+        self._reset_input()
+        n = self._rstrip_end(view, 0, n)
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def read_exact_into(self, buffer):
+        """
+        Read exactly len(buffer) bytes (of response message) from device
+        into buffer.
+        """
+        view = memoryview(buffer).cast('B')
+        n = min(self.rx_end - self.rx_start, len(view))
+        if n > 0:
+            view[:n] = self.rxview[self.rx_start:self.rx_start + n]
+            self.rx_start += n
+            if self.rx_start == self.rx_end:
+                self.rx_start = self.rx_end = 0
+        while n < len(view):
+            if self.rx_eom:
+                raise SCPITransportError('End of message (received %d of %d bytes)'
+                                         % (n, len(view)))
+            # request little extra to get the response terminator as well
+            r = self._device_read(len(view) - n + self.READ_EXTRA, view[n:])
+            if r is None:
+                raise SCPITransportError('Read timeout (received %d of %d bytes)'
+                                         % (n, len(view)))
+            n += r
+        if self.verbose:
+            print('Read: %d bytes' % (n))
+        return n
+
+
+    def _write(self, data, end):
+        """
+        Send data using device_write, split to maxRecvSize pieces.
+        END flag is set only on the last piece if :end: is True.
+        """
+        view = memoryview(data).cast('B')
+        pos = 0
+        while True:
+            part = view[pos:pos + self.max_write]
+            last = end and pos + len(part) >= len(view)
+            self.rpc.call(DEVICE_WRITE, [WRITE_PARMS.pack(
+                self.lid, self.io_timeout, self.lock_timeout,
+                FLAG_END if last else 0, len(part))] + xdr_opaque(part)[1:])
+            error = self.rpc.recv_uint()
+            size = self.rpc.recv_uint()
+            self.rpc.done()
+            if error:
+                raise SCPITransportError('VXI-11 device_write failed: %s' % (error_text(error)))
+            if size == 0 and len(part) > 0:
+                raise SCPITransportError('VXI-11 device_write: no data accepted')
+            pos += min(size, len(part))
+            if pos >= len(view):
+                return len(view)
+
+
+    def write(self, data):
+        """
+        Write data (command) to device.
+        """
+        if self.verbose:
+            print('Write: %d: %s' % (len(data), data))
+        # device discards unread response when it receives new command
+        self._reset_input()
+        return self._write(data, True)
+
+
+    def write_parts(self, parts):
+        """
+        Send multiple parts as a single message.
+        """
+        parts = list(parts)
+        self._reset_input()
+        n = 0
+        for i, part in enumerate(parts):
+            if len(part) > 0 or i == len(parts) - 1:
+                n += self._write(part, i == len(parts) - 1)
+        return n
+
+
+    def write_chunks(self, chunks):
+        """
+        Send message in chunks, END flag is set only with the last chunk.
+        """
+        self._reset_input()
+        it = iter(chunks)
+        prev = next(it, None)
+        if prev is None:
+            return 0
+        n = 0
+        for cur in it:
+            if len(prev) > 0:
+                n += self._write(prev, False)
+            prev = cur
+        return n + self._write(prev, True)
+
+
+    def pending_input(self):
+        """
+        Return number of bytes in the receive buffer.
+        """
+        return self.rx_end - self.rx_start
+
+
+    def wait_readable(self, timeout):
+        """
+        VXI-11 is message based: device sends data only as a response
+        to device_read, so only already received data is available.
+        """
+        return self.rx_end > self.rx_start
+
+
+    def read_stb(self):
+        """
+        Read status byte using device_readstb.
+        """
+        error = self._generic(DEVICE_READSTB)
+        stb = self.rpc.recv_uint()
+        self.rpc.done()
+        if error:
+            raise SCPITransportError('VXI-11 device_readstb failed: %s' % (error_text(error)))
+        return stb & 0xff
+
+
+    def trigger(self):
+        """
+        Send device trigger (device_trigger).
+        """
+        error = self._generic(DEVICE_TRIGGER)
+        self.rpc.done()
+        if error:
+            raise SCPITransportError('VXI-11 device_trigger failed: %s' % (error_text(error)))
+
+
+    def clear(self):
+        """
+        Device clear (device_clear).
+        """
+        error = self._generic(DEVICE_CLEAR)
+        self.rpc.done()
+        self._reset_input()
+        if error:
+            raise SCPITransportError('VXI-11 device_clear failed: %s' % (error_text(error)))
+        return True
+
+
+    def flush_input(self):
+        """
+        Flush input buffer.
+        """
+        self._reset_input()
+
+
+    def close(self):
+        """
+        Destroy link and close connection.
+        """
+        if self.rpc is None:
+            return
+        if self.lid is not None and self.rpc.sock is not None:
+            try:
+                self.rpc.call(DESTROY_LINK, [UINT.pack(self.lid)])
+                self.rpc.recv_uint()
+                self.rpc.done()
+            except SCPITransportError:
+                pass
+        self.lid = None
+        self.rpc.close()
+        self.rpc = None
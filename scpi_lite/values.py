@@ -0,0 +1,149 @@
+#
+# values.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import array
+import re
+
+from .exceptions import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+__all__ = ['parse_values']
+
+# SCPI sentinel values: 9.9E37 = +Infinity, -9.9E37 = -Infinity, 9.91E37 = NaN
+SCPI_INF = 9.9e37
+SCPI_NAN = 9.91e37
+
+WHITESPACE = b' \t\n\r\x0b\x0c'
+
+VALUE_RE = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+                      r'|[-+]?(?:INF|INFINITY|NAN)|NINF)', re.IGNORECASE)
+
+
+def _parse_field(field):
+    """
+    Parse single value (possibly followed by unit suffix).
+    """
+    m = VALUE_RE.match(field)
+    if not m:
+        raise SCPIError("Invalid numeric value: '%s'" % (field))
+    v = m.group(1).upper()
+    if v == 'NINF':
+        return float('-inf')
+    return float(v)
+
+
+def _parse_fields(text, separator):
+    try:
+        return list(map(float, text.split(separator)))
+    except ValueError:
+        # unit suffixes or other non-standard values
+        return [_parse_field(f) for f in text.split(separator)]
+
+
+def _strip(view):
+    """
+    Return memoryview without leading and trailing whitespace (no copy).
+    """
+    start = 0
+    end = len(view)
+    while start < end and view[start] in WHITESPACE:
+        start += 1
+    while end > start and view[end - 1] in WHITESPACE:
+        end -= 1
+    return view[start:end]
+
+
+def _parse_numpy(text, separator, sentinels):
+    count = text.count(separator) + 1
+    values = None
+    try:
+        values = np.fromstring(text, dtype=np.float64, sep=separator)
+    except ValueError:
+        pass
+    if values is None or len(values) != count:
+        values = np.array(_parse_fields(text, separator), dtype=np.float64)
+    if sentinels and (np.abs(values) >= SCPI_INF).any():
+        nan = np.abs(values) == SCPI_NAN
+        values[values >= SCPI_INF] = np.inf
+        values[values <= -SCPI_INF] = -np.inf
+        values[nan] = np.nan
+    return values
+
+
+def parse_values(data, numpy=False, separator=b',', sentinels=True):
+    """
+    Parse ASCII numeric response (comma separated list of values) into
+    array.array('d') or NumPy array (if numpy=True). NumPy is used for
+    parsing when it is available. Bytes-like data (like memoryview of
+    a read_bytes() buffer) is decoded directly without copying it first.
+
+    Values may have unit suffixes ('1.5V', '10 HZ'), that are ignored
+    (SI prefixes are not applied). NaN/INF/NINF are accepted.
+
+    :data: response (bytes, bytes-like object or string)
+    :numpy: return NumPy array [Default: False]
+    :separator: value separator [Default: ',']
+    :sentinels: convert SCPI 9.9E37 (+/-) to +/-infinity and 9.91E37 to NaN
+                [Default: True]
+    """
+    if numpy and np is None:
+        raise SCPIError("NumPy not available")
+    if isinstance(separator, bytes):
+        separator = separator.decode('ascii')
+    if isinstance(data, str):
+        text = data.strip()
+    else:
+        view = _strip(memoryview(data).cast('B'))
+        try:
+            text = str(view, 'ascii')
+        except UnicodeDecodeError:
+            # non-ASCII values are rejected by the parser
+            text = str(view, 'latin-1')
+
+    if np is not None:
+        if not text:
+            values = np.empty(0, dtype=np.float64)
+        else:
+            values = _parse_numpy(text, separator, sentinels)
+        if numpy:
+            return values
+        res = array.array('d')
+        res.frombytes(memoryview(values).cast('B'))
+        return res
+
+    if not text:
+        return array.array('d')
+    values = array.array('d', _parse_fields(text, separator))
+    # str.find() is much faster than regex search for the rare sentinels
+    if sentinels and any([text.find(s) >= 0 for s in ('E37', 'E+37', 'e37', 'e+37')]):
+        for i, v in enumerate(values):
+            if abs(v) == SCPI_NAN:
+                values[i] = float('nan')
+            elif v >= SCPI_INF:
+                values[i] = float('inf')
+            elif v <= -SCPI_INF:
+                values[i] = float('-inf')
+    return values
@@ -0,0 +1,238 @@
+#
+# worker.py
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import queue
+import threading
+from concurrent.futures import Future
+
+from .batch import SCPIBatch
+from .stats import normalize_header
+from .exceptions import *
+
+
+__all__ = ['SCPIWorker']
+
+_STOP = object()
+
+
+def coalescible(cmd):
+    """
+    Return True if query can be safely coalesced with other queries
+    into one program message: a single query (no compound message or
+    block data) producing a single response message unit.
+    """
+    cmd = cmd.strip()
+    if not cmd or ';' in cmd or '#' in cmd or '"' in cmd or "'" in cmd:
+        return False
+    return cmd.split(None, 1)[0].endswith('?')
+
+
+class _Request(object):
+
+    def __init__(self, func, args, kwargs, query=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.query = query
+        self.future = Future()
+
+
+
+class SCPIWorker(object):
+    """
+    SCPIWorker runs all I/O to a SCPIDevice in a dedicated worker thread.
+    Requests are taken from a queue and each request (command, query, ...)
+    is run atomically, so a device can be safely shared between threads.
+    Results are returned as concurrent.futures.Future objects.
+
+    Simple queries (without multi-line/block options, see coalescible())
+    that are queued back-to-back are coalesced into one program message
+    (see SCPIBatch). Readiness policy is checked once before the message,
+    and statistics are collected for the coalesced message.
+
+    Worker is normally started using SCPIDevice.enable_worker() (or
+    worker=True option), after which SCPIDevice methods called from other
+    threads are dispatched to the worker automatically:
+
+        w = dev.enable_worker()
+        f1 = w.query('MEAS:VOLT?')
+        f2 = w.query('MEAS:CURR?')
+        print(f1.result(), f2.result())
+    """
+
+    def __init__(self, device, coalesce=True, max_coalesce=32):
+        """
+        Start I/O worker thread for SCPIDevice.
+
+        :device: SCPIDevice to run requests on.
+        :coalesce: coalesce queued queries into one program message
+                   [Default: True]
+        :max_coalesce: maximum number of queries to coalesce [Default: 32]
+        """
+        self.device = device
+        self.coalesce = coalesce
+        self.max_coalesce = max_coalesce
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name='SCPIWorker')
+        self.thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+    def in_worker(self):
+        """
+        Return True if called from the worker thread.
+        """
+        return threading.get_ident() == self.thread.ident
+
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue function to be called in the worker thread. Returns Future.
+        """
+        return self._put(_Request(func, args, kwargs))
+
+
+    def command(self, cmd):
+        """
+        Queue a SCPI command (see SCPIDevice.command()). Returns Future.
+        """
+        return self.submit(self.device.command, cmd)
+
+
+    def query(self, cmd, **options):
+        """
+        Queue a SCPI query (see SCPIDevice.query()). Returns Future.
+        """
+        if options or not self.coalesce or not coalescible(cmd):
+            return self.submit(self.device.query, cmd, **options)
+        return self._put(_Request(self.device.query, (cmd,), {}, query=cmd))
+
+
+    def query_binary(self, cmd, **options):
+        """
+        Queue a binary block query (see SCPIDevice.query_binary()). Returns Future.
+        """
+        return self.submit(self.device.query_binary, cmd, **options)
+
+
+    def write_binary(self, cmd, data):
+        """
+        Queue a binary block upload (see SCPIDevice.write_binary()). Returns Future.
+        """
+        return self.submit(self.device.write_binary, cmd, data)
+
+
+    def stop(self):
+        """
+        Stop worker thread after all queued requests have been processed.
+        """
+        if self.thread.is_alive():
+            self.requests.put(_STOP)
+            if not self.in_worker():
+                self.thread.join()
+
+
+    def _put(self, req):
+        if not self.thread.is_alive():
+            raise SCPIError("Worker not running")
+        self.requests.put(req)
+        return req.future
+
+
+    def _call(self, req):
+        try:
+            req.future.set_result(req.func(*req.args, **req.kwargs))
+        except BaseException as err:
+            req.future.set_exception(err)
+
+
+    def _run_queries(self, reqs):
+        dev = self.device
+        st = dev._stats
+        if st:
+            rec = st.begin(';'.join([r.query for r in reqs]))
+            rec.header = ';'.join([normalize_header(r.query) for r in reqs])
+        b = SCPIBatch(dev)
+        res = [b.query(r.query) for r in reqs]
+        try:
+            if not dev.readiness.wait_ready(dev, reqs[0].query):
+                raise SCPIError("Device not ready!")
+            if st:
+                rec.mark('ready', 'read')
+            b.run()
+        except BaseException as err:
+            for r in reqs:
+                r.future.set_exception(err)
+            return
+        finally:
+            if st:
+                if rec.phase == 'read':
+                    rec.mark('read')
+                st.end(rec)
+        for r, q in zip(reqs, res):
+            dev.readiness.completed(dev, r.query, True)
+            # same semantics as SCPIDevice.query(): error is only stored
+            if q.error is not None:
+                dev.last_error = q.error
+            if q.response is None:
+                r.future.set_exception(SCPIError("Query failed: %s: %s"
+                                                 % (r.query, q.error or 'no response')))
+            else:
+                r.future.set_result(q.response)
+
+
+    def _run(self):
+        pending = None
+        while True:
+            if pending is None:
+                req = self.requests.get()
+            else:
+                req, pending = pending, None
+            if req is _STOP:
+                break
+            if not req.future.set_running_or_notify_cancel():
+                continue
+            if req.query is None:
+                self._call(req)
+                continue
+            reqs = [req]
+            while len(reqs) < self.max_coalesce:
+                try:
+                    next = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if next is _STOP or next.query is None:
+                    pending = next
+                    break
+                if next.future.set_running_or_notify_cancel():
+                    reqs.append(next)
+            if len(reqs) == 1:
+                self._call(req)
+            else:
+                self._run_queries(reqs)
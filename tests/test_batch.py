@@ -0,0 +1,77 @@
+#
+# test_batch.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for SCPIBatch program message construction against a simulated
+instrument that resolves compound headers like a real instrument.
+"""
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+@pytest.fixture
+def device():
+    inst = TCPInstrument(responses={'SOUR:VOLT': None, 'SOUR:VOLT?': '5',
+                                    'MEAS:VOLT?': '4.99', 'MEAS:CURR?': '0.1'})
+    inst.start()
+    dev = SCPIDevice(inst.device, transport='tcp', timeout=2)
+    yield dev, inst
+    dev.close()
+    inst.stop()
+
+
+def test_batch_units_anchored_to_root(device):
+    dev, inst = device
+    with dev.batch() as b:
+        b.command('SOUR:VOLT 5')
+        v = b.query('SOUR:VOLT?')
+        m = b.query('MEAS:VOLT?')
+        c = b.query('MEAS:CURR?')
+    assert b.errors == []
+    assert v.result() == '5'
+    assert m.result() == '4.99'
+    assert c.result() == '0.1'
+    assert v.error.startswith('0,')
+
+
+def test_batch_error_mapped_to_command(device):
+    dev, inst = device
+    with dev.batch() as b:
+        b.command('SOUR:VOLT 5')
+        bad = b.command('SOUR:BOGUS 1')
+        m = b.query('MEAS:VOLT?')
+    assert m.result() == '4.99'
+    assert b.errors == [('SOUR:BOGUS 1', bad.error)]
+    assert bad.error.startswith('-113,')
+
+
+def test_batch_message_size_in_bytes(device):
+    dev, inst = device
+    b = dev.batch(max_size=64)
+    for i in range(8):
+        b.command('SOUR:VOLT %d' % (i))
+    for units in b._messages():
+        message = ';'.join([u[0] for u in units]) + dev.command_terminator
+        assert len(message.encode(dev.encoding)) <= 64
@@ -0,0 +1,113 @@
+#
+# test_drain.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for BufferDrain against a simulated instrument that keeps acquiring
+readings into its buffer while an overlapped INIT operation is running.
+"""
+
+import time
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+class Acquisition(object):
+    """
+    Simulated reading buffer filled at :rate: readings/second for
+    :duration: seconds after INIT.
+    """
+
+    def __init__(self, inst, rate=1000, duration=1.0):
+        self.inst = inst
+        self.rate = rate
+        self.duration = duration
+        self.start = None
+        self.total = int(rate * duration)
+        inst.responses['INIT'] = self.init
+        inst.responses['TRAC:POIN:ACT?'] = self.level
+        inst.responses['TRAC:DATA?'] = self.data
+
+
+    def init(self, cmd):
+        self.start = time.monotonic()
+        self.inst._start_operation(self.duration)
+
+
+    def level(self, cmd=None):
+        if self.start is None:
+            return '0'
+        return str(min(self.total, int((time.monotonic() - self.start) * self.rate)))
+
+
+    def data(self, cmd):
+        start, end = [int(x) for x in cmd.split()[1].split(b',')]
+        return ','.join(['%d' % (i) for i in range(start - 1, end)])
+
+
+
+@pytest.fixture(params=[False, True], ids=['direct', 'worker'])
+def device(request):
+    inst = TCPInstrument()
+    acq = Acquisition(inst)
+    inst.start()
+    dev = SCPIDevice(inst.device, transport='tcp', timeout=2, worker=request.param)
+    yield dev, acq
+    dev.close()
+    inst.stop()
+
+
+def test_drain_overlaps_acquisition(device):
+    dev, acq = device
+    chunks = []
+
+    def sink(values):
+        chunks.append((time.monotonic(), len(values), values[0]))
+
+    op = dev.start_operation('INIT')
+    dev.drain_buffer(sink=sink, operation=op, interval=0.02, timeout=10)
+    done = acq.start + acq.duration
+
+    assert sum([c[1] for c in chunks]) == acq.total
+    # readings arrive in order, in chunks during the acquisition
+    assert [c[2] for c in chunks] == sorted([c[2] for c in chunks])
+    assert len(chunks) > 5
+    assert chunks[0][0] < done - 0.5
+    assert len([c for c in chunks if c[0] < done]) > 5
+
+
+def test_drain_values(device):
+    dev, acq = device
+    op = dev.start_operation('INIT')
+    data = dev.drain_buffer(operation=op, interval=0.02, timeout=10)
+    assert list(data) == [float(i) for i in range(acq.total)]
+
+
+def test_drain_total(device):
+    dev, acq = device
+    op = dev.start_operation('INIT')
+    time.sleep(0.2)
+    data = dev.drain_buffer(total=150, chunk=100, interval=0.02, timeout=10)
+    assert list(data) == [float(i) for i in range(150)]
+    op.wait(5)
@@ -0,0 +1,248 @@
+#
+# test_hislip.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for HiSLIP transport against a stand-in HiSLIP server
+(bench HiSLIPInstrument).
+"""
+
+import time
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.exceptions import SCPITransportError
+from scpi_lite.transports import hislip
+from scpi_lite.transports.hislip import HiSLIPDevice
+from scpi_lite.bench.instruments import HiSLIPInstrument
+
+
+BLOCK = bytes(range(256)) * 40
+
+
+def responses():
+    return {
+        'MEAS?': '1.234',
+        'LONG?': ','.join(['%d' % (i) for i in range(2000)]),
+        'CURV?': b'#510240' + BLOCK,
+        'SLOW?': lambda cmd: (time.sleep(0.15), 'late')[1],
+    }
+
+
+@pytest.fixture
+def instrument():
+    insts = []
+
+    def _start(**args):
+        inst = HiSLIPInstrument(responses=responses(), **args)
+        inst.start()
+        insts.append(inst)
+        return inst
+
+    yield _start
+    for inst in insts:
+        inst.stop()
+
+
+def connect(inst, **args):
+    return HiSLIPDevice(inst.host, 'hislip0,%d' % (inst.port), timeout=2, **args)
+
+
+def test_sub_address():
+    assert hislip.parse_sub_address('hislip0') == ('hislip0', hislip.HISLIP_PORT)
+    assert hislip.parse_sub_address('hislip1,4881') == ('hislip1', 4881)
+
+
+def test_data_split_across_messages(instrument):
+    inst = instrument(chunk_size=7)
+    conn = connect(inst)
+    try:
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+        conn.write(b'LONG?\n')
+        assert conn.read() == responses()['LONG?'].encode('ascii')
+        # response fragments into a buffer
+        conn.write(b'LONG?\n')
+        buf = bytearray(16384)
+        n = conn.read_into(buf)
+        assert bytes(buf[:n]) == responses()['LONG?'].encode('ascii')
+    finally:
+        conn.close()
+
+
+def test_read_into_too_small_buffer(instrument):
+    inst = instrument(chunk_size=100)
+    conn = connect(inst)
+    try:
+        conn.write(b'LONG?\n')
+        with pytest.raises(SCPITransportError):
+            conn.read_into(bytearray(1000))
+        # rest of the response was discarded
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('chunk_size', [0, 1, 100, 4093])
+def test_read_exact_across_messages(instrument, chunk_size):
+    inst = instrument(chunk_size=chunk_size)
+    dev = SCPIDevice(inst.device, timeout=2)
+    try:
+        data = dev.query_binary('CURV?')
+        assert data == BLOCK
+        assert dev.query('MEAS?') == '1.234'
+    finally:
+        dev.close()
+
+
+def test_read_exact_end_of_message(instrument):
+    inst = instrument(chunk_size=3)
+    conn = connect(inst)
+    try:
+        conn.write(b'MEAS?\n')
+        with pytest.raises(SCPITransportError):
+            conn.read_exact_into(bytearray(100))
+    finally:
+        conn.close()
+
+
+def test_overlapped_pipelining(instrument):
+    inst = instrument(overlapped=True)
+    conn = connect(inst)
+    try:
+        assert conn.overlapped and conn.pipelined
+        # all queries are sent before reading any responses
+        for q in (b'MEAS?\n', b'*IDN?\n', b'LONG?\n', b'MEAS?\n'):
+            conn.write(q)
+        assert conn.read() == b'1.234'
+        assert conn.read() == HiSLIPInstrument.idn.encode('ascii')
+        assert conn.read() == responses()['LONG?'].encode('ascii')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+def test_overlapped_batch(instrument):
+    inst = instrument(overlapped=True)
+    dev = SCPIDevice(inst.device, timeout=2)
+    try:
+        assert dev.conn.pipelined
+        b = dev.batch(max_size=40)
+        res = [b.query('MEAS?') for i in range(10)]
+        assert len(b._messages()) > 1
+        assert b.run() == []
+        assert [r.result() for r in res] == ['1.234'] * 10
+    finally:
+        dev.close()
+
+
+def test_synchronized_mode(instrument):
+    inst = instrument(overlapped=False)
+    conn = connect(inst)
+    try:
+        assert not conn.overlapped and not conn.pipelined
+        conn.clear(overlapped=True)
+        assert conn.overlapped
+        conn.clear(overlapped=False)
+        assert not conn.overlapped
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+def test_clear_discards_pending_response(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    try:
+        conn.write(b'SLOW?\n')
+        conn.write(b'LONG?\n')
+        assert conn.clear() is True
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+        assert conn.pending_input() == 0
+    finally:
+        conn.close()
+
+
+def test_clear_after_timeout(instrument):
+    inst = instrument()
+    dev = SCPIDevice(inst.device, timeout=0.1)
+    try:
+        dev.write('SLOW?')
+        assert dev.read() == ''
+        assert dev.clear() is True
+        assert dev.query('MEAS?') == '1.234'
+    finally:
+        dev.close()
+
+
+def test_read_stb(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    try:
+        assert conn.read_stb() == 0
+        # error in the error queue sets EAV bit
+        conn.write(b'BOGUS\n')
+        deadline = time.monotonic() + 2
+        while not conn.read_stb() & 0x04 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert conn.read_stb() & 0x04
+        conn.write(b'*CLS\n')
+        conn.write(b'*OPC?\n')
+        assert conn.read() == b'1'
+        assert conn.read_stb() == 0
+    finally:
+        conn.close()
+
+
+def test_wait_srq(instrument):
+    inst = instrument()
+    inst.responses['INIT'] = lambda cmd: inst._start_operation(0.3)
+    conn = connect(inst)
+    try:
+        conn.write(b'*ESE 1;*SRE 32;*ESR?\n')
+        assert conn.read() == b'0'
+        start = time.monotonic()
+        conn.write(b'INIT;*OPC\n')
+        assert conn.wait_srq(0.05) is False
+        assert conn.wait_srq(2) is True
+        assert time.monotonic() - start >= 0.25
+        assert conn.read_stb() & 0x60 == 0x60
+        conn.write(b'*ESR?\n')
+        assert conn.read() == b'1'
+        assert conn.read_stb() & 0x40 == 0
+    finally:
+        conn.close()
+
+
+def test_operation_completion_by_srq(instrument):
+    inst = instrument()
+    inst.responses['INIT'] = lambda cmd: inst._start_operation(0.3)
+    dev = SCPIDevice(inst.device, timeout=2)
+    try:
+        op = dev.start_operation('INIT', max_interval=10)
+        assert op.wait(5)
+        assert 0.25 <= op.elapsed < 1.0
+    finally:
+        dev.close()
@@ -0,0 +1,84 @@
+#
+# test_pool.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for InstrumentPool against simulated TCP instruments.
+"""
+
+import time
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.pool import InstrumentPool
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+def slow(cmd):
+    time.sleep(0.15)
+    return '1.0'
+
+
+@pytest.fixture
+def instruments():
+    insts = []
+
+    def _start(count, **args):
+        for i in range(count):
+            inst = TCPInstrument(responses={'SLOW?': slow}, **args)
+            inst.start()
+            insts.append(inst)
+        return insts
+
+    yield _start
+    for inst in insts:
+        inst.stop()
+
+
+def test_deadline_from_start(instruments):
+    # operations queued for a free thread don't exceed the deadline
+    insts = instruments(3)
+    with InstrumentPool([i.device for i in insts], max_workers=1,
+                        transport='tcp', timeout=2) as pool:
+        res = pool.query_all('SLOW?', deadline=0.3)
+        assert [r.value for r in res.values()] == ['1.0'] * 3
+        assert max([r.elapsed for r in res.values()]) < 0.3
+
+
+def test_late_open_closed(instruments, monkeypatch):
+    closed = []
+    close = SCPIDevice.close
+
+    def _close(dev):
+        closed.append(dev.device)
+        close(dev)
+
+    monkeypatch.setattr(SCPIDevice, 'close', _close)
+    insts = instruments(1, latency=0.1)
+    pool = InstrumentPool([insts[0].device], deadline=0.05, transport='tcp', timeout=2)
+    res = pool.open_results[insts[0].device]
+    assert not res.ok
+    assert 'Deadline' in str(res.error)
+    assert len(pool) == 0
+    pool.close()
+    # device opened after the deadline has been closed
+    assert closed == [insts[0].device]
@@ -0,0 +1,62 @@
+#
+# test_query.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for multi-line query responses against a simulated TCP instrument.
+"""
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.scpi import MultiLineResponse
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+@pytest.fixture
+def device():
+    inst = TCPInstrument(responses={'LIST?': 'a\n1\nb', 'MEAS:VOLT?': '4.99'})
+    inst.start()
+    dev = SCPIDevice(inst.device, transport='tcp', timeout=2)
+    yield dev, inst
+    dev.close()
+    inst.stop()
+
+
+def test_opc_marker_only_at_end():
+    m = MultiLineResponse(opc=True)
+    assert not m.add('a\n1\nb')
+    assert not m.add('1', more=True)
+    assert m.add('c;1')
+    assert m.text() == 'a\n1\nb\n1\nc'
+
+
+def test_query_opc_data_line_1(device):
+    dev, inst = device
+    assert dev.query('LIST?', opc=True) == 'a\n1\nb'
+    # stream stays in sync
+    assert dev.query('MEAS:VOLT?') == '4.99'
+
+
+def test_query_lines(device):
+    dev, inst = device
+    assert dev.query('LIST?', lines=3) == 'a\n1\nb'
+    assert dev.query('MEAS:VOLT?') == '4.99'
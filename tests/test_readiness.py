@@ -0,0 +1,86 @@
+#
+# test_readiness.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for readiness policies.
+"""
+
+import time
+
+from scpi_lite.readiness import LearnedReadiness
+
+
+class Device(object):
+    """
+    Device without *OPC? support (readiness policy only uses these).
+    """
+
+    quirk_no_opc = True
+    no_opc_delay = 0.1
+
+    def __init__(self, profile=None):
+        self.quirk_profile = profile
+        self.checks = 0
+
+    def unit_ready(self):
+        self.checks += 1
+        time.sleep(self.no_opc_delay)
+        return 1
+
+
+def timed(func, *args):
+    start = time.monotonic()
+    func(*args)
+    return time.monotonic() - start
+
+
+def test_learned_no_opc_per_header_delay():
+    dev = Device({'ready_delays': {'VOLTage': 0.02, 'OUTP': 0.2}})
+    r = LearnedReadiness()
+    # no wait after queries
+    r.completed(dev, 'MEAS:VOLT?', True)
+    assert timed(r.wait_ready, dev, 'VOLT 1') < 0.01
+    r.completed(dev, 'VOLT 1', False)
+    t = timed(r.wait_ready, dev, 'CURR 1')
+    assert 0.015 < t < 0.08
+    r.completed(dev, 'CURR 1', False)
+    t = timed(r.wait_ready, dev, 'OUTP 1')
+    assert 0.08 < t < 0.15
+    r.completed(dev, 'VOLT 2;OUTP 1', False)
+    t = timed(r.wait_ready, dev, 'MEAS:VOLT?')
+    assert 0.18 < t < 0.25
+    assert r.estimate('VOLT') == 0.02
+    assert dev.checks == 0
+
+
+def test_learned_no_opc_think_time():
+    # caller's think time counts towards the delay
+    dev = Device()
+    r = LearnedReadiness()
+    r.completed(dev, 'VOLT 1', False)
+    time.sleep(0.07)
+    t = timed(r.wait_ready, dev, 'VOLT 2')
+    assert 0.01 < t < 0.06
+    r.completed(dev, 'VOLT 2', False)
+    time.sleep(0.12)
+    assert timed(r.wait_ready, dev, 'VOLT 3') < 0.01
+    assert dev.checks == 0
@@ -0,0 +1,71 @@
+#
+# test_replay.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for recording (RecordingTransport) and playback (ReplayDevice).
+"""
+
+import io
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.exceptions import SCPIError
+from scpi_lite.transports.replay import read_records, WRITE
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+DATA = bytes(range(256)) * 400
+
+
+def record(filename, data, chunk_size):
+    inst = TCPInstrument(responses={'DATA': lambda cmd: None, 'MEAS:VOLT?': '4.99'})
+    inst.start()
+    try:
+        dev = SCPIDevice(inst.device, transport='tcp', timeout=2, record=filename)
+        dev.write_block('DATA', data, chunk_size=chunk_size)
+        assert dev.query('MEAS:VOLT?') == '4.99'
+        dev.close()
+    finally:
+        inst.stop()
+
+
+def test_record_write_chunks(tmp_path):
+    filename = str(tmp_path / 'session.rec')
+    # file object data is read into reused buffers
+    record(filename, io.BytesIO(DATA), 4096)
+    record(filename, DATA, 1000)
+    sessions = read_records(filename)
+    assert len(sessions) == 2
+    for session in sessions:
+        writes = [r[2] for r in session if r[0] == WRITE]
+        assert b'DATA #6102400' + DATA + b'\n' in writes
+
+    dev = SCPIDevice('replay:' + filename)
+    dev.write_block('DATA', io.BytesIO(DATA), chunk_size=333)
+    assert dev.query('MEAS:VOLT?') == '4.99'
+    dev.close()
+
+    dev = SCPIDevice('replay:' + filename)
+    with pytest.raises(SCPIError, match='mismatch'):
+        dev.write_block('DATA', DATA[:-1] + b'x')
+    dev.close()
@@ -0,0 +1,69 @@
+#
+# test_stream.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for SCPIStream against a simulated TCP instrument.
+"""
+
+import time
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+class Counter(object):
+    """
+    Query returning increasing sample numbers, first response is late.
+    """
+
+    def __init__(self, delay=0.15):
+        self.n = 0
+        self.delay = delay
+
+    def __call__(self, cmd):
+        self.n += 1
+        if self.n == 1:
+            time.sleep(self.delay)
+        return str(self.n)
+
+
+@pytest.fixture(params=[None, False], ids=['unsupported', 'failed'])
+def device(request):
+    inst = TCPInstrument(responses={'READ?': Counter()})
+    inst.start()
+    dev = SCPIDevice(inst.device, transport='tcp', timeout=0.1)
+    # device clear not supported by the transport, or failing
+    dev.conn.clear = lambda: request.param
+    yield dev
+    dev.close()
+    inst.stop()
+
+
+def test_resync_after_timeout(device):
+    assert device.clear() is False
+    with device.stream('READ?', count=4) as s:
+        samples = [v for ts, v in s]
+    # late response to the first query is discarded
+    assert samples == ['2', '3', '4', '5']
+    assert s.timeouts == 1
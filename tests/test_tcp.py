@@ -0,0 +1,175 @@
+#
+# test_tcp.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for TCPDevice receive path (response framing) using a local socket
+server that fragments and coalesces responses.
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from scpi_lite.transports.tcp import TCPDevice
+
+
+class ScriptedServer(object):
+    """
+    Local TCP server that sends scripted data for each received command:
+    list of sends (bytes), each send is written with a separate send()
+    call with a short delay in between (to get separate TCP segments).
+    """
+
+    def __init__(self, script, delay=0.002):
+        self.script = list(script)
+        self.delay = delay
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def _run(self):
+        conn, addr = self.sock.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            for sends in self.script:
+                if not conn.recv(65536):
+                    break
+                for data in sends:
+                    conn.sendall(data)
+                    time.sleep(self.delay)
+            # wait for client to close connection
+            conn.recv(1)
+
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(5)
+
+
+
+@pytest.fixture
+def connect():
+    servers = []
+    devices = []
+
+    def _connect(script, delay=0.002, timeout=2):
+        srv = ScriptedServer(script, delay)
+        dev = TCPDevice('127.0.0.1', srv.port, timeout=timeout)
+        servers.append(srv)
+        devices.append(dev)
+        return dev
+
+    yield _connect
+    for dev in devices:
+        dev.close()
+    for srv in servers:
+        srv.close()
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_response_split_across_recvs(connect):
+    resp = b'1.234567E+00,2.345678E+00,3.456789E+00\n'
+    dev = connect([split(resp, 1)])
+    dev.write(b'MEAS?\n')
+    assert dev.read() == resp.rstrip()
+    assert dev.pending_input() == 0
+
+
+def test_terminator_in_separate_segment(connect):
+    dev = connect([[b'ABC', b'DEF', b'\n'], [b'\n']])
+    dev.write(b'Q1?\n')
+    assert dev.read() == b'ABCDEF'
+    dev.write(b'Q2?\n')
+    assert dev.read() == b''
+
+
+def test_coalesced_responses_with_partial(connect):
+    # three complete responses and start of fourth one in a single send,
+    # rest of the fourth response arrives later in pieces
+    dev = connect([[b'r1\nr2\r\nr3\npar', b'ti', b'al\n']])
+    dev.write(b'Q1?;Q2?;Q3?;Q4?\n')
+    assert dev.read() == b'r1'
+    assert dev.read() == b'r2'
+    assert dev.read() == b'r3'
+    assert dev.read() == b'partial'
+    assert dev.pending_input() == 0
+
+
+def test_coalesced_responses_across_commands(connect):
+    # response to the second command arrives together with the first one
+    dev = connect([[b'first\nsec'], [b'ond\nthird\n']])
+    dev.write(b'Q1?\n')
+    assert dev.read() == b'first'
+    dev.write(b'Q2?\n')
+    assert dev.read() == b'second'
+    assert dev.read() == b'third'
+
+
+def test_large_fragmented_response(connect):
+    # response larger than the initial receive buffer, in odd sized pieces
+    payload = b','.join(b'%d' % i for i in range(40000))
+    resp = payload + b'\nnext\n'
+    dev = connect([split(resp, 7919)], delay=0)
+    dev.write(b'DATA?\n')
+    assert len(payload) > TCPDevice.READ_BUF_SIZE
+    assert dev.read() == payload
+    assert dev.read() == b'next'
+
+
+def test_read_into_coalesced(connect):
+    dev = connect([[b'12345\n678', b'90\n']])
+    dev.write(b'Q1?;Q2?\n')
+    buf = bytearray(16)
+    n = dev.read_into(buf)
+    assert bytes(buf[:n]) == b'12345'
+    n = dev.read_into(buf)
+    assert bytes(buf[:n]) == b'67890'
+
+
+def test_read_exact_after_coalesced(connect):
+    # binary block data partially in the receive buffer after the header
+    block = bytes(range(256)) * 4
+    dev = connect([[b'#41024' + block[:100]] + split(block[100:], 333) + [b'\nOK\n']])
+    dev.write(b'CURV?\n')
+    header = bytearray(6)
+    assert dev.read_exact_into(header) == 6
+    assert header == b'#41024'
+    data = bytearray(1024)
+    assert dev.read_exact_into(data) == 1024
+    assert data == block
+    assert dev.read() == b''
+    assert dev.read() == b'OK'
+
+
+def test_read_timeout_returns_partial(connect):
+    dev = connect([[b'no terminator']], timeout=0.2)
+    dev.write(b'Q?\n')
+    assert dev.read() == b'no terminator'
@@ -0,0 +1,244 @@
+#
+# test_vxi11.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for VXI-11 transport against a stand-in ONC RPC server
+(bench VXI11Instrument: portmapper and core channel).
+"""
+
+import socket
+import time
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.exceptions import SCPITransportError
+from scpi_lite.transports import vxi11
+from scpi_lite.transports.vxi11 import VXI11Device
+from scpi_lite.bench.instruments import VXI11Instrument
+
+
+BLOCK = bytes(range(256)) * 40
+LONG = ','.join(['%d' % (i) for i in range(2000)])
+
+
+@pytest.fixture
+def instrument():
+    insts = []
+
+    def _start(**args):
+        inst = VXI11Instrument(responses={'MEAS?': '1.234', 'LONG?': LONG,
+                                          'CURV?': b'#510240' + BLOCK}, **args)
+        inst.start()
+        insts.append(inst)
+        return inst
+
+    yield _start
+    for inst in insts:
+        inst.stop()
+        vxi11.invalidate_port(inst.host, vxi11.DEVICE_CORE, vxi11.DEVICE_CORE_VERSION,
+                              inst.pmap_port)
+
+
+def connect(inst, **args):
+    return VXI11Device(inst.host, 'inst0', timeout=2, pmap_port=inst.pmap_port, **args)
+
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def test_portmapper_lookup(instrument):
+    inst = instrument()
+    port = vxi11.get_port(inst.host, vxi11.DEVICE_CORE, vxi11.DEVICE_CORE_VERSION,
+                          pmap_port=inst.pmap_port, cache=False)
+    assert port == inst.port
+    # cached lookup doesn't call portmapper
+    calls = inst.rpc_calls
+    assert vxi11.get_port(inst.host, vxi11.DEVICE_CORE, vxi11.DEVICE_CORE_VERSION,
+                          pmap_port=inst.pmap_port) == inst.port
+    assert inst.rpc_calls == calls
+    # unregistered program
+    with pytest.raises(SCPITransportError, match='not available'):
+        vxi11.get_port(inst.host, 0x12345, 1, pmap_port=inst.pmap_port, cache=False)
+
+
+def test_stale_cached_port(instrument):
+    inst = instrument()
+    key = (inst.host, inst.pmap_port, vxi11.DEVICE_CORE, vxi11.DEVICE_CORE_VERSION)
+    vxi11._port_cache[key] = free_port()
+    conn = connect(inst)
+    try:
+        assert vxi11._port_cache[key] == inst.port
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+def test_create_link_error(instrument):
+    inst = instrument()
+    with pytest.raises(SCPITransportError, match='device not accessible'):
+        VXI11Device(inst.host, 'inst9', timeout=2, pmap_port=inst.pmap_port)
+
+
+@pytest.mark.parametrize('chunk_size', [0, 7, 1000])
+def test_read_end_across_replies(instrument, chunk_size):
+    # response is split to multiple device_read replies (END on the last
+    # one), and RPC replies to multiple record fragments
+    inst = instrument(chunk_size=chunk_size)
+    conn = connect(inst)
+    try:
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+        calls = inst.rpc_calls
+        conn.write(b'LONG?\n')
+        assert conn.read() == LONG.encode('ascii')
+        reads = inst.rpc_calls - calls - 1
+        if chunk_size:
+            assert reads == (len(LONG) + 1 + chunk_size - 1) // chunk_size
+        else:
+            assert reads == 1
+        conn.write(b'LONG?\n')
+        buf = bytearray(16384)
+        n = conn.read_into(buf)
+        assert bytes(buf[:n]) == LONG.encode('ascii')
+    finally:
+        conn.close()
+
+
+def test_read_into_too_small_buffer(instrument):
+    inst = instrument(chunk_size=100)
+    conn = connect(inst)
+    try:
+        conn.write(b'LONG?\n')
+        with pytest.raises(SCPITransportError):
+            conn.read_into(bytearray(1000))
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('chunk_size', [0, 3, 1000])
+def test_read_exact_across_replies(instrument, chunk_size):
+    inst = instrument(chunk_size=chunk_size)
+    dev = SCPIDevice(inst.device, timeout=2, pmap_port=inst.pmap_port)
+    try:
+        assert dev.query_binary('CURV?') == BLOCK
+        assert dev.query('MEAS?') == '1.234'
+    finally:
+        dev.close()
+
+
+def test_write_split_to_max_recv_size(instrument):
+    inst = instrument(max_recv_size=1024)
+    inst.responses['DATA'] = lambda cmd: None
+    conn = connect(inst)
+    try:
+        data = b'DATA ' + b'x' * 5000 + b'\n'
+        calls = inst.rpc_calls
+        assert conn.write(data) == len(data)
+        assert inst.rpc_calls - calls == (len(data) + 1023) // 1024
+        conn.write(b'SYST:ERR?\n')
+        assert conn.read().startswith(b'0,')
+    finally:
+        conn.close()
+
+
+def test_read_timeout(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    try:
+        # no response queued: device reports I/O timeout
+        assert conn.read() == b''
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+def test_read_stb(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    try:
+        assert conn.read_stb() == 0
+        conn.write(b'BOGUS\n')
+        assert conn.read_stb() == 0x04
+        conn.write(b'SYST:ERR?\n')
+        assert conn.read().startswith(b'-113,')
+        assert conn.read_stb() == 0
+    finally:
+        conn.close()
+
+
+def test_clear(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    try:
+        conn.write(b'LONG?\n')
+        assert conn.clear() is True
+        assert conn.read() == b''
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+    finally:
+        conn.close()
+
+
+def test_device_errors(instrument):
+    inst = instrument()
+    conn = connect(inst)
+    lid = conn.lid
+    try:
+        conn.lid = lid + 100
+        with pytest.raises(SCPITransportError, match='invalid link identifier'):
+            conn.write(b'MEAS?\n')
+        with pytest.raises(SCPITransportError, match='invalid link identifier'):
+            conn.read()
+        with pytest.raises(SCPITransportError, match='invalid link identifier'):
+            conn.read_stb()
+        with pytest.raises(SCPITransportError, match='invalid link identifier'):
+            conn.clear()
+        conn.lid = lid
+        conn.write(b'MEAS?\n')
+        assert conn.read() == b'1.234'
+        # RPC level error
+        with pytest.raises(SCPITransportError, match='procedure unavailable'):
+            conn.rpc.call(99, [])
+    finally:
+        conn.close()
+
+
+def test_operation_completion(instrument):
+    inst = instrument()
+    inst.responses['INIT'] = lambda cmd: inst._start_operation(0.2)
+    dev = SCPIDevice(inst.device, timeout=2, pmap_port=inst.pmap_port)
+    try:
+        op = dev.start_operation('INIT')
+        assert op.wait(5)
+        assert op.elapsed >= 0.15
+    finally:
+        dev.close()
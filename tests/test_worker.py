@@ -0,0 +1,154 @@
+#
+# test_worker.py
+#
+# This file is part of scpi_lite python library.
+#
+# Copyright (C) 2020 Timo Kokkonen <tjko@iki.fi>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests for SCPIWorker (I/O worker thread) against a simulated TCP instrument.
+"""
+
+import threading
+
+import pytest
+
+from scpi_lite import SCPIDevice
+from scpi_lite.bench.instruments import TCPInstrument
+
+
+@pytest.fixture
+def device():
+    inst = TCPInstrument(responses={'MEAS:VOLT?': '4.99', 'MEAS:CURR?': '0.1'})
+    inst.start()
+    dev = SCPIDevice(inst.device, transport='tcp', timeout=2)
+    w = dev.enable_worker()
+    yield dev, w, inst
+    dev.close()
+    inst.stop()
+
+
+def hold(w):
+    """
+    Keep worker busy until returned event is set, so that following
+    requests are queued back-to-back.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def _wait():
+        started.set()
+        release.wait(5)
+
+    w.submit(_wait)
+    assert started.wait(5)
+    return release
+
+
+def test_coalesced_queries(device):
+    dev, w, inst = device
+    release = hold(w)
+    f1 = w.query('MEAS:VOLT?')
+    f2 = w.query('MEAS:CURR?')
+    release.set()
+    assert f1.result(5) == '4.99'
+    assert f2.result(5) == '0.1'
+
+
+def test_coalesced_query_error_semantics(device):
+    # coalesced query with an error returns the response like query()
+    dev, w, inst = device
+
+    def _warn(cmd):
+        inst.errors.append('-222,"Data out of range"')
+        return '9.9E37'
+
+    inst.responses['MEAS:RES?'] = _warn
+    assert dev.query('MEAS:RES?') == '9.9E37'
+    assert dev.last_error.startswith('-222,')
+
+    release = hold(w)
+    f1 = w.query('MEAS:RES?')
+    f2 = w.query('MEAS:VOLT?')
+    release.set()
+    assert f1.result(5) == '9.9E37'
+    assert f2.result(5) == '4.99'
+    assert dev.last_error.startswith('0,')
+
+    # query without a response still fails
+    release = hold(w)
+    f1 = w.query('BOGUS?')
+    f2 = w.query('MEAS:VOLT?')
+    release.set()
+    with pytest.raises(Exception, match='Query failed: BOGUS'):
+        f1.result(5)
+    assert f2.result(5) == '4.99'
+
+
+@pytest.mark.parametrize('call', ['read_stb', 'clear', 'write', 'read', 'done'])
+def test_io_dispatched_to_worker(device, call):
+    dev, w, inst = device
+    op = dev.start_operation('INIT')
+    funcs = {
+        'read_stb': dev.read_stb,
+        'clear': dev.clear,
+        'write': lambda: dev.write('*SRE 32'),
+        'read': lambda: (dev.write('*IDN?'), dev.read())[1],
+        'done': op.done,
+    }
+    release = hold(w)
+    res = []
+    t = threading.Thread(target=lambda: res.append(funcs[call]()))
+    t.start()
+    t.join(0.2)
+    # I/O from other threads waits for the worker
+    assert t.is_alive()
+    release.set()
+    t.join(5)
+    assert len(res) == 1
+    op.wait(5)
+    assert dev.query('MEAS:VOLT?') == '4.99'
+
+
+def test_concurrent_status_polling(device):
+    dev, w, inst = device
+    inst.responses['INIT'] = lambda cmd: inst._start_operation(0.3)
+    op = dev.start_operation('INIT')
+    stop = threading.Event()
+    errors = []
+
+    def _query():
+        while not stop.is_set():
+            try:
+                assert dev.query('MEAS:VOLT?') == '4.99'
+            except Exception as err:
+                errors.append(err)
+                return
+
+    threads = [threading.Thread(target=_query) for i in range(2)]
+    for t in threads:
+        t.start()
+    try:
+        while not op.done():
+            assert dev.read_stb() & ~0x60 == 0
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(5)
+    assert not errors
+    assert op.error.startswith('0,')